@@ -1,53 +1,109 @@
-<!-- templates/login.html -->
-<!-- Purpose: Allows users to log in by entering their name. Used by the /login route. -->
+<!-- templates/base.html -->
+<!-- Purpose: Shared page layout. Every page extends it and fills in the title and content blocks. -->
 <!DOCTYPE html>
 <html>
 <head>
-  <title>Login</title>
+  <title>{% block title %}{% endblock %}</title>
 </head>
 <body>
+  {% block content %}{% endblock %}
+</body>
+</html>
+
+<!-- templates/error.html -->
+<!-- Purpose: Shared error message, included by pages whose route passes an error. -->
+{% if error %}
+  <p style="color: red;">{{ error }}</p>
+{% endif %}
+
+<!-- templates/pager.html -->
+<!-- Purpose: Shared Previous/Next links for keyset-paginated pages; keeps the current filters. -->
+{% if page %}
+  {% if page.prev_cursor %}<a href="{{ page_url(before=page.prev_cursor) }}">Previous</a>{% endif %}
+  {% if page.next_cursor %}<a href="{{ page_url(after=page.next_cursor) }}">Next</a>{% endif %}
+  <br>
+{% endif %}
+
+<!-- templates/member_typeahead.html -->
+<!-- Purpose: Shared typeahead for the admin pages. Suggests members from /members/search.json under the input with id "member-search"; picking one also selects it in the page's staff_id field, if there is one. -->
+<datalist id="member-matches"></datalist>
+<script>
+  (function () {
+    var input = document.getElementById('member-search');
+    var list = document.getElementById('member-matches');
+    var staff = document.querySelector('[name="staff_id"]');
+    var matches = {};
+    var pending = 0;
+    input.setAttribute('list', 'member-matches');
+    input.setAttribute('autocomplete', 'off');
+    input.addEventListener('input', function () {
+      var member = matches[input.value];
+      if (member && staff) {
+        if (!staff.querySelector('option[value="' + member.id + '"]')) {
+          staff.add(new Option(member.name, member.id));
+        }
+        staff.value = member.id;
+        return;
+      }
+      var request = ++pending;
+      var url = '/members/search.json?q=' + encodeURIComponent(input.value) +
+                (input.dataset.membersOnly ? '&members_only=1' : '');
+      fetch(url).then(function (response) { return response.json(); }).then(function (data) {
+        if (request !== pending) { return; }  // a later keystroke's answer wins
+        matches = {};
+        list.innerHTML = '';
+        data.members.forEach(function (member) {
+          matches[member.name] = member;
+          list.appendChild(new Option([member.name, member.ecn_staff_no, member.ippis_no].filter(Boolean).join(' / '),
+                                      member.name));
+        });
+      });
+    });
+  })();
+</script>
+
+<!-- templates/login.html -->
+<!-- Purpose: Allows users to log in by entering their name. Used by the /login route. -->
+{% extends "base.html" %}
+{% block title %}Login{% endblock %}
+{% block content %}
   <h2>Login</h2>
-  {% if error %}
-    <p style="color: red;">{{ error }}</p>
-  {% endif %}
+  {% include "error.html" %}
   <form method="POST">
     <input type="text" name="name" placeholder="Enter your name" required><br><br>
     <button type="submit">Login</button>
   </form>
   <p>Don't have an account? <a href="/register">Register here</a></p>
-</body>
-</html>
+{% endblock %}
 
 <!-- templates/register.html -->
 <!-- Purpose: Allows users to register by entering their name and selecting if they are an admin. Used by the /register route. -->
-<!DOCTYPE html>
-<html>
-<head>
-  <title>Register</title>
-</head>
-<body>
+{% extends "base.html" %}
+{% block title %}Register{% endblock %}
+{% block content %}
   <h2>Register</h2>
-  {% if error %}
-    <p style="color: red;">{{ error }}</p>
-  {% endif %}
+  {% include "error.html" %}
   <form method="POST">
     <input type="text" name="name" placeholder="Enter your name" required><br><br>
     <label><input type="checkbox" name="is_admin"> Is Admin?</label><br><br>
     <button type="submit">Register</button>
   </form>
   <p>Already registered? <a href="/login">Login here</a></p>
-</body>
-</html>
+{% endblock %}
 
 <!-- templates/dashboard.html -->
-<!-- Purpose: Displays the user's dashboard with links to savings, loan, and repayments. Admins see an additional link to the admin dashboard. Used by the /dashboard route. -->
-<!DOCTYPE html>
-<html>
-<head>
-  <title>Dashboard</title>
-</head>
-<body>
+<!-- Purpose: Displays the user's dashboard with their savings, outstanding balance and next repayment, and links to savings, loan, and repayments. Admins see an additional link to the admin dashboard. Used by the /dashboard route. -->
+{% extends "base.html" %}
+{% block title %}Dashboard{% endblock %}
+{% block content %}
   <h2>Welcome, {{ name }}!</h2>
+  {% if summary %}
+    <p>Total Savings: ₦{{ summary.savings_total }}</p>
+    <p>Outstanding Loan Balance: ₦{{ summary.outstanding }}</p>
+    {% if summary.next_repayment %}
+      <p>Next Repayment: ₦{{ summary.next_repayment[1] }} due {{ summary.next_repayment[0] }}</p>
+    {% endif %}
+  {% endif %}
   <a href="/savings">View Savings</a><br>
   <a href="/loan">Apply for Loan</a><br>
   <a href="/repayments">View Repayments</a><br>
@@ -55,54 +111,51 @@
     <a href="/admin">Admin Dashboard</a><br>
   {% endif %}
   <a href="/logout">Logout</a>
-</body>
-</html>
+{% endblock %}
 
 <!-- templates/savings.html -->
-<!-- Purpose: Displays the user's savings history and total savings. Used by the /savings route. -->
-<!DOCTYPE html>
-<html>
-<head>
-  <title>Savings</title>
-</head>
-<body>
+<!-- Purpose: Displays the user's savings history per day with a running balance and total savings. Used by the /savings route. -->
+{% extends "base.html" %}
+{% block title %}Savings{% endblock %}
+{% block content %}
   <h2>Savings History</h2>
   <p>Total Savings: ₦{{ total }}</p>
+  <form method="GET">
+    <label>From <input type="date" name="start" value="{{ start }}"></label>
+    <label>To <input type="date" name="end" value="{{ end }}"></label>
+    <button type="submit">Filter</button>
+  </form>
   {% if not savings %}
     <p>No savings recorded.</p>
   {% else %}
     <table border="1">
-      <tr><th>Amount</th><th>Date</th></tr>
-      {% for amount, date in savings %}
-        <tr><td>₦{{ amount }}</td><td>{{ date }}</td></tr>
+      <tr><th>Amount</th><th>Date</th><th>Balance</th></tr>
+      {% for amount, date, balance in savings %}
+        <tr><td>₦{{ amount }}</td><td>{{ date }}</td><td>₦{{ balance }}</td></tr>
       {% endfor %}
     </table>
   {% endif %}
+  {% include "pager.html" %}
   <a href="/dashboard">Back</a>
-</body>
-</html>
+{% endblock %}
 
 <!-- templates/loan.html -->
 <!-- Purpose: Allows users to apply for a loan by filling out a detailed form and displays their pending loan applications. Used by the /loan route. -->
-<!DOCTYPE html>
-<html>
-<head>
-  <title>Loan</title>
-</head>
-<body>
+{% extends "base.html" %}
+{% block title %}Loan{% endblock %}
+{% block content %}
   <h2>Loan History</h2>
   <table border="1">
-    <tr><th>Type of Loan</th><th>Amount</th><th>Duration</th><th>Date</th><th>Status</th></tr>
+    <tr><th>Type of Loan</th><th>Amount</th><th>Duration</th><th>Date</th><th>Status</th><th>Eligibility</th></tr>
     {% for app in applications %}
       <tr>
         <td>{{ app[2] }}</td><td>₦{{ app[3] }}</td><td>{{ app[4] }} months</td><td>{{ app[20] }}</td><td>{{ app[21] }}</td>
+        <td>{{ app[23] or '' }}</td>
       </tr>
     {% endfor %}
   </table>
   <h3>Apply for a Loan</h3>
-  {% if error %}
-    <p style="color: red;">{{ error }}</p>
-  {% endif %}
+  {% include "error.html" %}
   <form method="POST">
     <input type="text" name="type_of_loan" placeholder="Type of Loan" required><br>
     <input type="number" name="amount" placeholder="Loan Amount" step="0.01" required><br>
@@ -129,21 +182,27 @@
     <button type="submit">Submit</button>
   </form>
   <a href="/dashboard">Back</a>
-</body>
-</html>
+{% endblock %}
 
 <!-- templates/repayments.html -->
-<!-- Purpose: Displays the user's repayment schedule with options to mark repayments as paid. Used by the /repayments route. -->
-<!DOCTYPE html>
-<html>
-<head>
-  <title>Repayments</title>
-</head>
-<body>
+<!-- Purpose: Displays the user's repayment schedule (optionally including archived settled loans) with options to mark repayments as paid. Used by the /repayments route. -->
+{% extends "base.html" %}
+{% block title %}Repayments{% endblock %}
+{% block content %}
   <h2>Repayment Schedule</h2>
   {% if error %}
     <p>{{ error }}</p>
+    <a href="/repayments?history=1">Include settled loans</a><br>
   {% else %}
+    <form method="GET">
+      <select name="status">
+        <option value="" {{ 'selected' if not status }}>All</option>
+        <option value="unpaid" {{ 'selected' if status == 'unpaid' }}>Unpaid</option>
+        <option value="paid" {{ 'selected' if status == 'paid' }}>Paid</option>
+      </select>
+      <label><input type="checkbox" name="history" value="1" {{ 'checked' if history }}> Include settled loans</label>
+      <button type="submit">Filter</button>
+    </form>
     <table border="1">
       <tr><th>Due Date</th><th>Amount</th><th>Status</th><th>Action</th></tr>
       {% for repayment_id, due, amount, status in repayments %}
@@ -160,38 +219,40 @@
       {% endfor %}
     </table>
   {% endif %}
+  {% include "pager.html" %}
   <a href="/dashboard">Back</a>
-</body>
-</html>
+{% endblock %}
 
 <!-- templates/admin.html -->
 <!-- Purpose: Displays the admin dashboard with links to manage savings, users, and loan approvals. Used by the /admin route. -->
-<!DOCTYPE html>
-<html>
-<head>
-  <title>Admin Dashboard</title>
-</head>
-<body>
+{% extends "base.html" %}
+{% block title %}Admin Dashboard{% endblock %}
+{% block content %}
   <h2>Admin Dashboard</h2>
   <a href="/add_savings">Add Savings</a><br>
+  <a href="/bulk_savings">Bulk Payroll Upload</a><br>
+  <a href="/reconcile">IPPIS Repayment Reconciliation</a><br>
   <a href="/users">View Users</a><br>
   <a href="/approve_loans">Approve Loans</a><br>
+  <a href="/export/loans.csv">Export Loans (CSV)</a><br>
+  <a href="/export/repayments.csv">Export Repayments (CSV)</a><br>
+  <a href="/analytics">Portfolio Analytics</a><br>
   <a href="/dashboard">Back</a>
-</body>
-</html>
+{% endblock %}
 
 <!-- templates/add_savings.html -->
 <!-- Purpose: Allows admins to add savings for users by selecting a staff member and entering an amount. Used by the /add_savings route. -->
-<!DOCTYPE html>
-<html>
-<head>
-  <title>Add Savings</title>
-</head>
-<body>
+{% extends "base.html" %}
+{% block title %}Add Savings{% endblock %}
+{% block content %}
   <h2>Add Savings</h2>
-  {% if error %}
-    <p style="color: red;">{{ error }}</p>
-  {% endif %}
+  {% include "error.html" %}
+  <form method="GET">
+    <input type="text" name="q" value="{{ q }}" id="member-search" data-members-only="1"
+           placeholder="Member name starts with">
+    <button type="submit">Find</button>
+  </form>
+  {% include "member_typeahead.html" %}
   <form method="POST">
     <select name="staff_id" required>
       {% for user in users %}
@@ -201,59 +262,212 @@
     <input type="number" name="amount" placeholder="Amount" required>
     <button type="submit">Add</button>
   </form>
+  {% include "pager.html" %}
   <a href="/admin">Back</a>
-</body>
-</html>
+{% endblock %}
+
+<!-- templates/bulk_savings.html -->
+<!-- Purpose: Allows admins to upload a payroll deduction CSV (staff_id,amount[,date]) and shows the posting summary with rejected lines. Used by the /bulk_savings route. -->
+{% extends "base.html" %}
+{% block title %}Bulk Payroll Upload{% endblock %}
+{% block content %}
+  <h2>Bulk Payroll Upload</h2>
+  {% include "error.html" %}
+  {% if summary %}
+    <p>Posted {{ summary.posted }} row(s) totalling ₦{{ summary.total_amount }}.</p>
+    {% if summary.rejected %}
+      <table border="1">
+        <tr><th>Line</th><th>Reason</th></tr>
+        {% for line_num, reason in summary.rejected %}
+          <tr><td>{{ line_num }}</td><td>{{ reason }}</td></tr>
+        {% endfor %}
+      </table>
+    {% endif %}
+  {% endif %}
+  <form method="POST" enctype="multipart/form-data">
+    <input type="file" name="file" accept=".csv" required>
+    <button type="submit">Upload</button>
+  </form>
+  <a href="/admin">Back</a>
+{% endblock %}
+
+<!-- templates/reconcile.html -->
+<!-- Purpose: Allows admins to upload a monthly IPPIS deduction file (ippis_no/ecn_staff_no,amount), marks the installments it covers as paid and lists unmatched, partial and over-payments. Used by the /reconcile route. -->
+{% extends "base.html" %}
+{% block title %}IPPIS Reconciliation{% endblock %}
+{% block content %}
+  <h2>IPPIS Repayment Reconciliation</h2>
+  {% include "error.html" %}
+  {% if report %}
+    <p>{{ 'Would mark' if report.dry_run else 'Marked' }} {{ report.installments_paid }} installment(s) paid for
+       {{ report.members }} member(s), ₦{{ report.amount_applied }} applied ({{ report.month }}).</p>
+    {% if report.unmatched %}
+      <h3>Unmatched</h3>
+      <table border="1">
+        <tr><th>Line</th><th>Number</th><th>Amount</th></tr>
+        {% for line_num, key, amount in report.unmatched %}
+          <tr><td>{{ line_num }}</td><td>{{ key }}</td><td>{{ amount }}</td></tr>
+        {% endfor %}
+      </table>
+    {% endif %}
+    {% if report.partial or report.overpaid %}
+      <h3>Partial and Over-payments</h3>
+      <table border="1">
+        <tr><th>Member ID</th><th>Deducted</th><th>Applied</th><th>Unapplied</th><th>Kind</th></tr>
+        {% for user_id, amount, applied, remainder in report.partial %}
+          <tr><td>{{ user_id }}</td><td>{{ amount }}</td><td>{{ applied }}</td><td>{{ remainder }}</td><td>Partial</td></tr>
+        {% endfor %}
+        {% for user_id, amount, applied, remainder in report.overpaid %}
+          <tr><td>{{ user_id }}</td><td>{{ amount }}</td><td>{{ applied }}</td><td>{{ remainder }}</td><td>Over-payment</td></tr>
+        {% endfor %}
+      </table>
+    {% endif %}
+    {% if report.rejected %}
+      <h3>Rejected</h3>
+      <table border="1">
+        <tr><th>Line</th><th>Reason</th></tr>
+        {% for line_num, reason in report.rejected %}
+          <tr><td>{{ line_num }}</td><td>{{ reason }}</td></tr>
+        {% endfor %}
+      </table>
+    {% endif %}
+  {% endif %}
+  <form method="POST" enctype="multipart/form-data">
+    <input type="file" name="file" accept=".csv" required>
+    <input type="month" name="month">
+    <label><input type="checkbox" name="dry_run" value="1"> Dry run</label>
+    <button type="submit">Reconcile</button>
+  </form>
+  <a href="/admin">Back</a>
+{% endblock %}
+
+<!-- templates/analytics.html -->
+<!-- Purpose: Shows admins the loan book as a whole: totals, PAR aging buckets and per-type breakdowns and percentiles. Used by the /analytics route. -->
+{% extends "base.html" %}
+{% block title %}Portfolio Analytics{% endblock %}
+{% block content %}
+  <h2>Portfolio Analytics</h2>
+  <form method="GET">
+    <label>As of <input type="date" name="as_of" value="{{ summary.as_of }}"></label>
+    <button type="submit">Show</button>
+    <a href="/analytics.json?as_of={{ summary.as_of }}">JSON</a>
+  </form>
+  <table border="1">
+    <tr><th>Type of Loan</th><th>Loans</th><th>Disbursed</th><th>Interest Charged</th><th>Repaid</th>
+        <th>Outstanding</th><th>Outstanding Principal</th><th>Interest Earned</th></tr>
+    {% for name, figures in summary.by_type.items() %}
+      <tr><td>{{ name or '-' }}</td><td>{{ figures.loans }}</td><td>{{ figures.disbursed }}</td>
+          <td>{{ figures.interest_charged }}</td><td>{{ figures.repaid }}</td><td>{{ figures.outstanding }}</td>
+          <td>{{ figures.outstanding_principal }}</td><td>{{ figures.interest_earned }}</td></tr>
+    {% endfor %}
+    <tr><th>Total</th><th>{{ summary.totals.loans }}</th><th>{{ summary.totals.disbursed }}</th>
+        <th>{{ summary.totals.interest_charged }}</th><th>{{ summary.totals.repaid }}</th>
+        <th>{{ summary.totals.outstanding }}</th><th>{{ summary.totals.outstanding_principal }}</th>
+        <th>{{ summary.totals.interest_earned }}</th></tr>
+  </table>
+  <h3>Portfolio at Risk (PAR30 {{ '%.2f' % (summary.par30_ratio * 100) }}%)</h3>
+  <table border="1">
+    <tr><th>Days Past Due</th><th>Loans</th><th>Outstanding</th></tr>
+    {% for name, bucket in summary.par.items() %}
+      <tr><td>{{ name.replace('_', ' ') }}</td><td>{{ bucket.loans }}</td><td>{{ bucket.outstanding }}</td></tr>
+    {% endfor %}
+  </table>
+  <h3>Loan Size Percentiles</h3>
+  <table border="1">
+    <tr><th>Type of Loan</th><th>Loans</th>
+        {% for p in percentiles %}<th>Amount p{{ p }}</th>{% endfor %}
+        {% for p in percentiles %}<th>Outstanding p{{ p }}</th>{% endfor %}</tr>
+    {% for name, slice in distribution.by_type.items() %}
+      <tr><td>{{ name or '-' }}</td><td>{{ slice.loans }}</td>
+          {% for p in percentiles %}<td>{{ slice.amount[p] }}</td>{% endfor %}
+          {% for p in percentiles %}<td>{{ slice.outstanding[p] }}</td>{% endfor %}</tr>
+    {% endfor %}
+  </table>
+  <a href="/admin">Back</a>
+{% endblock %}
 
 <!-- templates/users.html -->
 <!-- Purpose: Displays a list of all users in the system for admins to view. Used by the /users route. -->
-<!DOCTYPE html>
-<html>
-<head>
-  <title>Users</title>
-</head>
-<body>
+{% extends "base.html" %}
+{% block title %}Users{% endblock %}
+{% block content %}
   <h2>Users</h2>
+  <form method="GET">
+    <input type="text" name="q" value="{{ q }}" id="member-search" placeholder="Name starts with">
+    <button type="submit">Filter</button>
+  </form>
+  {% include "member_typeahead.html" %}
   <table border="1">
     <tr><th>ID</th><th>Name</th></tr>
     {% for user in users %}
       <tr><td>{{ user[0] }}</td><td>{{ user[1] }}</td></tr>
     {% endfor %}
   </table>
+  {% include "pager.html" %}
   <a href="/admin">Back</a>
-</body>
-</html>
+{% endblock %}
 
 <!-- templates/approve_loans.html -->
-<!-- Purpose: Displays a list of pending loan applications for admins to approve or edit approval details. Used by the /approve_loans route. -->
-<!DOCTYPE html>
-<html>
-<head>
-  <title>Approve Loans</title>
-</head>
-<body>
+<!-- Purpose: Displays a list of pending loan applications for admins to approve (one at a time or in bulk) or edit approval details. Used by the /approve_loans route. -->
+{% extends "base.html" %}
+{% block title %}Approve Loans{% endblock %}
+{% block content %}
   <h2>Loan Requests</h2>
-  <table border="1">
-    <tr><th>Loan ID</th><th>Staff Name</th><th>Amount</th><th>Action</th></tr>
-    {% for app in applications %}
-      <tr>
-        <td>{{ app[0] }}</td><td>{{ app[3] }}</td><td>₦{{ app[2] }}</td>
-        <td><a href="/approve/{{ app[0] }}">Approve</a> | <a href="/loan_approval_details/{{ app[0] }}">Edit Details</a></td>
-      </tr>
-    {% endfor %}
-  </table>
+  <form method="GET">
+    <input type="text" name="q" value="{{ q }}" id="member-search" data-members-only="1"
+           placeholder="Staff name starts with">
+    <button type="submit">Filter</button>
+  </form>
+  {% include "member_typeahead.html" %}
+  <form method="POST" action="/approve_loans/bulk">
+    <table border="1">
+      <tr><th></th><th>Loan ID</th><th>Staff Name</th><th>Amount</th><th>Eligibility</th><th>Action</th></tr>
+      {% for app in applications %}
+        <tr>
+          <td><input type="checkbox" name="application_id" value="{{ app[0] }}"></td>
+          <td>{{ app[0] }}</td><td>{{ app[3] }}</td><td>₦{{ app[2] }}</td>
+          <td title="{{ app[5] or '' }}">{{ app[4] or 'not scored' }}</td>
+          <td><a href="/approve/{{ app[0] }}">Approve</a> | <a href="/loan_approval_details/{{ app[0] }}">Edit Details</a></td>
+        </tr>
+      {% endfor %}
+    </table>
+    <button type="submit">Approve Selected</button>
+  </form>
+  <h3>Approve All Pending</h3>
+  <form method="POST" action="/approve_loans/bulk">
+    <input type="hidden" name="scope" value="filter">
+    <input type="text" name="type_of_loan" placeholder="Type of Loan (optional)">
+    <input type="number" name="max_amount" placeholder="Max Amount (optional)" step="0.01">
+    <button type="submit">Approve All Matching</button>
+  </form>
+  <form method="POST" action="/approve_loans/rescore">
+    <button type="submit">Re-score All Pending</button>
+  </form>
+  {% include "pager.html" %}
   <a href="/admin">Back</a>
-</body>
-</html>
+{% endblock %}
+
+<!-- templates/bulk_approval.html -->
+<!-- Purpose: Shows the result of a bulk loan approval (applications approved, installments generated, time taken). Used by the /approve_loans/bulk route. -->
+{% extends "base.html" %}
+{% block title %}Bulk Approval{% endblock %}
+{% block content %}
+  <h2>Bulk Approval</h2>
+  {% include "error.html" %}
+  {% if summary %}
+    <p>Approved {{ summary.approved }} application(s) with {{ summary.schedule_rows }} installment(s) in {{ summary.seconds }}s.</p>
+    {% if summary.skipped %}
+      <p>Skipped {{ summary.skipped }} application(s) that were no longer pending.</p>
+    {% endif %}
+  {% endif %}
+  <a href="/approve_loans">Back</a>
+{% endblock %}
 
 <!-- templates/loan_approval_details.html -->
 <!-- Purpose: Allows admins to edit the "For Official Use Only" section of a loan (amount approved, interest, total amount). Used by the /loan_approval_details route. -->
-<!DOCTYPE html>
-<html>
-<head>
-  <title>Loan Approval Details</title>
-</head>
-<body>
+{% extends "base.html" %}
+{% block title %}Loan Approval Details{% endblock %}
+{% block content %}
   <h2>Loan Approval Details</h2>
   {% if loan %}
     <form method="POST">
@@ -268,5 +482,4 @@
     <p>No loan details found.</p>
   {% endif %}
   <a href="/approve_loans">Back</a>
-</body>
-</html>
+{% endblock %}
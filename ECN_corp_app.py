@@ -1,119 +1,360 @@
-from flask import Flask, render_template, request, redirect, session, g
+from flask import Blueprint, Flask, current_app, render_template, request, redirect, session, g, jsonify, Response, \
+    stream_with_context
 import sqlite3
 from datetime import datetime, timedelta
 from functools import wraps
+import io
+import logging
 import os
+import click
+from urllib.parse import urlencode
+from connections import ConnectionManager, open_connection
+from migrations import MIGRATIONS, migrate_database, current_version, pending_migrations
+from schedule import build_schedule, sync_schedule
+from payroll import post_savings_csv
+from rollup import rebuild_savings_rollup, savings_balance, savings_balance_before
+from pagination import paginate, page_args, prefix_end
+from approvals import approve_applications
+from member_cache import LRUCache, load_member_summary
+from exports import EXPORTS, export_ledger
+from instrumentation import Instrumentation
+from template_loader import init_templates
+from arrears import ArrearsScheduler, run_arrears
+from reconcile import reconcile_deductions
+from guarantors import GuarantorError, add_guarantors, check_guarantors
+from eligibility import DEFAULT_RULES, score_applications
+from versions import book_version, member_etag, member_version
+from archive import archive_settled_loans, attach_archive, default_archive_path
+from analytics import PERCENTILES, portfolio_summary, portfolio_distribution
+from write_queue import WriteQueue
+from member_search import DEFAULT_LIMIT, search_members
+from statements import DEFAULT_PARTITION_SIZE, generate_statements
+from journal import balance_as_of, checkpoint_before, take_snapshot
 
-# Initialize the Flask application
-app = Flask(__name__)
-app.secret_key = 'your_secret_key'
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATABASE = os.path.join(BASE_DIR, 'ecn_coop.db')
 
-# Initialize the database with required tables
+# Settings every app starts from; each can be overridden by an ECN_-prefixed
+# environment variable (ECN_DATABASE, ECN_SECRET_KEY, ECN_SLOW_REQUEST_MS=250,
+# values parsed as JSON where possible) or by the mapping passed to create_app()
+DEFAULT_CONFIG = {
+    'DATABASE': os.path.join(BASE_DIR, 'ecn_coop.db'),
+    # Signs session cookies; must be set, and the same, for every worker
+    'SECRET_KEY': None,
+    # Apply pending migrations when the app is created (once, in the master,
+    # with a preloading server)
+    'MIGRATE_ON_START': False,
+    # Requests slower than this are logged to ecn.slow_requests (None disables)
+    'SLOW_REQUEST_MS': None,
+    'METRICS_TOP_N': 20,
+    # Compiled template bytecode directory (None: a per-user temp directory)
+    'TEMPLATE_CACHE_DIR': None,
+    # Daily time ("HH:MM") for the in-process arrears job (None: run it from
+    # cron with `flask run-arrears`)
+    'ARREARS_RUN_AT': None,
+    # Worker processes for IPPIS reconciliation (None: one per CPU)
+    'RECONCILE_WORKERS': None,
+    # Loan eligibility rules (see eligibility.DEFAULT_RULES)
+    'ELIGIBILITY_RULES': dict(DEFAULT_RULES),
+    # SQLite file holding archived settled loans (None: <database>_archive.db)
+    'ARCHIVE_DATABASE': None,
+    # Send write routes through one writer thread per process that group
+    # commits them (see write_queue.WriteQueue); off: each request commits
+    'WRITE_QUEUE': False,
+    'WRITE_QUEUE_MAX_BATCH': 256,
+    'WRITE_QUEUE_MAX_WAIT_MS': 1.0,
+    # Where month-end statements are written (<dir>/<YYYY-MM>/...)
+    'STATEMENTS_DIR': os.path.join(BASE_DIR, 'statements'),
+}
+
+# Routes, CLI commands and template helpers; registered on the app by
+# create_app()
+bp = Blueprint('ecn', __name__, cli_group=None)
+
+# Per-route timing and per-statement SQL profiling, served at /metrics
+metrics = Instrumentation()
+
+# Build the application. Nothing here opens the database unless
+# MIGRATE_ON_START is set: connections are opened per thread on first use and
+# never carried across fork, so the app can be created once in a preloading
+# master and shared by its workers.
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config.from_mapping(DEFAULT_CONFIG)
+    app.config.from_prefixed_env('ECN')
+    if config:
+        app.config.update(config)
+    if not app.config['SECRET_KEY']:
+        logging.getLogger(__name__).warning(
+            'ECN_SECRET_KEY is not set; using a random key, so sessions will not survive a restart '
+            'or be shared between workers')
+        app.config['SECRET_KEY'] = os.urandom(32)
+    # Tuned SQLite connections (WAL, busy timeout, statement cache), one per thread
+    app.extensions['connections'] = ConnectionManager(app.config['DATABASE'])
+    if app.config['WRITE_QUEUE']:
+        app.extensions['write_queue'] = WriteQueue(app.config['DATABASE'], app.config['WRITE_QUEUE_MAX_BATCH'],
+                                                   app.config['WRITE_QUEUE_MAX_WAIT_MS'])
+    app.teardown_appcontext(close_db)
+    app.register_blueprint(bp)
+    metrics.init_app(app)
+    # Page templates are served from App_html.py and precompiled here
+    init_templates(app, app.config['TEMPLATE_CACHE_DIR'])
+    if app.config['MIGRATE_ON_START']:
+        with app.app_context():
+            init_db()
+    return app
+
+# The current app's database file
+def database_path():
+    return current_app.config['DATABASE']
+
+# Apply pending schema migrations (run via `flask --app ECN_corp_app migrate`)
 def init_db():
-    print(f"Initializing database at {DATABASE}")
-    with sqlite3.connect(DATABASE) as db:
-        # Drop existing tables to ensure a clean slate (optional, for testing)
-        db.execute('DROP TABLE IF EXISTS users')
-        db.execute('DROP TABLE IF EXISTS savings')
-        db.execute('DROP TABLE IF EXISTS loans')
-        db.execute('DROP TABLE IF EXISTS loan_applications')
-        db.execute('DROP TABLE IF EXISTS repayments')
-        # Create tables
-        db.execute('''CREATE TABLE users (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        name TEXT NOT NULL,
-                        is_admin INTEGER NOT NULL DEFAULT 0
-                    )''')
-        print("Created users table")
-        db.execute('''CREATE TABLE savings (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER,
-                        amount REAL,
-                        date TEXT,
-                        FOREIGN KEY (user_id) REFERENCES users(id)
-                    )''')
-        print("Created savings table")
-        db.execute('''CREATE TABLE loan_applications (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER,
-                        type_of_loan TEXT,
-                        amount REAL,
-                        duration INTEGER,
-                        ecn_staff_no TEXT,
-                        ippis_no TEXT,
-                        designation TEXT,
-                        phone_no TEXT,
-                        bank_name TEXT,
-                        account_no TEXT,
-                        previous_month_salary REAL,
-                        guarantor1_name TEXT,
-                        guarantor1_staff_no TEXT,
-                        guarantor1_designation TEXT,
-                        guarantor1_phone_no TEXT,
-                        guarantor2_name TEXT,
-                        guarantor2_staff_no TEXT,
-                        guarantor2_designation TEXT,
-                        guarantor2_phone_no TEXT,
-                        date TEXT,
-                        status TEXT DEFAULT 'pending',
-                        FOREIGN KEY (user_id) REFERENCES users(id)
-                    )''')
-        print("Created loan_applications table")
-        db.execute('''CREATE TABLE loans (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER,
-                        type_of_loan TEXT,
-                        amount REAL,
-                        duration INTEGER,
-                        ecn_staff_no TEXT,
-                        ippis_no TEXT,
-                        designation TEXT,
-                        phone_no TEXT,
-                        bank_name TEXT,
-                        account_no TEXT,
-                        previous_month_salary REAL,
-                        monthly_repayment REAL,
-                        date TEXT,
-                        status TEXT,
-                        amount_approved REAL,
-                        interest_charged REAL,
-                        total_amount REAL,
-                        FOREIGN KEY (user_id) REFERENCES users(id)
-                    )''')
-        print("Created loans table")
-        db.execute('''CREATE TABLE repayments (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        loan_id INTEGER,
-                        due_date TEXT,
-                        amount REAL,
-                        status INTEGER DEFAULT 0,  -- 0 for unpaid, 1 for paid
-                        FOREIGN KEY (loan_id) REFERENCES loans(id)
-                    )''')
-        print("Created repayments table")
-        # Insert sample data for testing
-        db.execute('INSERT INTO users (name, is_admin) VALUES (?, ?)', ('TestUser', 0))
-        db.execute('INSERT INTO users (name, is_admin) VALUES (?, ?)', ('AdminUser', 1))
-        db.commit()
-        print("Database initialization completed")
+    print(f"Migrating database at {database_path()}")
+    applied = migrate_database(database_path())
+    print(f"Applied {len(applied)} migration(s), schema at version {MIGRATIONS[-1][0]}")
 
 # Connect to SQLite database
 def get_db():
     if 'db' not in g:
-        g.db = sqlite3.connect(DATABASE)
+        g.db = current_app.extensions['connections'].get()
+        metrics.attach(g.db)
     return g.db
 
-# Close DB connection after each request
-@app.teardown_appcontext
+# Run job(db, *args) in a write transaction and return its result: through
+# the group-commit writer when WRITE_QUEUE is on, otherwise on the request's
+# connection. Jobs must not commit themselves (`with db:` blocks are fine).
+# Either way the write lock is taken before the job runs, so what a job reads
+# before writing can not change under it.
+def write(job, *args):
+    writer = current_app.extensions.get('write_queue')
+    if writer:
+        return writer.call(job, *args)
+    db = get_db()
+    with db:
+        if not db.in_transaction:
+            db.execute('BEGIN IMMEDIATE')
+        return job(db, *args)
+
+# Hand the DB connection back after each request; it stays open for reuse
 def close_db(error):
     db = g.pop('db', None)
     if db:
-        db.close()
+        current_app.extensions['connections'].release(db)
+
+# CLI: apply pending schema migrations
+@bp.cli.command('migrate', help='Apply pending schema migrations.')
+def migrate_command():
+    init_db()
+
+# CLI: show the current schema version and pending migrations
+@bp.cli.command('schema-version', help='Show the schema version and pending migrations.')
+def schema_version_command():
+    with sqlite3.connect(database_path()) as db:
+        print(f"Schema version: {current_version(db)}")
+        for version, description, _ in pending_migrations(db):
+            print(f"Pending: {version} {description}")
+
+# CLI: EXPLAIN every SQL statement in the app against a seeded database and
+# fail if any of them plans a full table scan
+@bp.cli.command('check-query-plans', help='Fail if any app query plans a full table scan.')
+def check_query_plans_command():
+    import queryplan
+    raise SystemExit(queryplan.main())
+
+# CLI: post a payroll deduction CSV (staff_id,amount[,date]) into savings
+@bp.cli.command('post-savings', help='Post a payroll deduction CSV into savings.')
+@click.argument('csv_file', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', default=1000, show_default=True, help='Rows per transaction.')
+@click.option('--date', 'default_date', default=None, help='Posting date for rows without one (YYYY-MM-DD).')
+def post_savings_command(csv_file, chunk_size, default_date):
+    with open_connection(database_path()) as db, open(csv_file, encoding='utf-8-sig', newline='') as lines:
+        summary = post_savings_csv(db, lines, chunk_size=chunk_size, default_date=default_date)
+    for line_num, reason in summary['rejected']:
+        print(f"Line {line_num}: {reason}")
+    print(f"Posted {summary['posted']} row(s) totalling {summary['total_amount']:.2f}, "
+          f"rejected {len(summary['rejected'])}")
+
+# CLI: recompute the savings rollup tables from the savings ledger
+@bp.cli.command('rebuild-savings-rollup', help='Rebuild daily/monthly savings rollups and balances.')
+def rebuild_savings_rollup_command():
+    db = open_connection(database_path())
+    with db:
+        rebuild_savings_rollup(db)
+    count = db.execute('SELECT COUNT(*) FROM savings_balances').fetchone()[0]
+    db.close()
+    print(f"Rebuilt savings rollups for {count} member(s)")
+
+# CLI: flag overdue installments and snapshot arrears per loan
+@bp.cli.command('run-arrears', help='Flag overdue installments and snapshot arrears per loan.')
+@click.option('--as-of', default=None, help='Snapshot date (YYYY-MM-DD, default today).')
+def run_arrears_command(as_of):
+    db = open_connection(database_path())
+    summary = run_arrears(db, as_of)
+    db.close()
+    print(f"Arrears as of {summary['as_of']}: {summary['flagged_installments']} overdue installment(s), "
+          f"{summary['loans_in_arrears']} loan(s) owing {summary['total_arrears']:.2f} "
+          f"(penalty {summary['total_penalty']:.2f}), in {summary['seconds']:.3f}s")
+
+# CLI: render every member's statement for a month; re-running after an
+# interruption picks up where it stopped
+@bp.cli.command('generate-statements', help='Render month-end member statements.')
+@click.option('--month', default=None, help='Statement month (YYYY-MM, default last month).')
+@click.option('--out', default=None, help='Output directory (default STATEMENTS_DIR).')
+@click.option('--workers', type=int, default=None, help='Worker processes (default one per CPU).')
+@click.option('--partition-size', type=int, default=DEFAULT_PARTITION_SIZE, help='Members per partition.')
+@click.option('--restart', is_flag=True, help='Render every partition again, even finished ones.')
+def generate_statements_command(month, out, workers, partition_size, restart):
+    if month:
+        try:
+            month = datetime.strptime(month, '%Y-%m').strftime('%Y-%m')
+        except ValueError:
+            raise click.BadParameter('expected YYYY-MM', param_hint='--month')
+    else:
+        month = (datetime.now().replace(day=1) - timedelta(days=1)).strftime('%Y-%m')
+    summary = generate_statements(database_path(), month, out or current_app.config['STATEMENTS_DIR'],
+                                  workers=workers, partition_size=partition_size, restart=restart, log=print)
+    print(f"Rendered {summary['statements']} statement(s) for {month} "
+          f"({summary['skipped']} of {summary['partitions']} partition(s) already done) in {summary['seconds']:.1f}s")
+
+# CLI: checkpoint every member's balances from the money journal; run it
+# periodically (e.g. from cron at each month end) so as-of queries only read
+# a short journal tail
+@bp.cli.command('snapshot-balances', help='Checkpoint member balances from the money journal.')
+@click.option('--as-of', default=None, help='Checkpoint date (YYYY-MM-DD, default today).')
+def snapshot_balances_command(as_of):
+    if as_of:
+        try:
+            as_of = datetime.strptime(as_of, '%Y-%m-%d').strftime('%Y-%m-%d')
+        except ValueError:
+            raise click.BadParameter('expected YYYY-MM-DD', param_hint='--as-of')
+    db = open_connection(database_path())
+    summary = take_snapshot(db, as_of)
+    db.close()
+    print(f"Checkpointed {summary['members']} member balance(s) as of {summary['as_of']} "
+          f"(journal entry {summary['journal_id']}) in {summary['seconds']:.3f}s")
+
+# CLI: mark installments paid from a monthly IPPIS deduction file
+@bp.cli.command('reconcile-deductions', help='Reconcile an IPPIS deduction file against repayment schedules.')
+@click.argument('csv_file', type=click.Path(exists=True, dir_okay=False))
+@click.option('--month', default=None, help='Deduction month (YYYY-MM, default this month).')
+@click.option('--workers', type=int, default=None, help='Worker processes (default one per CPU).')
+@click.option('--dry-run', is_flag=True, help='Report matches without marking anything paid.')
+def reconcile_deductions_command(csv_file, month, workers, dry_run):
+    if month:
+        try:
+            month = datetime.strptime(month, '%Y-%m').strftime('%Y-%m')
+        except ValueError:
+            raise click.BadParameter('expected YYYY-MM', param_hint='--month')
+    with open_connection(database_path()) as db, open(csv_file, encoding='utf-8-sig', newline='') as lines:
+        report = reconcile_deductions(db, lines, month=month, workers=workers, dry_run=dry_run)
+    for line_num, reason in report['rejected']:
+        print(f"Line {line_num}: {reason}")
+    for line_num, key, amount in report['unmatched']:
+        print(f"Line {line_num}: no open installments for {key} ({amount:.2f})")
+    for user_id, amount, applied, remainder in report['partial']:
+        print(f"Member {user_id}: partial payment, {amount:.2f} deducted, {remainder:.2f} short of the next installment")
+    for user_id, amount, applied, remainder in report['overpaid']:
+        print(f"Member {user_id}: over-payment of {remainder:.2f} ({amount:.2f} deducted, {applied:.2f} due)")
+    print(f"{'Would mark' if dry_run else 'Marked'} {report['installments_paid']} installment(s) paid for "
+          f"{report['members']} member(s), {report['amount_applied']:.2f} applied, in {report['seconds']:.3f}s")
+
+# Start the daily arrears job on a background thread when ARREARS_RUN_AT is set
+def start_arrears_scheduler(app):
+    if app.config['ARREARS_RUN_AT']:
+        database = app.config['DATABASE']
+        return ArrearsScheduler(lambda: open_connection(database), app.config['ARREARS_RUN_AT']).start()
+
+# URL of the current page with some query args replaced; used by the
+# pagination links so filters survive paging
+@bp.app_template_global()
+def page_url(**changes):
+    args = request.args.to_dict()
+    args.pop('after', None)
+    args.pop('before', None)
+    args.update((name, value) for name, value in changes.items() if value is not None)
+    return request.path + '?' + urlencode(args)
+
+# CLI: approve pending loan applications in one transaction
+@bp.cli.command('approve-loans', help='Approve pending loan applications in bulk.')
+@click.option('--id', 'application_ids', multiple=True, type=int, help='Application id (repeatable).')
+@click.option('--all', 'approve_all', is_flag=True, help='Approve every pending application matching the filters.')
+@click.option('--type', 'type_of_loan', default=None, help='Only this type of loan.')
+@click.option('--max-amount', type=float, default=None, help='Only applications up to this amount.')
+def approve_loans_command(application_ids, approve_all, type_of_loan, max_amount):
+    if not application_ids and not approve_all:
+        raise click.UsageError('Pass --id at least once, or --all')
+    db = open_connection(database_path())
+    summary = approve_applications(db, list(application_ids) or None,
+                                   type_of_loan=type_of_loan, max_amount=max_amount)
+    db.close()
+    print(f"Approved {summary['approved']} application(s), {summary['schedule_rows']} installment(s), "
+          f"skipped {summary['skipped']}, in {summary['seconds']:.3f}s")
+
+# CLI: re-score pending loan applications against the eligibility rules
+@bp.cli.command('score-applications', help='Re-score pending loan applications for eligibility.')
+@click.option('--id', 'application_ids', multiple=True, type=int, help='Application id (default: all pending).')
+def score_applications_command(application_ids):
+    db = open_connection(database_path())
+    summary = score_applications(db, list(application_ids) or None, current_app.config['ELIGIBILITY_RULES'])
+    db.close()
+    print(f"Scored {summary['scored']} application(s), {summary['eligible']} eligible, "
+          f"in {summary['seconds']:.3f}s")
+
+# Archive database for settled loans, attached on demand
+def archive_path():
+    return current_app.config['ARCHIVE_DATABASE'] or default_archive_path(database_path())
 
-# Call init_db when the app context is created
-with app.app_context():
-    init_db()  # Ensure the database is initialized
+# CLI: move fully repaid loans and their installments into the archive
+@bp.cli.command('archive-loans', help='Move settled loans and their installments to the archive database.')
+@click.option('--before', 'settled_before', default=None,
+              help='Only loans whose last installment was due before this date (default 90 days ago).')
+@click.option('--batch-size', default=500, show_default=True, help='Loans per transaction.')
+def archive_loans_command(settled_before, batch_size):
+    db = open_connection(database_path())
+    summary = archive_settled_loans(db, archive_path(), settled_before=settled_before, batch_size=batch_size)
+    db.close()
+    print(f"Archived {summary['loans']} loan(s), {summary['repayments']} installment(s) and "
+          f"{summary['guarantors']} guarantor(s) to {archive_path()} in {summary['seconds']:.3f}s")
+
+# Per-member summaries (name, savings, outstanding balance, next installment)
+# cached in-process; write routes invalidate the members they touch. Each entry
+# carries the member's data version, so a write made by another worker is
+# picked up on the next read instead of after the TTL.
+summaries = LRUCache(max_size=10000, ttl=300)
+
+def member_summary(db, user_id):
+    version = member_version(db, user_id)
+    load = lambda: (version, load_member_summary(db, user_id))
+    cached_version, summary = summaries.get(user_id, load)
+    if cached_version != version:
+        summaries.invalidate(user_id)
+        cached_version, summary = summaries.get(user_id, load)
+    return summary
+
+# Loan book aggregates for the analytics page, keyed on the loan book version
+# (see versions.py): a loan or repayment write from any worker or CLI command
+# makes the next read recompute them
+portfolio = LRUCache(max_size=32, ttl=300)
+
+# Loan or repayment rows changed for these members
+def loans_changed(*user_ids):
+    summaries.invalidate(*user_ids)
+
+# CLI: stream the loans or repayments ledger to a CSV file
+@bp.cli.command('export-ledger', help='Export the loans or repayments ledger as CSV.')
+@click.argument('ledger', type=click.Choice(sorted(EXPORTS)))
+@click.option('--output', '-o', type=click.Path(dir_okay=False), required=True, help='Output file.')
+@click.option('--start', default='', help='First date (YYYY-MM-DD).')
+@click.option('--end', default='', help='Last date (YYYY-MM-DD).')
+@click.option('--status', default='', help='Loan status, or paid/unpaid for repayments.')
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip the output.')
+def export_ledger_command(ledger, output, start, end, status, compress):
+    db = open_connection(database_path())
+    with open(output, 'wb' if compress else 'w', **({} if compress else {'newline': '', 'encoding': 'utf-8'})) as f:
+        for chunk in export_ledger(db, ledger, start, end, status, compress=compress):
+            f.write(chunk)
+    db.close()
+    print(f"Exported {ledger} to {output}")
 
 # Restrict access to logged-in users
 def login_required(f):
@@ -125,7 +366,7 @@ def login_required(f):
     return decorated_function
 
 # Login route
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         name = request.form['name']
@@ -141,7 +382,7 @@ def login():
     return render_template('login.html')
 
 # Register route
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         name = request.form['name']
@@ -152,46 +393,58 @@ def register():
             cursor = db.execute('SELECT id FROM users WHERE name=?', (name,))
             if cursor.fetchone():
                 return render_template('register.html', error='User already exists. Please log in.')
-            db.execute('INSERT INTO users (name, is_admin) VALUES (?, ?)', (name, is_admin))
-            db.commit()
+            write(lambda db: db.execute('INSERT INTO users (name, is_admin) VALUES (?, ?)', (name, is_admin)))
             return redirect('/login')
         except sqlite3.Error as e:
             return render_template('register.html', error=f'Database error: {str(e)}')
     return render_template('register.html')
 
 # Logout route
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     session.pop('user_id', None)
     session.pop('is_admin', None)
     return redirect('/login')
 
 # Dashboard route
-@app.route('/dashboard')
+@bp.route('/dashboard')
 @login_required
 def dashboard():
     db = get_db()
     user_id = session['user_id']
-    cursor = db.execute('SELECT name FROM users WHERE id=?', (user_id,))
-    user = cursor.fetchone()
-    if not user:
+    summary = member_summary(db, user_id)
+    if not summary:
         session.clear()
         return redirect('/login')
-    return render_template('dashboard.html', name=user[0], is_admin=session.get('is_admin'))
+    return render_template('dashboard.html', name=summary['name'], is_admin=session.get('is_admin'),
+                           summary=summary)
+
+# One page of a member's daily savings with the running balance after each
+# day, and their current balance
+def savings_page(db, user_id, args):
+    page = paginate(db, '''SELECT total, day FROM savings_daily
+                           WHERE user_id = ? AND day >= ? AND day <= ? {seek}
+                           ORDER BY {order} LIMIT ?''',
+                    (user_id, args.get('start', ''), args.get('end', '') or '9999-12-31'), ('day',),
+                    lambda row: (row[1],), **page_args(args))
+    # Running balance carried in from the days before this page
+    balance = savings_balance_before(db, user_id, page.rows[0][1]) if page.rows else 0
+    savings = []
+    for amount, date in page.rows:
+        balance += amount
+        savings.append((amount, date, balance))
+    return page, savings, savings_balance(db, user_id)
 
 # Savings route
-@app.route('/savings')
+@bp.route('/savings')
 @login_required
 def savings():
-    db = get_db()
-    user_id = session['user_id']
-    cursor = db.execute('SELECT SUM(amount), date FROM savings WHERE user_id=? GROUP BY date', (user_id,))
-    savings = cursor.fetchall()
-    total = sum(amount for amount, _ in savings) if savings else 0
-    return render_template('savings.html', total=total, savings=savings)
+    page, savings, total = savings_page(get_db(), session['user_id'], request.args)
+    return render_template('savings.html', total=total, savings=savings, page=page,
+                           start=request.args.get('start', ''), end=request.args.get('end', ''))
 
 # Loan route
-@app.route('/loan', methods=['GET', 'POST'])
+@bp.route('/loan', methods=['GET', 'POST'])
 @login_required
 def loan():
     db = get_db()
@@ -211,55 +464,75 @@ def loan():
             bank_name = request.form['bank_name']
             account_no = request.form['account_no']
             previous_month_salary = float(request.form['previous_month_salary'])
-            guarantor1_name = request.form['guarantor1_name']
-            guarantor1_staff_no = request.form['guarantor1_staff_no']
-            guarantor1_designation = request.form['guarantor1_designation']
-            guarantor1_phone_no = request.form['guarantor1_phone_no']
-            guarantor2_name = request.form['guarantor2_name']
-            guarantor2_staff_no = request.form['guarantor2_staff_no']
-            guarantor2_designation = request.form['guarantor2_designation']
-            guarantor2_phone_no = request.form['guarantor2_phone_no']
+            guarantors = [{field: request.form[f'guarantor{position}_{field}'].strip()
+                           for field in ('name', 'staff_no', 'designation', 'phone_no')}
+                          for position in (1, 2)]
             today = datetime.now().strftime('%Y-%m-%d')
-            db.execute('''INSERT INTO loan_applications (
-                            user_id, type_of_loan, amount, duration, ecn_staff_no, ippis_no, designation,
-                            phone_no, bank_name, account_no, previous_month_salary, guarantor1_name,
-                            guarantor1_staff_no, guarantor1_designation, guarantor1_phone_no,
-                            guarantor2_name, guarantor2_staff_no, guarantor2_designation,
-                            guarantor2_phone_no, date, status
-                         ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                       (user_id, type_of_loan, amount, duration, ecn_staff_no, ippis_no, designation,
-                        phone_no, bank_name, account_no, previous_month_salary, guarantor1_name,
-                        guarantor1_staff_no, guarantor1_designation, guarantor1_phone_no,
-                        guarantor2_name, guarantor2_staff_no, guarantor2_designation,
-                        guarantor2_phone_no, today, 'pending'))
-            db.commit()
+            rules = current_app.config['ELIGIBILITY_RULES']
+
+            def submit(db):
+                # Over-committed guarantors are turned away in the same
+                # transaction as the insert, so two applications can not both
+                # take a guarantor's last slot
+                error = check_guarantors(db, ecn_staff_no.strip(), guarantors)
+                if error:
+                    raise GuarantorError(error)
+                cursor = db.execute('''INSERT INTO loan_applications (
+                                        user_id, type_of_loan, amount, duration, ecn_staff_no, ippis_no, designation,
+                                        phone_no, bank_name, account_no, previous_month_salary, guarantor1_name,
+                                        guarantor1_staff_no, guarantor1_designation, guarantor1_phone_no,
+                                        guarantor2_name, guarantor2_staff_no, guarantor2_designation,
+                                        guarantor2_phone_no, date, status
+                                     ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                                    (user_id, type_of_loan, amount, duration, ecn_staff_no, ippis_no, designation,
+                                     phone_no, bank_name, account_no, previous_month_salary,
+                                     *[guarantor[field] for guarantor in guarantors
+                                       for field in ('name', 'staff_no', 'designation', 'phone_no')],
+                                     today, 'pending'))
+                add_guarantors(db, cursor.lastrowid, guarantors)
+                score_applications(db, [cursor.lastrowid], rules)
+            write(submit)
             return redirect('/loan')
+        except GuarantorError as e:
+            return render_template('loan.html', error=str(e))
         except ValueError as e:
             return render_template('loan.html', error='Invalid input: Ensure amounts and duration are numbers')
     cursor = db.execute('SELECT * FROM loan_applications WHERE user_id=? AND status="pending"', (user_id,))
     applications = cursor.fetchall()
     return render_template('loan.html', applications=applications)
 
-# Repayments route
-@app.route('/repayments')
-@login_required
-def repayments():
-    db = get_db()
-    user_id = session['user_id']
-    cursor = db.execute('''
+# One page of a member's repayment schedule; the "status" arg filters on
+# "paid" or "unpaid" and "history=1" includes archived loans
+def repayments_page(db, user_id, args):
+    statuses = {'paid': (1, 1), 'unpaid': (0, 0)}.get(args.get('status', ''), (0, 1))
+    if args.get('history') == '1':
+        attach_archive(db, archive_path())
+        return paginate(db, '''
+            SELECT id, due_date, amount, status FROM all_repayments
+            WHERE user_id = ? AND loan_status = "approved" AND status BETWEEN ? AND ? {seek}
+            ORDER BY {order} LIMIT ?
+        ''', (user_id,) + statuses, ('due_date', 'id'), lambda row: (row[1], row[0]), **page_args(args))
+    return paginate(db, '''
         SELECT r.id, r.due_date, r.amount, r.status
         FROM repayments r
         JOIN loans l ON r.loan_id = l.id
-        WHERE l.user_id = ? AND l.status = "approved"
-        ORDER BY r.due_date
-    ''', (user_id,))
-    repayments = cursor.fetchall()
-    if not repayments:
+        WHERE l.user_id = ? AND l.status = "approved" AND r.status BETWEEN ? AND ? {seek}
+        ORDER BY {order} LIMIT ?
+    ''', (user_id,) + statuses, ('r.due_date', 'r.id'), lambda row: (row[1], row[0]), **page_args(args))
+
+# Repayments route
+@bp.route('/repayments')
+@login_required
+def repayments():
+    status = request.args.get('status', '')
+    history = request.args.get('history') == '1'
+    page = repayments_page(get_db(), session['user_id'], request.args)
+    if not page.rows and not (page.prev_cursor or status or history):
         return render_template('repayments.html', repayments=[], error='No repayment schedule available.')
-    return render_template('repayments.html', repayments=repayments)
+    return render_template('repayments.html', repayments=page.rows, page=page, status=status, history=history)
 
 # Mark repayment as paid
-@app.route('/mark_paid/<int:repayment_id>')
+@bp.route('/mark_paid/<int:repayment_id>')
 @login_required
 def mark_paid(repayment_id):
     db = get_db()
@@ -270,12 +543,111 @@ def mark_paid(repayment_id):
         WHERE r.id = ? AND l.user_id = ?
     ''', (repayment_id, user_id))
     if cursor.fetchone():
-        db.execute('UPDATE repayments SET status = 1 WHERE id = ?', (repayment_id,))
-        db.commit()
+        write(lambda db: db.execute('UPDATE repayments SET status = 1, days_past_due = 0 WHERE id = ?',
+                                    (repayment_id,)))
+        loans_changed(user_id)
     return redirect('/repayments')
 
+API_VERSION = 'v1'
+
+# JSON API over the member pages, served under /api/v1. Each response has an
+# ETag built from the member's data version (see versions.py), so a client
+# polling with If-None-Match gets a 304 after one primary-key lookup, without
+# running the view's queries. `etag_extra(db)`, if given, returns a string
+# folded into the tag for data the member version does not cover.
+def api_route(rule, etag_extra=None):
+    def decorator(build):
+        @bp.route(f'/api/{API_VERSION}{rule}', endpoint=build.__name__)
+        def view():
+            user_id = session.get('user_id')
+            if user_id is None:
+                return jsonify(error='Login required'), 401
+            db = get_db()
+            # Read the version first: a write landing mid-request only makes the
+            # payload newer than its tag
+            etag = member_etag(API_VERSION, user_id, member_version(db, user_id),
+                               request.full_path + (etag_extra(db) if etag_extra else ''))
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+            else:
+                response = jsonify(build(db, user_id))
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return build
+    return decorator
+
+@api_route('/dashboard')
+def api_dashboard(db, user_id):
+    summary = load_member_summary(db, user_id)
+    if not summary:
+        return {'error': 'Unknown member'}
+    next_repayment = summary['next_repayment']
+    return {'name': summary['name'], 'savings_total': summary['savings_total'],
+            'outstanding': summary['outstanding'],
+            'next_repayment': {'due_date': next_repayment[0], 'amount': next_repayment[1]} if next_repayment else None}
+
+@api_route('/savings')
+def api_savings(db, user_id):
+    page, savings, total = savings_page(db, user_id, request.args)
+    return {'balance': total, 'next': page.next_cursor, 'prev': page.prev_cursor,
+            'items': [{'date': date, 'amount': amount, 'balance': balance} for amount, date, balance in savings]}
+
+@api_route('/loan')
+def api_loan(db, user_id):
+    applications = db.execute('''SELECT id, type_of_loan, amount, duration, date, eligibility, eligibility_reason
+                                 FROM loan_applications WHERE user_id = ? AND status = "pending"''', (user_id,))
+    if request.args.get('history') == '1':
+        attach_archive(db, archive_path())
+        loans = db.execute('''SELECT id, type_of_loan, amount_approved, total_amount, monthly_repayment, duration,
+                                     date, status, archived
+                              FROM all_loans WHERE user_id = ? ORDER BY id''', (user_id,))
+    else:
+        loans = db.execute('''SELECT id, type_of_loan, amount_approved, total_amount, monthly_repayment, duration,
+                                     date, status, 0
+                              FROM loans WHERE user_id = ? ORDER BY id''', (user_id,))
+    return {
+        'applications': [dict(zip(('id', 'type_of_loan', 'amount', 'duration', 'date', 'eligibility',
+                                   'eligibility_reason'), row)) for row in applications],
+        'loans': [dict(zip(('id', 'type_of_loan', 'amount_approved', 'total_amount', 'monthly_repayment',
+                            'duration', 'date', 'status', 'archived'), row)) for row in loans],
+    }
+
+@api_route('/repayments')
+def api_repayments(db, user_id):
+    page = repayments_page(db, user_id, request.args)
+    return {'next': page.next_cursor, 'prev': page.prev_cursor,
+            'items': [{'id': repayment_id, 'due_date': due_date, 'amount': amount, 'paid': bool(status)}
+                      for repayment_id, due_date, amount, status in page.rows]}
+
+# The "as_of" query argument as YYYY-MM-DD, or None when omitted; raises
+# ValueError if it is not a date
+def requested_as_of():
+    as_of = request.args.get('as_of') or None
+    return datetime.strptime(as_of, '%Y-%m-%d').strftime('%Y-%m-%d') if as_of else None
+
+# The checkpoint a balance is read from: a snapshot taken since the last
+# response changes its "checkpoint" and "tail_entries" fields
+def balance_checkpoint_tag(db):
+    try:
+        as_of = requested_as_of()
+    except ValueError:
+        return ''
+    checkpoint = checkpoint_before(db, as_of or '9999-12-31')
+    return f'#{checkpoint[0]}:{checkpoint[1]}' if checkpoint else ''
+
+# Savings and loan balances from the money journal, as of the end of the
+# "as_of" date (YYYY-MM-DD; omitted: everything recorded so far)
+@api_route('/balance', etag_extra=balance_checkpoint_tag)
+def api_balance(db, user_id):
+    try:
+        as_of = requested_as_of()
+    except ValueError:
+        return {'error': 'as_of must be a date (YYYY-MM-DD)'}
+    return balance_as_of(db, user_id, as_of)
+
 # Admin dashboard route
-@app.route('/admin')
+@bp.route('/admin')
 @login_required
 def admin():
     if not session.get('is_admin'):
@@ -283,7 +655,7 @@ def admin():
     return render_template('admin.html')
 
 # Add savings route
-@app.route('/add_savings', methods=['GET', 'POST'])
+@bp.route('/add_savings', methods=['GET', 'POST'])
 @login_required
 def add_savings():
     if not session.get('is_admin'):
@@ -298,74 +670,217 @@ def add_savings():
             cursor = db.execute('SELECT id FROM users WHERE id = ?', (staff_id,))
             if not cursor.fetchone():
                 return render_template('add_savings.html', error='Invalid Staff ID')
-            db.execute('INSERT INTO savings (user_id, amount, date) VALUES (?, ?, ?)',
-                       (staff_id, amount, datetime.now().strftime('%Y-%m-%d')))
-            db.commit()
+            write(lambda db: db.execute('INSERT INTO savings (user_id, amount, date) VALUES (?, ?, ?)',
+                                        (staff_id, amount, datetime.now().strftime('%Y-%m-%d'))))
+            summaries.invalidate(staff_id)
             return redirect('/add_savings')
         except ValueError:
             return render_template('add_savings.html', error='Invalid Staff ID or amount')
-    cursor = db.execute('SELECT id, name FROM users WHERE is_admin = 0')
-    users = cursor.fetchall()
-    return render_template('add_savings.html', users=users)
+    q = request.args.get('q', '')
+    page = paginate(db, '''SELECT id, name FROM users
+                           WHERE is_admin = 0 AND name >= ? AND name < ? {seek}
+                           ORDER BY {order} LIMIT ?''',
+                    (q, prefix_end(q)), ('name',), lambda row: (row[1],), **page_args(request.args))
+    return render_template('add_savings.html', users=page.rows, page=page, q=q)
+
+# Bulk savings route: post a payroll deduction CSV in batched transactions
+@bp.route('/bulk_savings', methods=['GET', 'POST'])
+@login_required
+def bulk_savings():
+    if not session.get('is_admin'):
+        return redirect('/dashboard')
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            return render_template('bulk_savings.html', error='Choose a CSV file to upload')
+        lines = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        summary = post_savings_csv(get_db(), lines)
+        summaries.clear()
+        return render_template('bulk_savings.html', summary=summary)
+    return render_template('bulk_savings.html')
+
+# Upload a monthly IPPIS deduction file and mark the installments it covers
+# as paid
+@bp.route('/reconcile', methods=['GET', 'POST'])
+@login_required
+def reconcile():
+    if not session.get('is_admin'):
+        return redirect('/dashboard')
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            return render_template('reconcile.html', error='Choose a CSV file to upload')
+        month = request.form.get('month') or None
+        if month:
+            try:
+                month = datetime.strptime(month, '%Y-%m').strftime('%Y-%m')
+            except ValueError:
+                return render_template('reconcile.html', error='Month must be in YYYY-MM format')
+        lines = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        report = reconcile_deductions(get_db(), lines, month=month,
+                                      workers=current_app.config['RECONCILE_WORKERS'],
+                                      dry_run=request.form.get('dry_run') == '1')
+        loans_changed(*report['user_ids'])
+        return render_template('reconcile.html', report=report)
+    return render_template('reconcile.html')
+
+# Connection pool statistics (reuse rate under load)
+@bp.route('/db_stats')
+@login_required
+def db_stats():
+    if not session.get('is_admin'):
+        return redirect('/dashboard')
+    return jsonify(current_app.extensions['connections'].snapshot())
+
+# Member summary cache statistics (hit rate, size)
+@bp.route('/cache_stats')
+@login_required
+def cache_stats():
+    if not session.get('is_admin'):
+        return redirect('/dashboard')
+    return jsonify(summaries.snapshot())
+
+# Streaming CSV export of the loans or repayments ledger (?gzip=1 to compress)
+@bp.route('/export/<ledger>.csv')
+@login_required
+def export(ledger):
+    if not session.get('is_admin'):
+        return redirect('/dashboard')
+    if ledger not in EXPORTS:
+        return redirect('/admin')
+    compress = request.args.get('gzip') == '1'
+    chunks = export_ledger(get_db(), ledger, request.args.get('start', ''), request.args.get('end', ''),
+                           request.args.get('status', ''), compress=compress)
+    filename = f"{ledger}.csv.gz" if compress else f"{ledger}.csv"
+    return Response(stream_with_context(chunks),
+                    mimetype='application/gzip' if compress else 'text/csv',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+# Loan book analytics: totals, PAR aging and per-type breakdowns
+@bp.route('/analytics')
+@login_required
+def analytics():
+    if not session.get('is_admin'):
+        return redirect('/dashboard')
+    return render_template('analytics.html', percentiles=PERCENTILES,
+                           **portfolio_analytics(request.args.get('as_of') or None))
+
+@bp.route('/analytics.json')
+@login_required
+def analytics_json():
+    if not session.get('is_admin'):
+        return redirect('/dashboard')
+    return jsonify(portfolio_analytics(request.args.get('as_of') or None))
+
+def portfolio_analytics(as_of):
+    try:
+        as_of = datetime.strptime(as_of, '%Y-%m-%d').strftime('%Y-%m-%d')
+    except (TypeError, ValueError):
+        as_of = datetime.now().strftime('%Y-%m-%d')
+    db = get_db()
+    version = book_version(db)
+    return {'summary': portfolio.get(('summary', as_of, version), lambda: portfolio_summary(db, as_of)),
+            'distribution': portfolio.get(('distribution', version), lambda: portfolio_distribution(db))}
+
+# Typeahead lookup for the admin pages: members whose name, staff number or
+# IPPIS number starts with the words typed so far. "members_only=1" leaves
+# admins out; "limit" caps the matches (at most 50).
+@bp.route('/members/search.json')
+@login_required
+def member_search_json():
+    if not session.get('is_admin'):
+        return redirect('/dashboard')
+    q = request.args.get('q', '')
+    try:
+        limit = min(max(int(request.args.get('limit', DEFAULT_LIMIT)), 1), 50)
+    except ValueError:
+        limit = DEFAULT_LIMIT
+    rows = search_members(get_db(), q, limit, members_only=request.args.get('members_only') == '1')
+    return jsonify({'query': q,
+                    'members': [{'id': user_id, 'name': name, 'ecn_staff_no': staff_no, 'ippis_no': ippis_no}
+                                for user_id, name, staff_no, ippis_no in rows]})
+
+# Route latency histograms, SQL statement counts/timings and the slowest
+# queries, plus connection and cache statistics
+@bp.route('/metrics')
+@login_required
+def metrics_view():
+    if not session.get('is_admin'):
+        return redirect('/dashboard')
+    writer = current_app.extensions.get('write_queue')
+    return jsonify(dict(metrics.snapshot(), connections=current_app.extensions['connections'].snapshot(),
+                        member_cache=summaries.snapshot(),
+                        portfolio_cache=portfolio.snapshot(),
+                        write_queue=writer.snapshot() if writer else None))
 
 # Users route
-@app.route('/users')
+@bp.route('/users')
 @login_required
 def users():
     if not session.get('is_admin'):
         return redirect('/dashboard')
     db = get_db()
-    cursor = db.execute('SELECT id, name FROM users')
-    users = cursor.fetchall()
-    return render_template('users.html', users=users)
+    q = request.args.get('q', '')
+    page = paginate(db, 'SELECT id, name FROM users WHERE name >= ? AND name < ? {seek} ORDER BY {order} LIMIT ?',
+                    (q, prefix_end(q)), ('name',), lambda row: (row[1],), **page_args(request.args))
+    return render_template('users.html', users=page.rows, page=page, q=q)
 
 # Approve loans route
-@app.route('/approve_loans')
+@bp.route('/approve_loans')
 @login_required
 def approve_loans():
     if not session.get('is_admin'):
         return redirect('/dashboard')
     db = get_db()
-    cursor = db.execute('SELECT id, user_id, amount, u.name FROM loan_applications l JOIN users u ON l.user_id = u.id WHERE l.status = "pending"')
-    applications = cursor.fetchall()
-    return render_template('approve_loans.html', applications=applications)
+    q = request.args.get('q', '')
+    page = paginate(db, '''SELECT l.id, l.user_id, l.amount, u.name, l.eligibility, l.eligibility_reason
+                           FROM loan_applications l JOIN users u ON l.user_id = u.id
+                           WHERE l.status = "pending" AND (? = '' OR (u.name >= ? AND u.name < ?)) {seek}
+                           ORDER BY {order} LIMIT ?''',
+                    (q, q, prefix_end(q)), ('l.id',), lambda row: (row[0],), **page_args(request.args))
+    return render_template('approve_loans.html', applications=page.rows, page=page, q=q)
+
+# Re-score every pending application against the current eligibility rules
+@bp.route('/approve_loans/rescore', methods=['POST'])
+@login_required
+def rescore_applications():
+    if not session.get('is_admin'):
+        return redirect('/dashboard')
+    write(score_applications, None, current_app.config['ELIGIBILITY_RULES'])
+    return redirect('/approve_loans')
 
 # Approve loan route
-@app.route('/approve/<int:application_id>')
+@bp.route('/approve/<int:application_id>')
 @login_required
 def approve(application_id):
     if not session.get('is_admin'):
         return redirect('/dashboard')
-    db = get_db()
-    cursor = db.execute('SELECT * FROM loan_applications WHERE id = ?', (application_id,))
-    application = cursor.fetchone()
-    if application:
-        user_id, type_of_loan, amount, duration, ecn_staff_no, ippis_no, designation, \
-        phone_no, bank_name, account_no, previous_month_salary, guarantor1_name, \
-        guarantor1_staff_no, guarantor1_designation, guarantor1_phone_no, guarantor2_name, \
-        guarantor2_staff_no, guarantor2_designation, guarantor2_phone_no, date, status = application
-        interest_charged = amount * 0.05
-        monthly_repayment = (amount + interest_charged) / duration
-        db.execute('''INSERT INTO loans (
-                        user_id, type_of_loan, amount, duration, ecn_staff_no, ippis_no, designation,
-                        phone_no, bank_name, account_no, previous_month_salary, monthly_repayment,
-                        date, status, amount_approved, interest_charged, total_amount
-                     ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                   (user_id, type_of_loan, amount, duration, ecn_staff_no, ippis_no, designation,
-                    phone_no, bank_name, account_no, previous_month_salary, monthly_repayment,
-                    date, 'approved', amount, interest_charged, amount + interest_charged))
-        loan_id = db.execute('SELECT last_insert_rowid()').fetchone()[0]
-        start_date = datetime.strptime(date, '%Y-%m-%d')
-        for i in range(duration):
-            due_date = (start_date + timedelta(days=30*i)).strftime('%Y-%m-%d')
-            db.execute('INSERT INTO repayments (loan_id, due_date, amount, status) VALUES (?, ?, ?, ?)',
-                       (loan_id, due_date, monthly_repayment, 0))
-        db.execute('DELETE FROM loan_applications WHERE id = ?', (application_id,))
-        db.commit()
+    summary = write(approve_applications, [application_id])
+    loans_changed(*summary['user_ids'])
     return redirect('/approve_loans')
 
+# Bulk approval: the selected applications, or every pending one matching the
+# filter, approved in a single transaction
+@bp.route('/approve_loans/bulk', methods=['POST'])
+@login_required
+def approve_bulk():
+    if not session.get('is_admin'):
+        return redirect('/dashboard')
+    try:
+        application_ids = [int(i) for i in request.form.getlist('application_id')]
+        max_amount = request.form.get('max_amount')
+        max_amount = float(max_amount) if max_amount else None
+    except ValueError:
+        return render_template('bulk_approval.html', error='Invalid application ID or amount')
+    if not application_ids and request.form.get('scope') != 'filter':
+        return render_template('bulk_approval.html', error='Select at least one application')
+    summary = write(approve_applications, application_ids or None, request.form.get('type_of_loan') or None,
+                    max_amount)
+    loans_changed(*summary['user_ids'])
+    return render_template('bulk_approval.html', summary=summary)
+
 # Loan approval details route
-@app.route('/loan_approval_details/<int:loan_id>', methods=['GET', 'POST'])
+@bp.route('/loan_approval_details/<int:loan_id>', methods=['GET', 'POST'])
 @login_required
 def loan_approval_details(loan_id):
     if not session.get('is_admin'):
@@ -378,17 +893,23 @@ def loan_approval_details(loan_id):
         interest_charged = float(request.form['interest_charged'])
         total_amount = float(request.form['total_amount'])
         monthly_repayment = total_amount / loan[4]  # duration
-        db.execute('''UPDATE loans SET amount_approved = ?, interest_charged = ?, total_amount = ?, monthly_repayment = ?
-                     WHERE id = ?''', (amount_approved, interest_charged, total_amount, monthly_repayment, loan_id))
-        db.execute('DELETE FROM repayments WHERE loan_id = ?', (loan_id,))
-        start_date = datetime.strptime(loan[14], '%Y-%m-%d')  # date
-        for i in range(loan[4]):  # duration
-            due_date = (start_date + timedelta(days=30*i)).strftime('%Y-%m-%d')
-            db.execute('INSERT INTO repayments (loan_id, due_date, amount, status) VALUES (?, ?, ?, ?)',
-                       (loan_id, due_date, monthly_repayment, 0))
-        db.commit()
+
+        def update(db):
+            db.execute('''UPDATE loans SET amount_approved = ?, interest_charged = ?, total_amount = ?,
+                                           monthly_repayment = ?
+                          WHERE id = ?''', (amount_approved, interest_charged, total_amount, monthly_repayment, loan_id))
+            # Paid installments are kept; only unpaid ones whose date or amount
+            # changed are rewritten
+            sync_schedule(db, loan_id, build_schedule(loan[13], loan[4], monthly_repayment),  # date, duration
+                          total_amount)
+        write(update)
+        loans_changed(loan[1])  # user_id
         return redirect('/approve_loans')
     return render_template('loan_approval_details.html', loan=loan)
 
 if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        init_db()
+    start_arrears_scheduler(app)
     app.run(debug=True)
@@ -0,0 +1,112 @@
+import time
+from datetime import datetime
+
+try:
+    import numpy as np
+except ImportError:  # optional: the distribution slice falls back to pure Python
+    np = None
+
+# PAR aging buckets by days past due of a loan's oldest unpaid installment;
+# (name, upper bound in days) with the last bucket open-ended
+PAR_BUCKETS = (('current', 0), ('1_30', 30), ('31_60', 60), ('61_90', 90), ('over_90', None))
+
+# Loan size / balance percentiles reported per type of loan
+PERCENTILES = (50, 90, 99)
+
+_BUCKET_CASE = 'CASE WHEN outstanding = 0 THEN "settled" ' + ' '.join(
+    f'WHEN julianday(?) - julianday(oldest_due) <= {bound} THEN "{name}"'
+    for name, bound in PAR_BUCKETS if bound is not None) + f' ELSE "{PAR_BUCKETS[-1][0]}" END'
+
+# Approved loans with their paid and unpaid schedule totals and oldest unpaid
+# due date. Principal and interest are split pro rata from each installment.
+_PER_LOAN = '''SELECT l.id, COALESCE(l.type_of_loan, "") AS type, l.amount_approved AS principal,
+                      l.interest_charged AS interest, l.total_amount AS total,
+                      COALESCE(SUM(CASE WHEN r.status = 1 THEN r.amount END), 0) AS paid,
+                      COALESCE(SUM(CASE WHEN r.status = 0 THEN r.amount END), 0) AS outstanding,
+                      MIN(CASE WHEN r.status = 0 THEN r.due_date END) AS oldest_due
+               FROM loans l LEFT JOIN repayments r ON r.loan_id = l.id
+               WHERE l.status = "approved"
+               GROUP BY l.id'''
+
+# Aggregate the loan book as of `as_of` (YYYY-MM-DD) in one grouped query:
+# totals, outstanding principal, interest earned, PAR aging buckets and the
+# same figures per type of loan
+def portfolio_summary(db, as_of=None):
+    started = time.perf_counter()
+    as_of = as_of or datetime.now().strftime('%Y-%m-%d')
+    thresholds = [as_of for _, bound in PAR_BUCKETS if bound is not None]
+    rows = db.execute(f'''SELECT type, {_BUCKET_CASE}, COUNT(*), SUM(principal), SUM(interest), SUM(paid),
+                                 SUM(outstanding), SUM(outstanding * principal / total),
+                                 SUM(paid * interest / total)
+                          FROM ({_PER_LOAN})
+                          GROUP BY 1, 2''', thresholds).fetchall()
+    empty = lambda: {'loans': 0, 'disbursed': 0.0, 'interest_charged': 0.0, 'repaid': 0.0, 'outstanding': 0.0,
+                     'outstanding_principal': 0.0, 'interest_earned': 0.0}
+    totals, by_type = empty(), {}
+    par = {name: {'loans': 0, 'outstanding': 0.0} for name, _ in PAR_BUCKETS}
+    for type_of_loan, bucket, loans, principal, interest, paid, outstanding, principal_due, interest_earned in rows:
+        for figures in (totals, by_type.setdefault(type_of_loan, empty())):
+            figures['loans'] += loans
+            figures['disbursed'] += principal or 0
+            figures['interest_charged'] += interest or 0
+            figures['repaid'] += paid or 0
+            figures['outstanding'] += outstanding or 0
+            figures['outstanding_principal'] += principal_due or 0
+            figures['interest_earned'] += interest_earned or 0
+        if bucket in par:
+            par[bucket]['loans'] += loans
+            par[bucket]['outstanding'] += outstanding or 0
+    at_risk = sum(par[name]['outstanding'] for name, _ in PAR_BUCKETS[2:])
+    return {
+        'as_of': as_of,
+        'totals': _rounded(totals),
+        'by_type': {name: _rounded(figures) for name, figures in sorted(by_type.items())},
+        'par': {name: _rounded(bucket) for name, bucket in par.items()},
+        # Share of the outstanding book more than 30 days past due
+        'par30_ratio': round(at_risk / totals['outstanding'], 4) if totals['outstanding'] else 0.0,
+        'seconds': round(time.perf_counter() - started, 4),
+    }
+
+def _rounded(figures):
+    return {name: round(value, 2) if isinstance(value, float) else value for name, value in figures.items()}
+
+# Loan size and outstanding balance percentiles per type of loan, computed
+# from a columnar snapshot of every approved loan (NumPy when installed)
+def portfolio_distribution(db):
+    started = time.perf_counter()
+    types, principal, outstanding = [], [], []
+    for type_of_loan, amount, balance in db.execute(
+            f'SELECT type, principal, outstanding FROM ({_PER_LOAN})'):
+        types.append(type_of_loan)
+        principal.append(amount or 0.0)
+        outstanding.append(balance)
+    if np is not None:
+        types, principal, outstanding = np.array(types), np.array(principal), np.array(outstanding)
+        slices = {name: (principal[types == name], outstanding[types == name]) for name in np.unique(types)}
+        percentiles = lambda values: dict(zip(PERCENTILES, np.percentile(values, PERCENTILES).round(2).tolist()))
+    else:
+        slices = {}
+        for name, amount, balance in zip(types, principal, outstanding):
+            amounts, balances = slices.setdefault(name, ([], []))
+            amounts.append(amount)
+            balances.append(balance)
+        percentiles = _percentiles
+    return {
+        'engine': 'numpy' if np is not None else 'python',
+        'by_type': {str(name): {'loans': len(amounts),
+                                'amount': percentiles(amounts),
+                                'outstanding': percentiles(balances)}
+                    for name, (amounts, balances) in sorted(slices.items())},
+        'seconds': round(time.perf_counter() - started, 4),
+    }
+
+# Linear-interpolated percentiles (NumPy's default method)
+def _percentiles(values):
+    values = sorted(values)
+    result = {}
+    for p in PERCENTILES:
+        position = (len(values) - 1) * p / 100
+        low = int(position)
+        high = min(low + 1, len(values) - 1)
+        result[p] = round(values[low] + (values[high] - values[low]) * (position - low), 2)
+    return result
@@ -0,0 +1,73 @@
+import json
+import time
+
+from guarantors import attach_to_loans
+from schedule import build_schedule
+
+# Flat interest charged on approval, as a fraction of the amount requested
+INTEREST_RATE = 0.05
+
+# Pending application ids matching `application_ids` and/or the filter
+# arguments; with neither, every pending application
+def select_pending(db, application_ids=None, type_of_loan=None, max_amount=None):
+    sql = 'SELECT id FROM loan_applications WHERE status = "pending"'
+    params = []
+    if application_ids is not None:
+        sql += ' AND id IN (SELECT value FROM json_each(?))'
+        params.append(json.dumps([int(i) for i in application_ids]))
+    if type_of_loan:
+        sql += ' AND type_of_loan = ?'
+        params.append(type_of_loan)
+    if max_amount is not None:
+        sql += ' AND amount <= ?'
+        params.append(max_amount)
+    return [row[0] for row in db.execute(sql + ' ORDER BY id', params)]
+
+# Approve pending applications in one transaction: copy them to loans with
+# one INSERT ... SELECT, build every schedule in memory and write them with a
+# single executemany, then delete the applications. Returns a summary dict.
+def approve_applications(db, application_ids=None, type_of_loan=None, max_amount=None):
+    started = time.perf_counter()
+    with db:
+        ids = select_pending(db, application_ids, type_of_loan, max_amount)
+        batch = json.dumps(ids)
+        selected = len(ids)
+        schedule_rows = 0
+        loans = []
+        if ids:
+            # The applications are read again inside the write: another
+            # approver may have taken some since select_pending, and only the
+            # loans inserted here get a schedule
+            loans = db.execute('''INSERT INTO loans (
+                                    user_id, type_of_loan, amount, duration, ecn_staff_no, ippis_no, designation,
+                                    phone_no, bank_name, account_no, previous_month_salary, monthly_repayment,
+                                    date, status, amount_approved, interest_charged, total_amount, application_id
+                                  )
+                                  SELECT user_id, type_of_loan, amount, duration, ecn_staff_no, ippis_no,
+                                         designation, phone_no, bank_name, account_no, previous_month_salary,
+                                         amount * (1 + ?) / duration, date, 'approved', amount, amount * ?,
+                                         amount * (1 + ?), id
+                                  FROM loan_applications
+                                  WHERE id IN (SELECT value FROM json_each(?)) AND status = "pending"
+                                  ORDER BY id
+                                  RETURNING id, user_id, date, duration, monthly_repayment, application_id''',
+                               (INTEREST_RATE, INTEREST_RATE, INTEREST_RATE, batch)).fetchall()
+            ids = sorted(loan[5] for loan in loans)
+            batch = json.dumps(ids)
+            schedules = [(loan_id, due_date, amount)
+                         for loan_id, _, date, duration, monthly_repayment, _ in loans
+                         for due_date, amount in build_schedule(date, duration, monthly_repayment)]
+            db.executemany('INSERT INTO repayments (loan_id, due_date, amount, status) VALUES (?, ?, ?, 0)',
+                           schedules)
+            schedule_rows = len(schedules)
+            attach_to_loans(db, batch)
+            db.execute('DELETE FROM loan_applications WHERE id IN (SELECT value FROM json_each(?))', (batch,))
+    requested = len(application_ids) if application_ids is not None else selected
+    return {
+        'approved': len(ids),
+        'skipped': max(requested - len(ids), 0),
+        'schedule_rows': schedule_rows,
+        'application_ids': ids,
+        'user_ids': sorted({loan[1] for loan in loans}),
+        'seconds': round(time.perf_counter() - started, 4),
+    }
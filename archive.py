@@ -0,0 +1,101 @@
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+# Tables moved to the archive, parent first, with the indexes each one gets
+# there (mirroring the hot lookups)
+ARCHIVED_TABLES = (
+    ('loans', ('user_id, status', 'application_id')),
+    ('repayments', ('loan_id, due_date',)),
+    ('guarantors', ('staff_no', 'loan_id')),
+)
+
+# Loans are archived once their last installment was due this many days ago
+# and every installment is paid
+DEFAULT_AFTER_DAYS = 90
+
+# Archive file next to the live database: ecn_coop.db -> ecn_coop_archive.db
+def default_archive_path(database):
+    root, ext = os.path.splitext(database)
+    return f'{root}_archive{ext or ".db"}'
+
+def _columns(db, schema, table):
+    return [row[1] for row in db.execute(f'PRAGMA {schema}.table_info({table})')]
+
+# Attach the archive database as `archive` (once per connection), bring its
+# tables in line with the live columns and create the TEMP views all_loans and
+# all_repayments that union live and archived rows (archived = 1).
+# Must run outside a transaction.
+def attach_archive(db, path):
+    if any(row[1] == 'archive' for row in db.execute('PRAGMA database_list')):
+        return db
+    db.execute('ATTACH DATABASE ? AS archive', (path,))
+    for table, indexes in ARCHIVED_TABLES:
+        columns = _columns(db, 'main', table)
+        db.execute(f'CREATE TABLE IF NOT EXISTS archive.{table} AS SELECT * FROM main.{table} WHERE 0')
+        archived = set(_columns(db, 'archive', table))
+        for column in columns:
+            if column not in archived:  # added to the live table since the archive was created
+                db.execute(f'ALTER TABLE archive.{table} ADD COLUMN {column}')
+        if 'archived_at' not in archived:
+            db.execute(f'ALTER TABLE archive.{table} ADD COLUMN archived_at TEXT')
+        db.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS archive.idx_{table}_id ON {table} (id)')
+        for index in indexes:
+            name = 'idx_{}_{}'.format(table, index.replace(', ', '_'))
+            db.execute(f'CREATE INDEX IF NOT EXISTS archive.{name} ON {table} ({index})')
+    # all_repayments carries each installment's user_id and loan_status so
+    # member filters push down into both branches instead of joining two views
+    loans = ', '.join(_columns(db, 'main', 'loans'))
+    repayments = ', '.join('r.' + column for column in _columns(db, 'main', 'repayments'))
+    db.execute(f'''CREATE TEMP VIEW IF NOT EXISTS all_loans AS
+                   SELECT {loans}, 0 AS archived FROM main.loans
+                   UNION ALL
+                   SELECT {loans}, 1 AS archived FROM archive.loans''')
+    db.execute(f'''CREATE TEMP VIEW IF NOT EXISTS all_repayments AS
+                   SELECT {repayments}, l.user_id, l.status AS loan_status, 0 AS archived
+                   FROM main.repayments r JOIN main.loans l ON l.id = r.loan_id
+                   UNION ALL
+                   SELECT {repayments}, l.user_id, l.status AS loan_status, 1 AS archived
+                   FROM archive.repayments r JOIN archive.loans l ON l.id = r.loan_id''')
+    return db
+
+# Move fully repaid loans, with their installments and guarantors, from the
+# live tables into the attached archive, `batch_size` loans per transaction.
+# Rows are copied with INSERT OR IGNORE before the live rows are deleted, so a
+# run interrupted between the two (cross-database commits are not atomic in
+# WAL mode) is completed by the next one. Returns a summary dict.
+def archive_settled_loans(db, archive_path, settled_before=None, batch_size=500, log=None):
+    started = time.perf_counter()
+    settled_before = settled_before or \
+        (datetime.now() - timedelta(days=DEFAULT_AFTER_DAYS)).strftime('%Y-%m-%d')
+    attach_archive(db, archive_path)
+    archived_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    columns = {table: ', '.join(_columns(db, 'main', table)) for table, _ in ARCHIVED_TABLES}
+    summary = {'loans': 0, 'repayments': 0, 'guarantors': 0, 'user_ids': set()}
+    last_id = 0
+    while True:
+        batch = db.execute('''SELECT l.id, l.user_id FROM loans l
+                              WHERE l.id > ? AND l.status = "approved"
+                                AND NOT EXISTS (SELECT 1 FROM repayments r WHERE r.loan_id = l.id AND r.status = 0)
+                                AND (SELECT MAX(r.due_date) FROM repayments r WHERE r.loan_id = l.id) < ?
+                              ORDER BY l.id LIMIT ?''', (last_id, settled_before, batch_size)).fetchall()
+        if not batch:
+            break
+        last_id = batch[-1][0]
+        ids = json.dumps([loan_id for loan_id, _ in batch])
+        with db:
+            for table, key in (('loans', 'id'), ('repayments', 'loan_id'), ('guarantors', 'loan_id')):
+                db.execute(f'''INSERT OR IGNORE INTO archive.{table} ({columns[table]}, archived_at)
+                               SELECT {columns[table]}, ? FROM main.{table}
+                               WHERE {key} IN (SELECT value FROM json_each(?))''', (archived_at, ids))
+            # Children first: repayments and guarantors reference loans
+            for table, key in (('guarantors', 'loan_id'), ('repayments', 'loan_id'), ('loans', 'id')):
+                summary[table] += db.execute(f'''DELETE FROM main.{table}
+                                                 WHERE {key} IN (SELECT value FROM json_each(?))''', (ids,)).rowcount
+        summary['user_ids'].update(user_id for _, user_id in batch)
+        if log:
+            log(f"Archived {summary['loans']} loan(s) so far")
+    summary['user_ids'] = sorted(summary['user_ids'])
+    summary['seconds'] = round(time.perf_counter() - started, 4)
+    return summary
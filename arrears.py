@@ -0,0 +1,118 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Penalty charged on an overdue installment, as a fraction of its amount per
+# 30 days past due
+PENALTY_RATE = 0.01
+
+# Tables and indexes for the job; repayments.days_past_due (0 = not overdue)
+# is added by the migration
+SCHEMA = [
+    'CREATE INDEX IF NOT EXISTS idx_repayments_open_due ON repayments (due_date) WHERE status = 0',
+    'CREATE INDEX IF NOT EXISTS idx_repayments_flagged ON repayments (loan_id) WHERE days_past_due > 0',
+    '''CREATE TABLE IF NOT EXISTS arrears_snapshots (
+            as_of TEXT NOT NULL,
+            loan_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            overdue_installments INTEGER NOT NULL,
+            arrears REAL NOT NULL,
+            penalty REAL NOT NULL,
+            oldest_due_date TEXT NOT NULL,
+            days_past_due INTEGER NOT NULL,
+            PRIMARY KEY (as_of, loan_id)
+        ) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS arrears_runs (
+            as_of TEXT PRIMARY KEY,
+            run_at TEXT NOT NULL,
+            flagged_installments INTEGER NOT NULL,
+            loans_in_arrears INTEGER NOT NULL,
+            total_arrears REAL NOT NULL,
+            total_penalty REAL NOT NULL,
+            seconds REAL NOT NULL
+        )''',
+]
+
+# Flag overdue installments and store a dated per-loan arrears snapshot, all
+# in one transaction and a handful of set-based statements:
+#   1. clear the flag on installments that were paid or are no longer due
+#   2. set days_past_due on every unpaid installment due before `as_of`
+#   3. replace the snapshot for `as_of` with one row per loan in arrears
+#   4. record the run totals
+# Re-running for the same date replaces that date's snapshot.
+def run_arrears(db, as_of=None):
+    as_of = as_of or datetime.now().strftime('%Y-%m-%d')
+    started = time.perf_counter()
+    with db:
+        db.execute('''UPDATE repayments SET days_past_due = 0
+                      WHERE days_past_due > 0 AND (status != 0 OR due_date >= ?)''', (as_of,))
+        flagged = db.execute('''UPDATE repayments
+                                SET days_past_due = CAST(julianday(?) - julianday(due_date) AS INTEGER)
+                                WHERE status = 0 AND due_date < ?''', (as_of, as_of)).rowcount
+        db.execute('DELETE FROM arrears_snapshots WHERE as_of = ?', (as_of,))
+        db.execute('''INSERT INTO arrears_snapshots (as_of, loan_id, user_id, overdue_installments, arrears,
+                                                     penalty, oldest_due_date, days_past_due)
+                      SELECT ?, r.loan_id, l.user_id, COUNT(*), SUM(r.amount),
+                             ROUND(SUM(r.amount * r.days_past_due / 30.0 * ?), 2),
+                             MIN(r.due_date), MAX(r.days_past_due)
+                      FROM repayments r JOIN loans l ON l.id = r.loan_id
+                      WHERE r.days_past_due > 0 AND l.status = "approved"
+                      GROUP BY r.loan_id''', (as_of, PENALTY_RATE))
+        loans, total_arrears, total_penalty = db.execute(
+            '''SELECT COUNT(*), COALESCE(SUM(arrears), 0), COALESCE(SUM(penalty), 0)
+               FROM arrears_snapshots WHERE as_of = ?''', (as_of,)).fetchone()
+        seconds = round(time.perf_counter() - started, 4)
+        db.execute('''INSERT OR REPLACE INTO arrears_runs (as_of, run_at, flagged_installments, loans_in_arrears,
+                                                           total_arrears, total_penalty, seconds)
+                      VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                   (as_of, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), flagged, loans, total_arrears,
+                    total_penalty, seconds))
+    return {'as_of': as_of, 'flagged_installments': flagged, 'loans_in_arrears': loans,
+            'total_arrears': total_arrears, 'total_penalty': total_penalty, 'seconds': seconds}
+
+# Run the arrears job once a day at `run_at` ("HH:MM") on a daemon thread.
+# The job is skipped if a run for the day already exists (another worker or
+# the CLI got there first).
+class ArrearsScheduler:
+    def __init__(self, connect, run_at='01:00', log=print):
+        self.connect = connect
+        self.run_at = datetime.strptime(run_at, '%H:%M').time()
+        self.log = log
+        self._stop = threading.Event()
+        self._thread = None
+
+    def seconds_until_next_run(self, now=None):
+        now = now or datetime.now()
+        target = datetime.combine(now.date(), self.run_at)
+        if target <= now:
+            target += timedelta(days=1)
+        return (target - now).total_seconds()
+
+    def run_once(self):
+        db = self.connect()
+        try:
+            as_of = datetime.now().strftime('%Y-%m-%d')
+            if db.execute('SELECT 1 FROM arrears_runs WHERE as_of = ?', (as_of,)).fetchone():
+                return None
+            summary = run_arrears(db, as_of)
+            self.log(f"Arrears run {as_of}: {summary['loans_in_arrears']} loan(s) in arrears, "
+                     f"{summary['total_arrears']:.2f} overdue, {summary['seconds']}s")
+            return summary
+        finally:
+            db.close()
+
+    def _loop(self):
+        while not self._stop.wait(self.seconds_until_next_run()):
+            try:
+                self.run_once()
+            except Exception as e:  # keep the scheduler alive; the next day retries
+                self.log(f"Arrears run failed: {e}")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='arrears-scheduler', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,438 @@
+import argparse
+import io
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import time
+from datetime import date, datetime
+
+import rollup
+from migrations import migrate
+from schedule import add_months, build_schedule
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+LOAN_TYPES = ('personal', 'car', 'housing', 'education', 'emergency')
+
+# Rows per executemany batch while generating data
+BATCH_SIZE = 50000
+
+def _batched(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# Build a synthetic cooperative database at `path`: `members` members (plus one
+# admin), `savings_per_member` monthly savings postings each, `loans` approved
+# loans with full repayment schedules (installments before `today` paid) and
+# `pending` open applications. The savings rollup triggers are dropped during
+# the load and the rollups rebuilt once at the end.
+def generate_dataset(path, members=100000, savings_per_member=24, loans=20000, pending=2000,
+                     seed=1, today=None, log=print):
+    if os.path.exists(path):
+        os.remove(path)
+    rng = random.Random(seed)
+    today = today or date.today().strftime('%Y-%m-%d')
+    first_month = add_months(datetime.strptime(today, '%Y-%m-%d'), -savings_per_member)
+    db = sqlite3.connect(path)
+    migrate(db, log=lambda message: None)
+    db.execute('PRAGMA synchronous = OFF')
+    db.execute('PRAGMA journal_mode = MEMORY')
+    started = time.perf_counter()
+    with db:
+        for trigger in ('savings_rollup_insert', 'savings_rollup_delete', 'savings_rollup_update'):
+            db.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        db.execute("INSERT OR IGNORE INTO users (name, is_admin) VALUES ('BenchAdmin', 1)")
+        for batch in _batched((f'Member {i:06d}', 0) for i in range(members)):
+            db.executemany('INSERT OR IGNORE INTO users (name, is_admin) VALUES (?, ?)', batch)
+        user_ids = [row[0] for row in db.execute('SELECT id FROM users WHERE is_admin = 0')]
+        log(f"members: {len(user_ids)}")
+
+        def savings_rows():
+            for user_id in user_ids:
+                amount = rng.randint(5, 50) * 1000
+                for month in range(savings_per_member):
+                    day = add_months(first_month, month).strftime('%Y-%m-%d')
+                    yield user_id, amount, day
+        for batch in _batched(savings_rows()):
+            db.executemany('INSERT INTO savings (user_id, amount, date) VALUES (?, ?, ?)', batch)
+        log(f"savings: {len(user_ids) * savings_per_member}")
+
+        installments = 0
+        for batch in _batched(range(loans), 5000):
+            for _ in batch:
+                user_id = rng.choice(user_ids)
+                amount = rng.randint(10, 500) * 10000
+                duration = rng.choice((6, 12, 18, 24, 36))
+                start = add_months(first_month, rng.randint(0, savings_per_member)).strftime('%Y-%m-%d')
+                interest = amount * 0.05
+                monthly = (amount + interest) / duration
+                cursor = db.execute('''INSERT INTO loans (
+                                         user_id, type_of_loan, amount, duration, ecn_staff_no, ippis_no,
+                                         previous_month_salary, monthly_repayment, date, status,
+                                         amount_approved, interest_charged, total_amount)
+                                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'approved', ?, ?, ?)''',
+                                    (user_id, rng.choice(LOAN_TYPES), amount, duration, f'ECN{user_id:06d}',
+                                     f'IP{user_id:07d}', rng.randint(100, 600) * 1000, monthly, start,
+                                     amount, interest, amount + interest))
+                schedule = build_schedule(start, duration, monthly)
+                db.executemany('INSERT INTO repayments (loan_id, due_date, amount, status) VALUES (?, ?, ?, ?)',
+                               [(cursor.lastrowid, due, value, int(due < today)) for due, value in schedule])
+                installments += len(schedule)
+        log(f"loans: {loans}, installments: {installments}")
+
+        db.executemany('''INSERT INTO loan_applications (
+                            user_id, type_of_loan, amount, duration, ecn_staff_no, ippis_no,
+                            previous_month_salary, date, status)
+                          VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'pending')''',
+                       [(user_id, rng.choice(LOAN_TYPES), rng.randint(10, 500) * 10000,
+                         rng.choice((6, 12, 24)), f'ECN{user_id:06d}', f'IP{user_id:07d}',
+                         rng.randint(100, 600) * 1000, today)
+                        for user_id in (rng.choice(user_ids) for _ in range(pending))])
+        log(f"pending applications: {pending}")
+
+        rollup.rebuild_savings_rollup(db)
+        for statement in rollup.SCHEMA:
+            db.execute(statement)
+    db.execute('ANALYZE')
+    db.close()
+    log(f"generated {path} in {time.perf_counter() - started:.1f}s")
+
+# An application instance on the benchmark database
+def load_app(path, **config):
+    from ECN_corp_app import create_app
+    return create_app(dict({'DATABASE': path, 'TESTING': True, 'SECRET_KEY': 'benchmark'}, **config))
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+# Routes driven by the benchmark: (name, role, method, url(ctx), form(ctx)).
+# ctx carries ids sampled from the dataset.
+ROUTES = [
+    ('POST /login', 'anonymous', 'POST', lambda ctx: '/login', lambda ctx: {'name': ctx.rng.choice(ctx.member_names)}),
+    ('GET /dashboard', 'member', 'GET', lambda ctx: '/dashboard', None),
+    ('GET /savings', 'member', 'GET', lambda ctx: '/savings', None),
+    ('GET /loan', 'member', 'GET', lambda ctx: '/loan', None),
+    ('GET /repayments', 'member', 'GET', lambda ctx: '/repayments', None),
+    ('GET /mark_paid', 'member', 'GET', lambda ctx: f'/mark_paid/{ctx.rng.choice(ctx.repayment_ids)}', None),
+    ('GET /admin', 'admin', 'GET', lambda ctx: '/admin', None),
+    ('GET /users', 'admin', 'GET', lambda ctx: '/users', None),
+    ('GET /add_savings', 'admin', 'GET', lambda ctx: '/add_savings', None),
+    ('GET /members/search.json', 'admin', 'GET',
+     lambda ctx: f'/members/search.json?q={ctx.rng.choice(ctx.member_names)[:9]}&members_only=1', None),
+    ('POST /add_savings', 'admin', 'POST', lambda ctx: '/add_savings',
+     lambda ctx: {'staff_id': str(ctx.rng.choice(ctx.member_ids)), 'amount': '5000'}),
+    ('GET /approve_loans', 'admin', 'GET', lambda ctx: '/approve_loans', None),
+    ('GET /approve', 'admin', 'GET', lambda ctx: f'/approve/{ctx.next_application()}', None),
+    ('GET /loan_approval_details', 'admin', 'GET',
+     lambda ctx: f'/loan_approval_details/{ctx.rng.choice(ctx.loan_ids)}', None),
+    ('POST /loan_approval_details', 'admin', 'POST',
+     lambda ctx: f'/loan_approval_details/{ctx.rng.choice(ctx.loan_ids)}',
+     lambda ctx: {'amount_approved': '100000', 'interest_charged': '5000', 'total_amount': '105000'}),
+    ('GET /export/repayments.csv', 'admin', 'GET', lambda ctx: '/export/repayments.csv?start=2024-01-01&end=2024-01-31',
+     None),
+    ('GET /export/loans.csv', 'admin', 'GET', lambda ctx: '/export/loans.csv?start=2024-01-01&end=2024-03-31', None),
+    ('POST /bulk_savings', 'admin', 'POST', lambda ctx: '/bulk_savings',
+     lambda ctx: {'file': (io.BytesIO(ctx.payroll_csv.encode()), 'payroll.csv')}),
+    ('POST /approve_loans/bulk', 'admin', 'POST', lambda ctx: '/approve_loans/bulk',
+     lambda ctx: {'application_id': [str(ctx.next_application()) for _ in range(5)]}),
+    ('GET /analytics', 'admin', 'GET', lambda ctx: '/analytics', None),
+    ('GET /analytics.json', 'admin', 'GET', lambda ctx: '/analytics.json', None),
+    ('POST /reconcile', 'admin', 'POST', lambda ctx: '/reconcile',
+     lambda ctx: {'file': (io.BytesIO(ctx.deductions_csv.encode()), 'ippis.csv'), 'month': ctx.month}),
+    ('POST /loan', 'member', 'POST', lambda ctx: '/loan', lambda ctx: ctx.loan_application()),
+    ('GET /api/v1/dashboard', 'member', 'GET', lambda ctx: '/api/v1/dashboard', None),
+    ('GET /api/v1/savings', 'member', 'GET', lambda ctx: '/api/v1/savings', None),
+    ('GET /api/v1/loan', 'member', 'GET', lambda ctx: '/api/v1/loan', None),
+    ('GET /api/v1/repayments', 'member', 'GET', lambda ctx: '/api/v1/repayments', None),
+    ('GET /api/v1/balance', 'member', 'GET', lambda ctx: f'/api/v1/balance?as_of={ctx.month}-01', None),
+    ('POST /register', 'anonymous', 'POST', lambda ctx: '/register', lambda ctx: {'name': ctx.next_name()}),
+    # Runs last: the anonymous session logged in by POST /login is dropped
+    ('GET /logout', 'anonymous', 'GET', lambda ctx: '/logout', None),
+]
+
+class Context:
+    def __init__(self, db, rng, members):
+        self.rng = rng
+        rows = db.execute('''SELECT u.id, u.name FROM users u
+                             WHERE u.is_admin = 0 AND u.id IN (SELECT user_id FROM loans)
+                             ORDER BY u.id LIMIT ?''', (members,)).fetchall()
+        self.member_ids = [row[0] for row in rows]
+        self.member_names = [row[1] for row in rows]
+        self.loan_ids = [row[0] for row in db.execute('SELECT id FROM loans ORDER BY id LIMIT 10000')]
+        self.repayment_ids = [row[0] for row in db.execute(
+            'SELECT r.id FROM repayments r JOIN loans l ON r.loan_id = l.id WHERE l.user_id = ?',
+            (self.member_ids[0],))]
+        self.applications = [row[0] for row in db.execute(
+            'SELECT id FROM loan_applications WHERE status = "pending" ORDER BY id')]
+        self.admin_name = db.execute('SELECT name FROM users WHERE is_admin = 1 LIMIT 1').fetchone()[0]
+        self.month = date.today().strftime('%Y-%m')
+        # Guarantors come from the far end of the member list, two new ones per
+        # application, so none reaches the guarantee limit
+        self.guarantor_staff_nos = [f'ECN{row[0]:06d}' for row in db.execute(
+            'SELECT id FROM users WHERE is_admin = 0 ORDER BY id DESC LIMIT 2000')]
+        self.applied = 0
+        self.registered = 0
+        # A payroll upload and an IPPIS deduction file covering the sampled members
+        self.payroll_csv = 'staff_id,amount\n' + ''.join(f'{user_id},5000\n' for user_id in self.member_ids)
+        self.deductions_csv = 'ippis_no,amount\n' + ''.join(f'IP{user_id:07d},20000\n'
+                                                             for user_id in self.member_ids)
+
+    def next_application(self):
+        return self.applications.pop() if self.applications else 0
+
+    def next_name(self):
+        self.registered += 1
+        return f'Bench Registrant {self.rng.randrange(10 ** 9):09d}-{self.registered}'
+
+    # Loan application form for the logged-in member (the first sampled one)
+    def loan_application(self):
+        first = self.applied * 2 % len(self.guarantor_staff_nos)
+        guarantors = self.guarantor_staff_nos[first:first + 2] or self.guarantor_staff_nos[:2]
+        self.applied += 1
+        form = {'type_of_loan': self.rng.choice(LOAN_TYPES), 'amount': str(self.rng.randint(10, 500) * 10000),
+                'duration': str(self.rng.choice((6, 12, 24))), 'ecn_staff_no': f'ECN{self.member_ids[0]:06d}',
+                'ippis_no': f'IP{self.member_ids[0]:07d}', 'designation': 'Engineer', 'phone_no': '08030000000',
+                'bank_name': 'First Bank', 'account_no': '0123456789', 'previous_month_salary': '350000'}
+        for position, staff_no in enumerate(guarantors, 1):
+            form.update({f'guarantor{position}_name': f'Guarantor {staff_no}',
+                         f'guarantor{position}_staff_no': staff_no,
+                         f'guarantor{position}_designation': 'Officer',
+                         f'guarantor{position}_phone_no': '08040000000'})
+        return form
+
+# Drive every route `requests` times through Flask's test client and return
+# per-route throughput and latency percentiles
+def run_benchmark(path, requests=200, warmup=10, members=50, seed=1, routes=None, log=print):
+    app = load_app(path)
+    with sqlite3.connect(path) as db:
+        ctx = Context(db, random.Random(seed), members)
+    clients = {'anonymous': app.test_client(), 'admin': app.test_client(), 'member': app.test_client()}
+    clients['admin'].post('/login', data={'name': ctx.admin_name})
+    # The member whose repayments are marked paid is the one logged in
+    clients['member'].post('/login', data={'name': ctx.member_names[0]})
+    selected = [route for route in ROUTES if not routes or route[0] in routes]
+    results = {}
+    for name, role, method, url, form in selected:
+        client = clients[role]
+        samples, errors = [], 0
+        for i in range(warmup + requests):
+            started = time.perf_counter()
+            response = client.open(url(ctx), method=method, data=form(ctx) if form else None)
+            response.get_data()
+            elapsed = time.perf_counter() - started
+            if response.status_code >= 400:
+                errors += 1
+            if i >= warmup:
+                samples.append(elapsed)
+        total = sum(samples)
+        results[name] = {
+            'requests': len(samples),
+            'errors': errors,
+            'throughput_rps': round(len(samples) / total, 1) if total else None,
+            'mean_ms': round(statistics.mean(samples) * 1000, 3),
+            'p50_ms': round(percentile(samples, 0.50) * 1000, 3),
+            'p95_ms': round(percentile(samples, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(samples, 0.99) * 1000, 3),
+        }
+        log(f"{name:34} {results[name]['throughput_rps']:>9} req/s  p50 {results[name]['p50_ms']:>8} ms  "
+            f"p95 {results[name]['p95_ms']:>8} ms  p99 {results[name]['p99_ms']:>8} ms  errors {errors}")
+    with sqlite3.connect(path) as db:
+        dataset = {table: db.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                   for table in ('users', 'savings', 'loans', 'repayments', 'loan_applications')}
+    return {
+        'meta': {
+            'timestamp': datetime.now().strftime('%Y-%m-%dT%H:%M:%S'),
+            'database': path,
+            'requests_per_route': requests,
+            'python': sys.version.split()[0],
+            'sqlite': sqlite3.sqlite_version,
+            'dataset': dataset,
+        },
+        'routes': results,
+    }
+
+# Read-only routes driven by the worker scaling run
+SCALE_ROUTES = ('/dashboard', '/savings', '/loan', '/repayments')
+
+# One forked worker: log in as its own member and drive the read routes for
+# `seconds`, returning the number of requests served
+def _scale_worker(app, member_name, seconds, results):
+    served, errors = 0, 0
+    try:
+        client = app.test_client()
+        client.post('/login', data={'name': member_name})
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            response = client.get(SCALE_ROUTES[served % len(SCALE_ROUTES)])
+            response.get_data()
+            served += 1
+            errors += response.status_code >= 400
+    except Exception:
+        errors += 1
+        raise
+    finally:
+        results.put((served, errors))
+
+# Aggregate read throughput with 1, 2, 4, ... forked workers sharing one
+# application created (and warmed with a request) in the parent, the way a
+# pre-fork server with --preload runs it. Each worker must open its own
+# connections, so this also checks the app is safe to fork.
+def run_scaling(path, workers=(1, 2, 4), seconds=5.0, members=50, seed=1, log=print):
+    import multiprocessing
+    app = load_app(path)
+    with sqlite3.connect(path) as db:
+        ctx = Context(db, random.Random(seed), members)
+    app.test_client().post('/login', data={'name': ctx.member_names[0]})  # parent holds open connections
+    fork = multiprocessing.get_context('fork')
+    results = {}
+    for count in workers:
+        queue = fork.Queue()
+        processes = [fork.Process(target=_scale_worker,
+                                  args=(app, ctx.member_names[i % len(ctx.member_names)], seconds, queue))
+                     for i in range(count)]
+        for process in processes:
+            process.start()
+        served = [queue.get() for _ in processes]
+        for process in processes:
+            process.join()
+        total = sum(requests for requests, _ in served)
+        results[count] = {
+            'requests': total,
+            'errors': sum(errors for _, errors in served),
+            'throughput_rps': round(total / seconds, 1),
+        }
+        log(f"{count:>3} worker(s) {results[count]['throughput_rps']:>9} req/s  errors {results[count]['errors']}")
+    return {'meta': {'cpus': os.cpu_count(), 'seconds': seconds, 'database': path}, 'workers': results}
+
+# Concurrent savings deposits (POST /add_savings) from `threads` admin
+# sessions for `seconds`, once with every request committing on its own and
+# once through the group-commit write queue
+def run_writes(path, threads=16, seconds=5.0, members=50, seed=1, log=print):
+    import threading
+    with sqlite3.connect(path) as db:
+        ctx = Context(db, random.Random(seed), members)
+    results = {}
+    for mode, config in (('direct', {}), ('write_queue', {'WRITE_QUEUE': True})):
+        app = load_app(path, **config)
+        counts = []
+
+        def deposit(index):
+            client = app.test_client()
+            client.post('/login', data={'name': ctx.admin_name})
+            served, errors = 0, 0
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                response = client.post('/add_savings', data={
+                    'staff_id': str(ctx.member_ids[(index + served) % len(ctx.member_ids)]), 'amount': '5000'})
+                served += 1
+                errors += response.status_code >= 400 or b'error' in response.data.lower()
+            counts.append((served, errors))
+        workers = [threading.Thread(target=deposit, args=(i,)) for i in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        total = sum(served for served, _ in counts)
+        results[mode] = {'requests': total, 'errors': sum(errors for _, errors in counts),
+                         'throughput_rps': round(total / seconds, 1)}
+        if config:
+            results[mode]['batches'] = app.extensions['write_queue'].snapshot()
+            app.extensions['write_queue'].stop()
+        log(f"{mode:12} {results[mode]['throughput_rps']:>9} writes/s  errors {results[mode]['errors']}")
+    return {'meta': {'threads': threads, 'seconds': seconds, 'database': path}, 'modes': results}
+
+# Compare two result files; returns the routes whose p95 grew by more than
+# `threshold` (a fraction)
+def compare(baseline, current, threshold=0.2, log=print):
+    regressions = []
+    for name, now in current['routes'].items():
+        before = baseline['routes'].get(name)
+        if not before or not before['p95_ms']:
+            continue
+        change = (now['p95_ms'] - before['p95_ms']) / before['p95_ms']
+        flag = ' REGRESSION' if change > threshold else ''
+        log(f"{name:34} p95 {before['p95_ms']:>8} -> {now['p95_ms']:>8} ms ({change:+.0%}){flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='ECN cooperative load test and benchmark suite.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser('generate', help='Build a synthetic dataset.')
+    generate.add_argument('--db', default=os.path.join(BASE_DIR, 'bench.db'))
+    generate.add_argument('--members', type=int, default=100000)
+    generate.add_argument('--savings-per-member', type=int, default=24)
+    generate.add_argument('--loans', type=int, default=20000)
+    generate.add_argument('--pending', type=int, default=2000)
+    generate.add_argument('--seed', type=int, default=1)
+
+    run = commands.add_parser('run', help='Drive every route and record latency.')
+    run.add_argument('--db', default=os.path.join(BASE_DIR, 'bench.db'))
+    run.add_argument('--requests', type=int, default=200)
+    run.add_argument('--warmup', type=int, default=10)
+    run.add_argument('--route', action='append', help='Only this route, e.g. "GET /savings" (repeatable).')
+    run.add_argument('--output', '-o', help='Write results as JSON.')
+    run.add_argument('--baseline', help='Compare with an earlier results file.')
+    run.add_argument('--threshold', type=float, default=0.2, help='Allowed p95 growth before failing.')
+
+    scale = commands.add_parser('scale', help='Measure read throughput with forked workers.')
+    scale.add_argument('--db', default=os.path.join(BASE_DIR, 'bench.db'))
+    scale.add_argument('--workers', default='1,2,4', help='Comma separated worker counts.')
+    scale.add_argument('--seconds', type=float, default=5.0)
+    scale.add_argument('--output', '-o', help='Write results as JSON.')
+
+    writes = commands.add_parser('writes', help='Measure concurrent write throughput with and without '
+                                                 'the write queue.')
+    writes.add_argument('--db', default=os.path.join(BASE_DIR, 'bench.db'))
+    writes.add_argument('--threads', type=int, default=16)
+    writes.add_argument('--seconds', type=float, default=5.0)
+    writes.add_argument('--output', '-o', help='Write results as JSON.')
+
+    diff = commands.add_parser('compare', help='Compare two results files.')
+    diff.add_argument('baseline')
+    diff.add_argument('current')
+    diff.add_argument('--threshold', type=float, default=0.2)
+
+    args = parser.parse_args(argv)
+    if args.command == 'generate':
+        generate_dataset(args.db, args.members, args.savings_per_member, args.loans, args.pending, args.seed)
+        return 0
+    if args.command == 'run':
+        results = run_benchmark(args.db, args.requests, args.warmup, routes=args.route)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=2)
+        if args.baseline:
+            with open(args.baseline) as f:
+                return 1 if compare(json.load(f), results, args.threshold) else 0
+        return 0
+    if args.command == 'scale':
+        results = run_scaling(args.db, [int(n) for n in args.workers.split(',')], args.seconds)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=2)
+        return 0 if not any(r['errors'] for r in results['workers'].values()) else 1
+    if args.command == 'writes':
+        results = run_writes(args.db, args.threads, args.seconds)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=2)
+        return 0 if not any(r['errors'] for r in results['modes'].values()) else 1
+    with open(args.baseline) as f, open(args.current) as g:
+        return 1 if compare(json.load(f), json.load(g), args.threshold) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
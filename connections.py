@@ -0,0 +1,112 @@
+import os
+import sqlite3
+import threading
+
+# Per-connection tuning applied every time a connection is opened. WAL lets
+# readers proceed while a writer commits, and the busy timeout makes writers
+# wait for the lock instead of failing with "database is locked".
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('busy_timeout', 5000),
+    ('foreign_keys', 'ON'),
+    ('mmap_size', 256 * 1024 * 1024),
+)
+
+# Number of prepared statements sqlite3 keeps compiled per connection
+STATEMENT_CACHE_SIZE = 256
+
+# Open a tuned connection to `path`
+def open_connection(path, pragmas=PRAGMAS, check_same_thread=True):
+    db = sqlite3.connect(path, timeout=5.0, cached_statements=STATEMENT_CACHE_SIZE,
+                         check_same_thread=check_same_thread)
+    for name, value in pragmas:
+        db.execute(f'PRAGMA {name} = {value}')
+    return db
+
+# Hands out one long-lived tuned connection per thread. Connections are kept
+# open between requests and reused; a forked worker never reuses a handle
+# inherited from its parent, it opens its own.
+class ConnectionManager:
+    def __init__(self, path, pragmas=PRAGMAS):
+        self.path = path
+        self.pragmas = pragmas
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._open = {}
+        self._pid = os.getpid()
+        self.stats = {'opened': 0, 'reused': 0, 'closed': 0, 'rolled_back': 0}
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            # Handles copied across fork belong to the parent; drop them unclosed
+            self._local = threading.local()
+            self._open = {}
+            self._pid = os.getpid()
+            self.stats = dict.fromkeys(self.stats, 0)
+
+    # Connection for the current thread, opened on first use
+    def get(self):
+        self._check_fork()
+        db = getattr(self._local, 'db', None)
+        if db is not None:
+            self._count('reused')
+            return db
+        self._close_orphans()
+        # Only the owning thread uses the handle; the manager may close it later
+        db = open_connection(self.path, self.pragmas, check_same_thread=False)
+        self._local.db = db
+        with self._lock:
+            self._open[threading.get_ident()] = db
+        self._count('opened')
+        return db
+
+    # Close connections whose owning thread has exited (servers that spawn a
+    # thread per request would otherwise leak one handle per thread)
+    def _close_orphans(self):
+        alive = {thread.ident for thread in threading.enumerate()}
+        with self._lock:
+            orphans = [ident for ident in self._open if ident not in alive]
+            handles = [self._open.pop(ident) for ident in orphans]
+        for db in handles:
+            db.close()
+            self._count('closed')
+
+    # Return the thread's connection after a request. The connection stays
+    # open, but a transaction the request left behind is rolled back so it
+    # cannot hold the write lock.
+    def release(self, db):
+        if db.in_transaction:
+            db.rollback()
+            self._count('rolled_back')
+
+    # Close the current thread's connection
+    def close(self):
+        db = getattr(self._local, 'db', None)
+        if db is not None:
+            self._local.db = None
+            with self._lock:
+                self._open.pop(threading.get_ident(), None)
+            db.close()
+            self._count('closed')
+
+    # Close every connection this manager has opened (e.g. at shutdown)
+    def close_all(self):
+        with self._lock:
+            handles, self._open = list(self._open.values()), {}
+        for db in handles:
+            db.close()
+            self._count('closed')
+        self._local = threading.local()
+
+    # Counters plus the reuse rate, for monitoring
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats, open=len(self._open))
+        requests = stats['opened'] + stats['reused']
+        stats['reuse_rate'] = round(stats['reused'] / requests, 4) if requests else 0.0
+        return stats
@@ -0,0 +1,80 @@
+import json
+import time
+
+from approvals import INTEREST_RATE
+
+# Default rules; the app reads its own copy from ELIGIBILITY_RULES
+#   savings_multiple: most a member may borrow, as a multiple of savings
+#   max_debt_service_ratio: most of the previous month's salary that may go
+#       to loan repayments, counting the loans already running
+#   max_concurrent_loans: running loans plus pending applications
+DEFAULT_RULES = {
+    'savings_multiple': 2.0,
+    'max_debt_service_ratio': 0.33,
+    'max_concurrent_loans': 2,
+}
+
+# Savings balance, running loans (approved with installments unpaid), their
+# monthly repayments and pending applications for each member, in one query
+# driven by the member ids
+def member_positions(db, user_ids):
+    rows = db.execute('''SELECT m.value,
+                                COALESCE((SELECT balance FROM savings_balances WHERE user_id = m.value), 0),
+                                COUNT(l.id), COALESCE(SUM(l.monthly_repayment), 0),
+                                (SELECT COUNT(*) FROM loan_applications a
+                                 WHERE a.user_id = m.value AND a.status = "pending")
+                         FROM json_each(?) m
+                         LEFT JOIN loans l ON l.user_id = m.value AND l.status = "approved"
+                              AND EXISTS (SELECT 1 FROM repayments r WHERE r.loan_id = l.id AND r.status = 0)
+                         GROUP BY m.value''', (json.dumps(sorted(set(user_ids))),))
+    return {user_id: {'savings': savings, 'running_loans': loans, 'monthly_obligations': obligations,
+                      'pending_applications': pending}
+            for user_id, savings, loans, obligations, pending in rows}
+
+# Decision ('eligible' or 'ineligible') and reason for one pending application
+# given the member's position (which already counts the application itself)
+def evaluate(position, amount, duration, salary, rules=DEFAULT_RULES):
+    if not amount or amount <= 0 or not duration or duration <= 0:
+        return 'ineligible', 'Amount and duration must be positive'
+    failures = []
+    limit = position['savings'] * rules['savings_multiple']
+    if amount > limit:
+        failures.append(f"Amount exceeds {rules['savings_multiple']:g}x savings (limit {limit:.2f})")
+    monthly = amount * (1 + INTEREST_RATE) / duration
+    if not salary or salary <= 0:
+        failures.append('No previous month salary to assess repayments against')
+    else:
+        ratio = (position['monthly_obligations'] + monthly) / salary
+        if ratio > rules['max_debt_service_ratio']:
+            failures.append(f"Repayments would take {ratio:.0%} of salary "
+                            f"(limit {rules['max_debt_service_ratio']:.0%})")
+    concurrent = position['running_loans'] + position['pending_applications']
+    if concurrent > rules['max_concurrent_loans']:
+        failures.append(f"{concurrent} loans running or pending (limit {rules['max_concurrent_loans']})")
+    if failures:
+        return 'ineligible', '; '.join(failures)
+    return 'eligible', 'Meets all eligibility rules'
+
+# Score pending applications (the given ids, or every pending one) and store
+# the decision on each. Runs in one transaction; returns a summary dict.
+def score_applications(db, application_ids=None, rules=DEFAULT_RULES):
+    started = time.perf_counter()
+    sql = '''SELECT id, user_id, amount, duration, previous_month_salary FROM loan_applications
+             WHERE status = "pending"'''
+    params = ()
+    if application_ids is not None:
+        sql += ' AND id IN (SELECT value FROM json_each(?))'
+        params = (json.dumps([int(i) for i in application_ids]),)
+    with db:
+        applications = db.execute(sql, params).fetchall()
+        positions = member_positions(db, [user_id for _, user_id, _, _, _ in applications])
+        decisions = [evaluate(positions[user_id], amount, duration, salary, rules) + (application_id,)
+                     for application_id, user_id, amount, duration, salary in applications]
+        db.executemany('UPDATE loan_applications SET eligibility = ?, eligibility_reason = ? WHERE id = ?',
+                       decisions)
+    return {
+        'scored': len(decisions),
+        'eligible': sum(1 for decision, _, _ in decisions if decision == 'eligible'),
+        'decisions': {application_id: (decision, reason) for decision, reason, application_id in decisions},
+        'seconds': round(time.perf_counter() - started, 4),
+    }
@@ -0,0 +1,65 @@
+import csv
+import io
+import zlib
+
+# Rows are pulled from the cursor in batches of this size and written out as
+# one CSV chunk, so memory stays flat however large the ledger is
+FETCH_SIZE = 500
+
+LOAN_COLUMNS = ('id', 'user_id', 'type_of_loan', 'amount', 'duration', 'ecn_staff_no', 'ippis_no',
+                'monthly_repayment', 'date', 'status', 'amount_approved', 'interest_charged', 'total_amount')
+REPAYMENT_COLUMNS = ('id', 'loan_id', 'user_id', 'ecn_staff_no', 'due_date', 'amount', 'status')
+
+# Loans ledger rows, optionally limited to a loan date range and a status
+def loan_rows(db, start='', end='', status=''):
+    return db.execute('''SELECT id, user_id, type_of_loan, amount, duration, ecn_staff_no, ippis_no,
+                                monthly_repayment, date, status, amount_approved, interest_charged, total_amount
+                         FROM loans
+                         WHERE date >= ? AND date <= ? AND (? = '' OR status = ?)
+                         ORDER BY date, id''', (start or '', end or '9999-12-31', status or '', status or ''))
+
+# Repayment schedule rows, optionally limited to a due date range and a
+# status ("paid" or "unpaid")
+def repayment_rows(db, start='', end='', status=''):
+    low, high = {'paid': (1, 1), 'unpaid': (0, 0)}.get(status or '', (0, 1))
+    return db.execute('''SELECT r.id, r.loan_id, l.user_id, l.ecn_staff_no, r.due_date, r.amount, r.status
+                         FROM repayments r JOIN loans l ON r.loan_id = l.id
+                         WHERE r.due_date >= ? AND r.due_date <= ? AND r.status BETWEEN ? AND ?
+                         ORDER BY r.due_date, r.id''', (start or '', end or '9999-12-31', low, high))
+
+# Stream a cursor as CSV text chunks, header first
+def iter_csv(cursor, columns, fetch_size=FETCH_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    while True:
+        rows = cursor.fetchmany(fetch_size)
+        if rows:
+            writer.writerows(rows)
+        chunk = buffer.getvalue()
+        if chunk:
+            yield chunk
+            buffer.seek(0)
+            buffer.truncate()
+        if not rows:
+            break
+
+# Gzip-compress a stream of text chunks on the fly
+def iter_gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+EXPORTS = {
+    'loans': (loan_rows, LOAN_COLUMNS),
+    'repayments': (repayment_rows, REPAYMENT_COLUMNS),
+}
+
+# Streaming export of one ledger: yields str chunks, or gzip bytes
+def export_ledger(db, ledger, start='', end='', status='', compress=False):
+    rows, columns = EXPORTS[ledger]
+    chunks = iter_csv(rows(db, start, end, status), columns)
+    return iter_gzip(chunks) if compress else chunks
@@ -0,0 +1,82 @@
+import json
+
+# Most loans one staff member may guarantee at a time: pending applications
+# plus approved loans with installments still unpaid
+MAX_GUARANTEES = 2
+
+SCHEMA = [
+    # One row per guarantor per application; loan_id is set on approval
+    '''CREATE TABLE IF NOT EXISTS guarantors (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            application_id INTEGER NOT NULL,
+            loan_id INTEGER,
+            position INTEGER NOT NULL,
+            staff_no TEXT NOT NULL,
+            name TEXT,
+            designation TEXT,
+            phone_no TEXT,
+            FOREIGN KEY (loan_id) REFERENCES loans(id)
+        )''',
+    'CREATE INDEX IF NOT EXISTS idx_guarantors_staff ON guarantors (staff_no)',
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_guarantors_application ON guarantors (application_id, position)',
+    'CREATE INDEX IF NOT EXISTS idx_guarantors_loan ON guarantors (loan_id)',
+] + [
+    # Backfill from the flat columns of applications still pending
+    f'''INSERT OR IGNORE INTO guarantors (application_id, position, staff_no, name, designation, phone_no)
+        SELECT id, {position}, trim(guarantor{position}_staff_no), guarantor{position}_name,
+               guarantor{position}_designation, guarantor{position}_phone_no
+        FROM loan_applications
+        WHERE trim(COALESCE(guarantor{position}_staff_no, '')) != '' AND status = "pending"'''
+    for position in (1, 2)
+]
+
+# Live guarantees per staff number, for the given staff numbers only. Each is
+# an index seek on staff_no plus one primary-key or index probe per guarantee,
+# and MAX_GUARANTEES bounds the guarantees per staff number.
+def guarantor_exposure(db, staff_nos):
+    rows = db.execute('''SELECT g.staff_no, COUNT(*) FROM guarantors g
+                         WHERE g.staff_no IN (SELECT value FROM json_each(?))
+                           AND (EXISTS (SELECT 1 FROM loan_applications a
+                                        WHERE a.id = g.application_id AND a.status = "pending")
+                                OR EXISTS (SELECT 1 FROM repayments r
+                                           WHERE r.loan_id = g.loan_id AND r.status = 0))
+                         GROUP BY g.staff_no''', (json.dumps(list(staff_nos)),))
+    exposure = dict.fromkeys(staff_nos, 0)
+    exposure.update(rows)
+    return exposure
+
+# Reason the guarantors can not back this application, or None.
+# `guarantors` is a list of dicts with staff_no, name, designation, phone_no.
+def check_guarantors(db, applicant_staff_no, guarantors):
+    staff_nos = [guarantor['staff_no'] for guarantor in guarantors]
+    if not all(staff_nos):
+        return 'Every guarantor needs a staff number'
+    if len(set(staff_nos)) < len(staff_nos):
+        return 'The two guarantors must be different people'
+    if applicant_staff_no in staff_nos:
+        return 'You can not guarantee your own loan'
+    for staff_no, count in guarantor_exposure(db, staff_nos).items():
+        if count >= MAX_GUARANTEES:
+            return f'Guarantor {staff_no} already guarantees {count} loan(s), the limit is {MAX_GUARANTEES}'
+    return None
+
+# Raised inside a write job when the guarantors can not back an application,
+# so the check and the insert that relies on it share one transaction
+class GuarantorError(Exception):
+    pass
+
+# Record an application's guarantors; runs inside the caller's transaction
+def add_guarantors(db, application_id, guarantors):
+    db.executemany('''INSERT INTO guarantors (application_id, position, staff_no, name, designation, phone_no)
+                      VALUES (?, ?, ?, ?, ?, ?)''',
+                   [(application_id, position, guarantor['staff_no'], guarantor['name'],
+                     guarantor['designation'], guarantor['phone_no'])
+                    for position, guarantor in enumerate(guarantors, 1)])
+
+# Point the guarantors of newly approved applications (a JSON id array) at
+# their loans; runs inside the approval transaction
+def attach_to_loans(db, application_ids):
+    db.execute('''UPDATE guarantors SET loan_id = l.id
+                  FROM loans l
+                  WHERE guarantors.application_id IN (SELECT value FROM json_each(?))
+                    AND l.application_id = guarantors.application_id''', (application_ids,))
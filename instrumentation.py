@@ -0,0 +1,167 @@
+import heapq
+import logging
+import re
+import threading
+import time
+
+from flask import before_render_template, g, request
+
+slow_log = logging.getLogger('ecn.slow_requests')
+
+# Histogram bucket upper bounds in milliseconds; the last bucket is open-ended
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r'\s+')
+
+# Collapse bound values and whitespace so executions of one statement
+# aggregate together
+def normalize_sql(sql):
+    return _SPACE.sub(' ', _LITERALS.sub('?', sql)).strip()
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms):
+        index = 0
+        while index < len(BUCKETS_MS) and ms > BUCKETS_MS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def snapshot(self):
+        labels = [f'le_{bound}' for bound in BUCKETS_MS] + ['inf']
+        return {
+            'count': self.count,
+            'total_ms': round(self.total_ms, 3),
+            'mean_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+            'max_ms': round(self.max_ms, 3),
+            'buckets': dict(zip(labels, self.counts)),
+        }
+
+# SQL issued during one request. sqlite3's trace callback fires as each
+# statement starts, so a statement's time runs until the next one starts,
+# template rendering begins or the request finishes (this includes stepping
+# through its rows).
+class RequestProfile:
+    def __init__(self):
+        self.statements = []
+        self._current = None
+
+    def on_statement(self, sql):
+        now = time.perf_counter()
+        self._finish(now)
+        self._current = (sql, now)
+
+    def _finish(self, now):
+        if self._current:
+            sql, started = self._current
+            self.statements.append((sql, (now - started) * 1000))
+            self._current = None
+
+    def pause(self):
+        self._finish(time.perf_counter())
+
+    def close(self):
+        self.pause()
+        return self.statements
+
+# Per-route wall time and per-statement SQL profiling for a Flask app.
+# Route timings go into histograms keyed by URL rule; statements are
+# aggregated by normalized text, and the top-N slowest single executions are
+# kept. Requests slower than `slow_request_ms` are logged to
+# `ecn.slow_requests` with their statement count.
+class Instrumentation:
+    def __init__(self, app=None, top_n=20, slow_request_ms=None):
+        self.top_n = top_n
+        self.slow_request_ms = slow_request_ms
+        self._lock = threading.Lock()
+        self.reset()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.top_n = app.config.get('METRICS_TOP_N', self.top_n)
+        self.slow_request_ms = app.config.get('SLOW_REQUEST_MS', self.slow_request_ms)
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+        before_render_template.connect(self._before_render, app)
+
+    def reset(self):
+        with self._lock:
+            self.routes = {}
+            self.queries = {}
+            self.slowest = []  # min-heap of (ms, sql, route)
+
+    # Trace every statement run on `db` for the rest of this request
+    def attach(self, db):
+        profile = g.get('sql_profile')
+        if profile is not None:
+            db.set_trace_callback(profile.on_statement)
+            g.sql_traced = db
+
+    def _before_request(self):
+        g.request_started = time.perf_counter()
+        g.sql_profile = RequestProfile()
+
+    def _before_render(self, sender, **extra):
+        profile = g.get('sql_profile')
+        if profile is not None:
+            profile.pause()
+
+    def _teardown_request(self, error):
+        started = g.pop('request_started', None)
+        profile = g.pop('sql_profile', None)
+        db = g.pop('sql_traced', None)
+        if db is not None:
+            db.set_trace_callback(None)
+        if started is None:
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        statements = profile.close() if profile else []
+        route = f"{request.method} {request.url_rule.rule if request.url_rule else '<unmatched>'}"
+        self.record(route, elapsed_ms, statements)
+        if self.slow_request_ms is not None and elapsed_ms >= self.slow_request_ms:
+            slow_log.warning('%s %s took %.1f ms with %d SQL statement(s) (%.1f ms)', request.method,
+                             request.full_path.rstrip('?'), elapsed_ms, len(statements), sum(ms for _, ms in statements))
+
+    def record(self, route, elapsed_ms, statements):
+        with self._lock:
+            stats = self.routes.get(route)
+            if stats is None:
+                stats = self.routes[route] = {'time': Histogram(), 'sql_count': 0, 'sql_ms': 0.0}
+            stats['time'].add(elapsed_ms)
+            stats['sql_count'] += len(statements)
+            stats['sql_ms'] += sum(ms for _, ms in statements)
+            for sql, ms in statements:
+                key = normalize_sql(sql)
+                query = self.queries.get(key)
+                if query is None:
+                    query = self.queries[key] = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+                query['count'] += 1
+                query['total_ms'] += ms
+                query['max_ms'] = max(query['max_ms'], ms)
+                entry = (ms, key, route)
+                if len(self.slowest) < self.top_n:
+                    heapq.heappush(self.slowest, entry)
+                elif ms > self.slowest[0][0]:
+                    heapq.heapreplace(self.slowest, entry)
+
+    def snapshot(self):
+        with self._lock:
+            routes = {route: dict(stats['time'].snapshot(), sql_count=stats['sql_count'],
+                                  sql_ms=round(stats['sql_ms'], 3))
+                      for route, stats in sorted(self.routes.items())}
+            by_total = sorted(self.queries.items(), key=lambda item: item[1]['total_ms'], reverse=True)
+            queries = [{'sql': sql, 'count': stats['count'], 'total_ms': round(stats['total_ms'], 3),
+                        'mean_ms': round(stats['total_ms'] / stats['count'], 3), 'max_ms': round(stats['max_ms'], 3)}
+                       for sql, stats in by_total[:self.top_n]]
+            slowest = [{'ms': round(ms, 3), 'sql': sql, 'route': route}
+                       for ms, sql, route in sorted(self.slowest, reverse=True)]
+        return {'routes': routes, 'top_queries': queries, 'slowest_queries': slowest}
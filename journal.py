@@ -0,0 +1,200 @@
+import time
+from datetime import datetime
+
+# Append-only journal of money events. Triggers on the ledger tables append
+# one signed entry per event, so every writer (routes, payroll upload, IPPIS
+# reconciliation, bulk approval) is covered:
+#   savings   deposit, reversal (posting deleted, or edited: the old posting
+#             is reversed and the new one deposited, each on its own date)
+#   loan      disbursed (+total owed), adjusted (total changed),
+#             repayment (-installment paid), repayment_reversed
+# A member's savings balance is the sum of their savings entries and their
+# loan balance (still owed) the sum of their loan entries. Paid installments
+# are never rewritten (see schedule.sync_schedule); archiving and schedule
+# rewrites of unpaid installments delete rows without touching the journal.
+# Events dated "today" use the local date, like the rest of the app.
+
+_ENTRY = '''INSERT INTO ledger_journal (user_id, account, kind, amount, entry_date, ref_table, ref_id)
+            VALUES ({user}, '{account}', '{kind}', {amount}, {date}, '{table}', {ref});'''
+
+_LOAN_OWNER = '(SELECT user_id FROM loans WHERE id = {row}.loan_id)'
+
+_TODAY = "date('now', 'localtime')"
+
+# (name, definition) of every journal trigger
+TRIGGERS = [
+    ('savings_journal_insert', f"""AFTER INSERT ON savings BEGIN
+            {_ENTRY.format(user='NEW.user_id', account='savings', kind='deposit', amount='NEW.amount',
+                           date='NEW.date', table='savings', ref='NEW.id')}
+        END"""),
+    ('savings_journal_update', f"""AFTER UPDATE OF user_id, amount, date ON savings BEGIN
+            {_ENTRY.format(user='OLD.user_id', account='savings', kind='reversal', amount='-OLD.amount',
+                           date='OLD.date', table='savings', ref='OLD.id')}
+            {_ENTRY.format(user='NEW.user_id', account='savings', kind='deposit', amount='NEW.amount',
+                           date='NEW.date', table='savings', ref='NEW.id')}
+        END"""),
+    ('savings_journal_delete', f"""AFTER DELETE ON savings BEGIN
+            {_ENTRY.format(user='OLD.user_id', account='savings', kind='reversal', amount='-OLD.amount',
+                           date=_TODAY, table='savings', ref='OLD.id')}
+        END"""),
+    ('loans_journal_insert', f"""AFTER INSERT ON loans
+        WHEN NEW.status = "approved" BEGIN
+            {_ENTRY.format(user='NEW.user_id', account='loan', kind='disbursed',
+                           amount='COALESCE(NEW.total_amount, 0)', date='NEW.date', table='loans', ref='NEW.id')}
+        END"""),
+    ('loans_journal_adjust', f"""AFTER UPDATE OF total_amount ON loans
+        WHEN NEW.status = "approved" AND COALESCE(NEW.total_amount, 0) != COALESCE(OLD.total_amount, 0) BEGIN
+            {_ENTRY.format(user='NEW.user_id', account='loan', kind='adjusted',
+                           amount='COALESCE(NEW.total_amount, 0) - COALESCE(OLD.total_amount, 0)',
+                           date=_TODAY, table='loans', ref='NEW.id')}
+        END"""),
+    ('repayments_journal_insert', f"""AFTER INSERT ON repayments
+        WHEN NEW.status = 1 BEGIN
+            {_ENTRY.format(user=_LOAN_OWNER.format(row='NEW'), account='loan', kind='repayment',
+                           amount='-NEW.amount', date='NEW.due_date', table='repayments', ref='NEW.id')}
+        END"""),
+    ('repayments_journal_paid', f"""AFTER UPDATE OF status ON repayments
+        WHEN NEW.status = 1 AND OLD.status = 0 BEGIN
+            {_ENTRY.format(user=_LOAN_OWNER.format(row='NEW'), account='loan', kind='repayment',
+                           amount='-NEW.amount', date=_TODAY, table='repayments', ref='NEW.id')}
+        END"""),
+    ('repayments_journal_unpaid', f"""AFTER UPDATE OF status ON repayments
+        WHEN NEW.status = 0 AND OLD.status = 1 BEGIN
+            {_ENTRY.format(user=_LOAN_OWNER.format(row='NEW'), account='loan', kind='repayment_reversed',
+                           amount='OLD.amount', date=_TODAY, table='repayments', ref='NEW.id')}
+        END"""),
+]
+
+# Triggers dropped since the journal was introduced
+_RETIRED_TRIGGERS = ('repayments_journal_amount',)
+
+def _create_triggers():
+    return [f'CREATE TRIGGER IF NOT EXISTS {name} {body}' for name, body in TRIGGERS]
+
+# Replace the journal triggers of an existing database with the current ones
+REBUILD_TRIGGERS = [f'DROP TRIGGER IF EXISTS {name}'
+                    for name in _RETIRED_TRIGGERS + tuple(name for name, _ in TRIGGERS)] + _create_triggers()
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS ledger_journal (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            account TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            amount REAL NOT NULL,
+            entry_date TEXT NOT NULL,
+            ref_table TEXT NOT NULL,
+            ref_id INTEGER,
+            recorded_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )''',
+    'CREATE INDEX IF NOT EXISTS idx_journal_user_date ON ledger_journal (user_id, entry_date, account, amount)',
+    'CREATE INDEX IF NOT EXISTS idx_journal_user ON ledger_journal (user_id)',
+    'CREATE INDEX IF NOT EXISTS idx_journal_date ON ledger_journal (entry_date)',
+    '''CREATE TRIGGER IF NOT EXISTS ledger_journal_no_update BEFORE UPDATE ON ledger_journal BEGIN
+            SELECT RAISE(ABORT, 'ledger_journal is append-only');
+        END''',
+    '''CREATE TRIGGER IF NOT EXISTS ledger_journal_no_delete BEFORE DELETE ON ledger_journal BEGIN
+            SELECT RAISE(ABORT, 'ledger_journal is append-only');
+        END''',
+    # Balances per member as of each checkpoint date, covering the entries
+    # dated on or before it and recorded up to journal_id
+    '''CREATE TABLE IF NOT EXISTS balance_snapshots (
+            user_id INTEGER NOT NULL,
+            as_of TEXT NOT NULL,
+            savings REAL NOT NULL,
+            loans REAL NOT NULL,
+            PRIMARY KEY (as_of, user_id)
+        ) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS balance_checkpoints (
+            as_of TEXT PRIMARY KEY,
+            journal_id INTEGER NOT NULL,
+            members INTEGER NOT NULL,
+            taken_at TEXT NOT NULL
+        )''',
+    # Existing ledger rows become opening entries; installments already paid
+    # are dated on their due date
+    '''INSERT INTO ledger_journal (user_id, account, kind, amount, entry_date, ref_table, ref_id)
+        SELECT user_id, 'savings', 'deposit', amount, date, 'savings', id FROM savings
+        WHERE NOT EXISTS (SELECT 1 FROM ledger_journal)
+        ORDER BY id''',
+    '''INSERT INTO ledger_journal (user_id, account, kind, amount, entry_date, ref_table, ref_id)
+        SELECT user_id, 'loan', 'disbursed', COALESCE(total_amount, 0), date, 'loans', id FROM loans
+        WHERE status = "approved" AND NOT EXISTS (SELECT 1 FROM ledger_journal WHERE ref_table = 'loans')
+        ORDER BY id''',
+    '''INSERT INTO ledger_journal (user_id, account, kind, amount, entry_date, ref_table, ref_id)
+        SELECT l.user_id, 'loan', 'repayment', -r.amount, r.due_date, 'repayments', r.id
+        FROM repayments r JOIN loans l ON l.id = r.loan_id
+        WHERE r.status = 1 AND NOT EXISTS (SELECT 1 FROM ledger_journal WHERE ref_table = 'repayments')
+        ORDER BY r.id''',
+] + _create_triggers()
+
+# Latest checkpoint on or before `as_of` as (as_of, journal_id), or None
+def checkpoint_before(db, as_of):
+    return db.execute('''SELECT as_of, journal_id FROM balance_checkpoints
+                         WHERE as_of <= ? ORDER BY as_of DESC LIMIT 1''', (as_of,)).fetchone()
+
+# Write a per-member balance checkpoint for `as_of` (YYYY-MM-DD, default
+# today), replacing one already taken for that date. It starts from the
+# previous checkpoint and adds only the journal tail since then: entries dated
+# after it, plus entries recorded after it but dated on or before it.
+# Returns a summary dict.
+def take_snapshot(db, as_of=None):
+    started = time.perf_counter()
+    as_of = as_of or datetime.now().strftime('%Y-%m-%d')
+    with db:
+        journal_id = db.execute('SELECT COALESCE(MAX(id), 0) FROM ledger_journal').fetchone()[0]
+        previous = db.execute('''SELECT as_of, journal_id FROM balance_checkpoints
+                                 WHERE as_of < ? ORDER BY as_of DESC LIMIT 1''', (as_of,)).fetchone()
+        previous_as_of, previous_id = previous or ('', 0)
+        db.execute('DELETE FROM balance_snapshots WHERE as_of = ?', (as_of,))
+        members = db.execute('''INSERT INTO balance_snapshots (user_id, as_of, savings, loans)
+                                SELECT user_id, ?, SUM(savings), SUM(loans) FROM (
+                                    SELECT user_id, savings, loans FROM balance_snapshots WHERE as_of = ?
+                                    UNION ALL
+                                    SELECT user_id, CASE account WHEN 'savings' THEN amount ELSE 0 END,
+                                           CASE account WHEN 'loan' THEN amount ELSE 0 END
+                                    FROM ledger_journal
+                                    WHERE entry_date > ? AND entry_date <= ? AND id <= ?
+                                    UNION ALL
+                                    SELECT user_id, CASE account WHEN 'savings' THEN amount ELSE 0 END,
+                                           CASE account WHEN 'loan' THEN amount ELSE 0 END
+                                    FROM ledger_journal
+                                    WHERE id > ? AND id <= ? AND entry_date <= ?
+                                )
+                                GROUP BY user_id''',
+                             (as_of, previous_as_of, previous_as_of, as_of, journal_id,
+                              previous_id, journal_id, previous_as_of)).rowcount
+        db.execute('''INSERT OR REPLACE INTO balance_checkpoints (as_of, journal_id, members, taken_at)
+                      VALUES (?, ?, ?, ?)''',
+                   (as_of, journal_id, members, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+    return {'as_of': as_of, 'members': members, 'journal_id': journal_id, 'previous': previous_as_of or None,
+            'seconds': round(time.perf_counter() - started, 4)}
+
+# A member's savings and loan balances as of the end of `as_of` (None: every
+# entry so far): their row in the latest checkpoint on or before that date
+# plus the journal entries that checkpoint does not cover; entries recorded
+# after the checkpoint are found by seeking (user_id, id), not by walking the
+# member's history up to the checkpoint date
+def balance_as_of(db, user_id, as_of=None):
+    checkpoint = checkpoint_before(db, as_of or '9999-12-31')
+    savings, loans, tail = 0.0, 0.0, 0
+    if checkpoint:
+        row = db.execute('SELECT savings, loans FROM balance_snapshots WHERE user_id = ? AND as_of = ?',
+                         (user_id, checkpoint[0])).fetchone()
+        if row:
+            savings, loans = row
+    checkpoint_as_of, checkpoint_id = checkpoint or ('', 0)
+    for account, amount in db.execute('''SELECT account, amount FROM ledger_journal
+                                         WHERE user_id = ? AND entry_date > ? AND entry_date <= ?
+                                         UNION ALL
+                                         SELECT account, amount FROM ledger_journal
+                                         WHERE user_id = ? AND id > ? AND +entry_date <= ?''',
+                                      (user_id, checkpoint_as_of, as_of or '9999-12-31',
+                                       user_id, checkpoint_id, checkpoint_as_of)):
+        tail += 1
+        if account == 'savings':
+            savings += amount
+        else:
+            loans += amount
+    return {'user_id': user_id, 'as_of': as_of, 'savings': round(savings, 2), 'loans': round(loans, 2),
+            'checkpoint': checkpoint_as_of or None, 'tail_entries': tail}
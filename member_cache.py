@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Bounded in-process LRU cache with a TTL. Entries are dropped on write via
+# invalidate(); the TTL bounds staleness for writes made by other processes.
+class LRUCache:
+    def __init__(self, max_size=10000, ttl=300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    # Cached value for `key`, or compute it with `load()` and cache it
+    def get(self, key, load):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry[1]
+            self.stats['misses'] += 1
+        value = load()
+        with self._lock:
+            self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+        return value
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self.stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self.stats['invalidations'] += len(self._entries)
+            self._entries.clear()
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats, size=len(self._entries), max_size=self.max_size, ttl=self.ttl)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
+
+# A member's position: name, admin flag, savings total, outstanding repayment
+# balance and the next unpaid installment (due date, amount), or None if the
+# member does not exist
+def load_member_summary(db, user_id):
+    user = db.execute('SELECT name, is_admin FROM users WHERE id = ?', (user_id,)).fetchone()
+    if not user:
+        return None
+    savings = db.execute('SELECT balance FROM savings_balances WHERE user_id = ?', (user_id,)).fetchone()
+    outstanding, next_due = db.execute('''
+        SELECT COALESCE(SUM(r.amount), 0), MIN(r.due_date)
+        FROM loans l JOIN repayments r ON r.loan_id = l.id
+        WHERE l.user_id = ? AND l.status = "approved" AND r.status = 0
+    ''', (user_id,)).fetchone()
+    next_repayment = None
+    if next_due:
+        next_repayment = db.execute('''
+            SELECT r.due_date, SUM(r.amount)
+            FROM loans l JOIN repayments r ON r.loan_id = l.id
+            WHERE l.user_id = ? AND l.status = "approved" AND r.status = 0 AND r.due_date = ?
+        ''', (user_id, next_due)).fetchone()
+    return {
+        'name': user[0],
+        'is_admin': user[1],
+        'savings_total': savings[0] if savings else 0,
+        'outstanding': outstanding,
+        'next_repayment': tuple(next_repayment) if next_repayment else None,
+    }
@@ -0,0 +1,73 @@
+import re
+
+# Most matches a typeahead lookup returns
+DEFAULT_LIMIT = 10
+
+# Staff and IPPIS numbers are only captured on loan applications; a member's
+# latest application (or loan, for members approved before this index existed)
+# supplies them
+_LATEST = '''COALESCE((SELECT {column} FROM loan_applications WHERE user_id = u.id ORDER BY id DESC LIMIT 1),
+                       (SELECT {column} FROM loans WHERE user_id = u.id ORDER BY id DESC LIMIT 1), '')'''
+
+SCHEMA = [
+    # Full-text index over members, rowid = users.id. The prefix indexes make
+    # 2 and 3 character typeahead prefixes a single index lookup.
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS member_search USING fts5 (
+            name, ecn_staff_no, ippis_no, is_admin UNINDEXED,
+            tokenize = "unicode61", prefix = "2 3"
+        )''',
+    f'''INSERT INTO member_search (rowid, name, ecn_staff_no, ippis_no, is_admin)
+        SELECT u.id, u.name, {_LATEST.format(column='ecn_staff_no')}, {_LATEST.format(column='ippis_no')},
+               u.is_admin
+        FROM users u
+        WHERE u.id NOT IN (SELECT rowid FROM member_search)''',
+    '''CREATE TRIGGER IF NOT EXISTS users_search_insert AFTER INSERT ON users BEGIN
+            INSERT INTO member_search (rowid, name, ecn_staff_no, ippis_no, is_admin)
+            VALUES (NEW.id, NEW.name, '', '', NEW.is_admin);
+        END''',
+    '''CREATE TRIGGER IF NOT EXISTS users_search_update AFTER UPDATE OF name, is_admin ON users BEGIN
+            UPDATE member_search SET name = NEW.name, is_admin = NEW.is_admin WHERE rowid = NEW.id;
+        END''',
+    '''CREATE TRIGGER IF NOT EXISTS users_search_delete AFTER DELETE ON users BEGIN
+            DELETE FROM member_search WHERE rowid = OLD.id;
+        END''',
+    # The identifiers on a new application replace the ones indexed so far
+    '''CREATE TRIGGER IF NOT EXISTS loan_applications_search_insert AFTER INSERT ON loan_applications
+        BEGIN
+            UPDATE member_search
+            SET ecn_staff_no = COALESCE(NEW.ecn_staff_no, ''), ippis_no = COALESCE(NEW.ippis_no, '')
+            WHERE rowid = NEW.user_id
+              AND (ecn_staff_no IS NOT COALESCE(NEW.ecn_staff_no, '')
+                   OR ippis_no IS NOT COALESCE(NEW.ippis_no, ''));
+        END''',
+]
+
+_TERM = re.compile(r'\w+')
+
+# FTS5 query matching rows where every word of `text` starts some indexed
+# word (name part, staff number, IPPIS number), or None if `text` has no words
+def match_expression(text):
+    terms = _TERM.findall(text)
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+# Top matches for a typeahead query as (id, name, ecn_staff_no, ippis_no)
+# rows: members whose staff or IPPIS number is exactly `text` first, then
+# prefix matches in member id order. Prefix matches are not ranked: ranking
+# every hit of a one or two letter prefix costs 50-150ms over 100k members,
+# while taking the first `limit` hits in rowid order stops early.
+# members_only leaves admins out.
+def search_members(db, text, limit=DEFAULT_LIMIT, members_only=False):
+    match = match_expression(text)
+    if match is None:
+        return []
+    identifier = '{ecn_staff_no ippis_no} : ' + ' '.join(f'"{term}"' for term in _TERM.findall(text))
+    rows = []
+    for expression in (identifier, match):
+        for row in db.execute('''SELECT rowid, name, ecn_staff_no, ippis_no FROM member_search
+                                 WHERE member_search MATCH ? AND (? = 0 OR is_admin = 0)
+                                 LIMIT ?''', (expression, int(members_only), limit)):
+            if row not in rows:
+                rows.append(row)
+    return rows[:limit]
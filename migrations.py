@@ -0,0 +1,198 @@
+import sqlite3
+from datetime import datetime
+
+import arrears
+import guarantors
+import journal
+import member_search
+import rollup
+import versions
+
+# Refuse to build the unique name index over duplicate accounts; those have to
+# be merged by hand before the migration can run.
+def _check_unique_user_names(db):
+    duplicates = db.execute('SELECT name FROM users GROUP BY name HAVING COUNT(*) > 1').fetchall()
+    if duplicates:
+        names = ', '.join(name for name, in duplicates)
+        raise sqlite3.IntegrityError(f"Duplicate user names must be merged before migrating: {names}")
+
+# Step that adds a column unless it already exists (ALTER TABLE has no
+# IF NOT EXISTS form)
+def _add_column(table, column, declaration):
+    def step(db):
+        columns = [row[1] for row in db.execute(f'PRAGMA table_info({table})')]
+        if column not in columns:
+            db.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+    return step
+
+# Ordered schema migrations. Each entry is (version, description, steps) where
+# every step is either an SQL string or a callable taking the connection.
+# Steps must be idempotent so a migration can be re-applied safely against a
+# database that was created by the old drop-and-recreate init_db().
+MIGRATIONS = [
+    (1, 'initial schema', [
+        '''CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                is_admin INTEGER NOT NULL DEFAULT 0
+            )''',
+        '''CREATE TABLE IF NOT EXISTS savings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                amount REAL,
+                date TEXT,
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            )''',
+        '''CREATE TABLE IF NOT EXISTS loan_applications (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                type_of_loan TEXT,
+                amount REAL,
+                duration INTEGER,
+                ecn_staff_no TEXT,
+                ippis_no TEXT,
+                designation TEXT,
+                phone_no TEXT,
+                bank_name TEXT,
+                account_no TEXT,
+                previous_month_salary REAL,
+                guarantor1_name TEXT,
+                guarantor1_staff_no TEXT,
+                guarantor1_designation TEXT,
+                guarantor1_phone_no TEXT,
+                guarantor2_name TEXT,
+                guarantor2_staff_no TEXT,
+                guarantor2_designation TEXT,
+                guarantor2_phone_no TEXT,
+                date TEXT,
+                status TEXT DEFAULT 'pending',
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            )''',
+        '''CREATE TABLE IF NOT EXISTS loans (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                type_of_loan TEXT,
+                amount REAL,
+                duration INTEGER,
+                ecn_staff_no TEXT,
+                ippis_no TEXT,
+                designation TEXT,
+                phone_no TEXT,
+                bank_name TEXT,
+                account_no TEXT,
+                previous_month_salary REAL,
+                monthly_repayment REAL,
+                date TEXT,
+                status TEXT,
+                amount_approved REAL,
+                interest_charged REAL,
+                total_amount REAL,
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            )''',
+        '''CREATE TABLE IF NOT EXISTS repayments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                loan_id INTEGER,
+                due_date TEXT,
+                amount REAL,
+                status INTEGER DEFAULT 0,  -- 0 for unpaid, 1 for paid
+                FOREIGN KEY (loan_id) REFERENCES loans(id)
+            )''',
+        # Sample accounts, only seeded once
+        '''INSERT INTO users (name, is_admin)
+           SELECT 'TestUser', 0 WHERE NOT EXISTS (SELECT 1 FROM users WHERE name = 'TestUser')''',
+        '''INSERT INTO users (name, is_admin)
+           SELECT 'AdminUser', 1 WHERE NOT EXISTS (SELECT 1 FROM users WHERE name = 'AdminUser')''',
+    ]),
+    (2, 'secondary indexes for route queries', [
+        _check_unique_user_names,
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_users_name ON users (name)',
+        'CREATE INDEX IF NOT EXISTS idx_users_is_admin ON users (is_admin, name)',
+        'CREATE INDEX IF NOT EXISTS idx_savings_user_date ON savings (user_id, date, amount)',
+        'CREATE INDEX IF NOT EXISTS idx_loan_applications_status ON loan_applications (status, user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_loans_user_status ON loans (user_id, status)',
+        'CREATE INDEX IF NOT EXISTS idx_repayments_loan_due ON repayments (loan_id, due_date)',
+    ]),
+    (3, 'savings rollup tables', rollup.SCHEMA + [rollup.rebuild_savings_rollup]),
+    (4, 'keyset pagination indexes', [
+        # (status) alone keeps pending applications in id order for paging
+        'DROP INDEX IF EXISTS idx_loan_applications_status',
+        'CREATE INDEX IF NOT EXISTS idx_loan_applications_status ON loan_applications (status)',
+        'CREATE INDEX IF NOT EXISTS idx_loan_applications_user_status ON loan_applications (user_id, status)',
+    ]),
+    (5, 'link loans to their application', [
+        _add_column('loans', 'application_id', 'INTEGER'),
+        'CREATE INDEX IF NOT EXISTS idx_loans_application ON loans (application_id)',
+    ]),
+    (6, 'ledger export indexes', [
+        'CREATE INDEX IF NOT EXISTS idx_loans_date ON loans (date)',
+        'CREATE INDEX IF NOT EXISTS idx_repayments_due ON repayments (due_date)',
+    ]),
+    (7, 'arrears flags and snapshots',
+        [_add_column('repayments', 'days_past_due', 'INTEGER NOT NULL DEFAULT 0')] + arrears.SCHEMA),
+    (8, 'normalized guarantors', guarantors.SCHEMA),
+    (9, 'application eligibility decisions', [
+        _add_column('loan_applications', 'eligibility', 'TEXT'),
+        _add_column('loan_applications', 'eligibility_reason', 'TEXT'),
+    ]),
+    (10, 'per-member data versions', versions.SCHEMA),
+    (11, 'member search index', member_search.SCHEMA),
+    (12, 'money event journal and balance checkpoints', journal.SCHEMA),
+    (13, 'journal savings edits and local dates', journal.REBUILD_TRIGGERS),
+    (14, 'loan book version', versions.BOOK_SCHEMA),
+]
+
+SCHEMA_VERSION_DDL = '''CREATE TABLE IF NOT EXISTS schema_version (
+                            version INTEGER PRIMARY KEY,
+                            description TEXT NOT NULL,
+                            applied_at TEXT NOT NULL
+                        )'''
+
+# Highest migration version applied to the database (0 for a fresh file)
+def current_version(db):
+    row = db.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'").fetchone()
+    if not row:
+        return 0
+    return db.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+# Migrations that have not been applied yet, in order
+def pending_migrations(db):
+    version = current_version(db)
+    return [m for m in sorted(MIGRATIONS, key=lambda m: m[0]) if m[0] > version]
+
+# Apply every pending migration, each in its own transaction.
+# Returns the list of (version, description) that were applied. Each
+# transaction takes the write lock up front and re-reads the version, so
+# processes migrating the same file at once apply every migration exactly once.
+def migrate(db, target=None, log=print):
+    db.execute(SCHEMA_VERSION_DDL)
+    applied = []
+    for version, description, steps in pending_migrations(db):
+        if target is not None and version > target:
+            break
+        try:
+            db.execute('BEGIN IMMEDIATE')
+            if current_version(db) >= version:
+                db.rollback()  # applied by another process meanwhile
+                continue
+            log(f"Applying migration {version}: {description}")
+            for step in steps:
+                if callable(step):
+                    step(db)
+                else:
+                    db.execute(step)
+            db.execute('INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)',
+                       (version, description, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+            db.commit()
+        except sqlite3.Error:
+            db.rollback()
+            raise
+        applied.append((version, description))
+    return applied
+
+# Apply migrations to the database file at `path`
+def migrate_database(path, target=None, log=print):
+    db = sqlite3.connect(path, timeout=60)  # wait out another process's migration
+    try:
+        return migrate(db, target=target, log=log)
+    finally:
+        db.close()
@@ -0,0 +1,80 @@
+import base64
+import json
+from collections import namedtuple
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# One page of rows plus opaque cursors for the neighbouring pages (None when
+# there is no such page)
+Page = namedtuple('Page', 'rows next_cursor prev_cursor')
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode()).decode().rstrip('=')
+
+def decode_cursor(token):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (ValueError, TypeError):
+        return None
+    return values if isinstance(values, list) else None
+
+# Page size and cursors from request args. The page size is clamped to
+# MAX_PAGE_SIZE and malformed cursors are ignored (first page).
+def page_args(args):
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        limit = DEFAULT_PAGE_SIZE
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    after = decode_cursor(args['after']) if args.get('after') else None
+    before = decode_cursor(args['before']) if args.get('before') else None
+    return {'after': after, 'before': None if after else before, 'limit': limit}
+
+# Fill the {seek} and {order} slots of a keyset query. `keys` are the ORDER BY
+# expressions, unique together; the seek predicate compares them as a row value
+# so SQLite can start the index range at the cursor.
+def render_sql(sql, keys, seek=None, descending=False):
+    direction = ' DESC' if descending else ''
+    order = ', '.join(key + direction for key in keys)
+    if seek is None:
+        return sql.format(seek='', order=order)
+    columns = keys[0] if len(keys) == 1 else '(' + ', '.join(keys) + ')'
+    values = '?' if len(keys) == 1 else '(' + ', '.join('?' * len(keys)) + ')'
+    return sql.format(seek=f'AND {columns} {seek} {values}', order=order)
+
+# A decoded cursor is usable with `keys` when it holds one scalar per key;
+# anything else is ignored like a malformed token (first page)
+def _fits(values, keys):
+    return values is not None and len(values) == len(keys) and \
+        all(isinstance(value, (str, int, float)) and not isinstance(value, bool) for value in values)
+
+# Run a keyset-paginated query. `sql` must contain a WHERE clause followed by
+# a {seek} slot, then ORDER BY {order} LIMIT ?; `key` maps a row to its values
+# for `keys`. Reads at most limit + 1 rows whichever page is requested.
+def paginate(db, sql, params, keys, key, after=None, before=None, limit=DEFAULT_PAGE_SIZE):
+    params = tuple(params)
+    after = after if _fits(after, keys) else None
+    before = before if _fits(before, keys) else None
+    if before is not None:
+        rows = db.execute(render_sql(sql, keys, '<', descending=True),
+                          params + tuple(before) + (limit + 1,)).fetchall()
+        more_before = len(rows) > limit
+        rows = rows[:limit][::-1]
+        return Page(rows,
+                    encode_cursor(key(rows[-1])) if rows else encode_cursor(before),
+                    encode_cursor(key(rows[0])) if more_before else None)
+    if after is not None:
+        rows = db.execute(render_sql(sql, keys, '>'), params + tuple(after) + (limit + 1,)).fetchall()
+    else:
+        rows = db.execute(render_sql(sql, keys), params + (limit + 1,)).fetchall()
+    more_after = len(rows) > limit
+    rows = rows[:limit]
+    prev_cursor = None
+    if after is not None:
+        prev_cursor = encode_cursor(key(rows[0])) if rows else encode_cursor(after)
+    return Page(rows, encode_cursor(key(rows[-1])) if more_after else None, prev_cursor)
+
+# Upper bound for a name prefix range: name >= prefix AND name < prefix_end(prefix)
+def prefix_end(prefix):
+    return prefix + '\U0010ffff'
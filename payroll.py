@@ -0,0 +1,62 @@
+import csv
+import math
+from datetime import datetime
+from itertools import islice
+
+REQUIRED_COLUMNS = ('staff_id', 'amount')
+
+# Validate one CSV row against the preloaded staff id set.
+# Returns (user_id, amount, date) or raises ValueError with the reject reason.
+def parse_row(row, staff_ids, default_date):
+    try:
+        staff_id = int(row['staff_id'])
+    except (TypeError, ValueError):
+        raise ValueError('Invalid Staff ID')
+    if staff_id not in staff_ids:
+        raise ValueError('Unknown Staff ID')
+    try:
+        amount = float(row['amount'])
+    except (TypeError, ValueError):
+        raise ValueError('Invalid amount')
+    if not math.isfinite(amount):
+        raise ValueError('Invalid amount')
+    if amount <= 0:
+        raise ValueError('Amount must be positive')
+    date = (row.get('date') or '').strip() or default_date
+    try:
+        datetime.strptime(date, '%Y-%m-%d')
+    except ValueError:
+        raise ValueError('Invalid date, expected YYYY-MM-DD')
+    return staff_id, amount, date
+
+# Stream a payroll deduction CSV (header: staff_id,amount[,date]) into the
+# savings ledger. Rows are validated against one preloaded set of user ids and
+# inserted `chunk_size` at a time, one transaction per chunk, so memory use is
+# bounded by the chunk and not the file. Rejected rows are reported with their
+# line number and do not stop the run.
+def post_savings_csv(db, lines, chunk_size=1000, default_date=None):
+    default_date = default_date or datetime.now().strftime('%Y-%m-%d')
+    summary = {'posted': 0, 'total_amount': 0.0, 'rejected': []}
+    reader = csv.DictReader(lines)
+    missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or [])]
+    if missing:
+        summary['rejected'].append((1, f"Missing column(s): {', '.join(missing)}"))
+        return summary
+    staff_ids = {row[0] for row in db.execute('SELECT id FROM users')}
+    numbered = ((reader.line_num, row) for row in reader)
+    while True:
+        chunk = list(islice(numbered, chunk_size))
+        if not chunk:
+            break
+        batch = []
+        for line_num, row in chunk:
+            try:
+                batch.append(parse_row(row, staff_ids, default_date))
+            except ValueError as e:
+                summary['rejected'].append((line_num, str(e)))
+        if batch:
+            with db:
+                db.executemany('INSERT INTO savings (user_id, amount, date) VALUES (?, ?, ?)', batch)
+            summary['posted'] += len(batch)
+            summary['total_amount'] += sum(amount for _, amount, _ in batch)
+    return summary
@@ -0,0 +1,293 @@
+import ast
+import importlib
+import os
+import random
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+
+import archive
+from migrations import migrate
+from pagination import render_sql
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Statements that are expected to read a whole table, keyed by
+# (file name, enclosing function). Anything else that plans a SCAN fails.
+ALLOWED_FULL_SCANS = {
+    ('migrations.py', '_check_unique_user_names'): 'one-off migration pre-check',
+    ('payroll.py', 'post_savings_csv'): 'preloads every staff id once per upload',
+    ('rollup.py', 'rebuild_savings_rollup'): 'backfill recomputes rollups from the whole ledger',
+    ('ECN_corp_app.py', 'rebuild_savings_rollup_command'): 'reports member count after a rebuild',
+    ('arrears.py', 'run_arrears'): 'walks the partial index of overdue installments only',
+    ('analytics.py', 'portfolio_summary'): 'aggregates the whole approved loan book in one grouped pass',
+    ('analytics.py', 'portfolio_distribution'): 'reads every approved loan once for the percentile snapshot',
+}
+
+# Tooling that is not part of the running app
+EXCLUDED_FILES = {'queryplan.py', 'benchmark.py'}
+
+# Only plain DML is planned; DDL, PRAGMAs and schema lookups are skipped
+PLANNED_PREFIXES = ('SELECT', 'UPDATE', 'DELETE', 'INSERT', 'REPLACE', 'WITH')
+
+# Statements whose SQL is built at runtime in a way collect_statements cannot
+# resolve, keyed like ALLOWED_FULL_SCANS. Any other unresolved statement fails.
+DYNAMIC_SQL = {
+    ('migrations.py', 'migrate'): 'runs the steps of each migration (one-off DDL and backfills)',
+    ('pagination.py', 'paginate'): 'keyset queries are planned at each paginate() call site',
+    ('archive.py', 'archive_settled_loans'): 'copies use the live column list read from the schema; '
+                                             'rows are picked from a bound json_each id list',
+}
+
+# Module-level string (or tuple) `name` of an application module, read by
+# importing it: constants built with joins and comprehensions resolve too
+def _module_value(file_name, name):
+    try:
+        value = getattr(importlib.import_module(file_name[:-3]), name)
+    except Exception:
+        return None
+    return value if isinstance(value, (str, tuple, list)) else None
+
+# Every SQL text `node` can evaluate to, or None if some part of it is not
+# known statically. Names resolve through `env` (loop variables), then
+# `lookup(name)`.
+def _resolve(node, env, lookup):
+    if isinstance(node, ast.Constant):
+        return [node.value] if isinstance(node.value, str) else None
+    if isinstance(node, ast.Name):
+        if node.id in env:
+            return [str(env[node.id])]
+        return lookup(node.id)
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+        left, right = _resolve(node.left, env, lookup), _resolve(node.right, env, lookup)
+        if left is None or right is None:
+            return None
+        return [a + b for a in left for b in right]
+    if isinstance(node, ast.JoinedStr):
+        texts = ['']
+        for part in node.values:
+            if isinstance(part, ast.FormattedValue):
+                if part.conversion != -1 or part.format_spec is not None:
+                    return None
+                part = part.value
+            values = _resolve(part, env, lookup)
+            if values is None:
+                return None
+            texts = [a + b for a in texts for b in values]
+        return texts
+    return None
+
+# Leading literal text of an SQL argument, whether or not the rest resolves
+def _head(node):
+    if isinstance(node, ast.JoinedStr) and node.values and isinstance(node.values[0], ast.Constant):
+        return node.values[0].value
+    if isinstance(node, ast.BinOp):
+        return _head(node.left)
+    return node.value if isinstance(node, ast.Constant) and isinstance(node.value, str) else ''
+
+# Bindings of the loop variables `arg` uses, for the call at `node`: one dict
+# per iteration of every enclosing `for` over a literal or module-level
+# sequence (None if such a loop is over anything else)
+def _loop_bindings(node, arg, parents, file_name):
+    used = {name.id for name in ast.walk(arg) if isinstance(name, ast.Name)}
+    envs = [{}]
+    while node in parents:
+        child, node = node, parents[node]
+        if not isinstance(node, ast.For) or child is node.iter:
+            continue
+        if not used & {name.id for name in ast.walk(node.target) if isinstance(name, ast.Name)}:
+            continue
+        if isinstance(node.iter, ast.Name):
+            items = _module_value(file_name, node.iter.id)
+        else:
+            try:
+                items = ast.literal_eval(node.iter)
+            except ValueError:
+                items = None
+        if items is None:
+            return None
+        names = [node.target] if isinstance(node.target, ast.Name) else getattr(node.target, 'elts', None)
+        if not names or not all(isinstance(name, ast.Name) for name in names):
+            return None
+        bindings = []
+        for item in items:
+            values = [item] if isinstance(node.target, ast.Name) else list(item)
+            bindings.append({name.id: value for name, value in zip(names, values)})
+        envs = [dict(env, **binding) for env in envs for binding in bindings]
+    return envs
+
+# Every value the local `name` can hold at `line` of `function`: its one
+# assignment, extended by each later `name += ...`; appends made under an
+# `if` are optional, so each combination is a variant
+def _local_values(function, parents, name, line, file_name, lookup):
+    assigns = [node for node in ast.walk(function)
+               if isinstance(node, ast.Assign) and node.lineno < line
+               and any(isinstance(target, ast.Name) and target.id == name for target in node.targets)]
+    if not assigns:
+        value = _module_value(file_name, name)
+        return [value] if isinstance(value, str) else None
+    if len(assigns) > 1:
+        return None
+    values = _resolve(assigns[0].value, {}, lookup)
+    appends = sorted((node for node in ast.walk(function)
+                      if isinstance(node, ast.AugAssign) and isinstance(node.op, ast.Add)
+                      and isinstance(node.target, ast.Name) and node.target.id == name
+                      and assigns[0].lineno < node.lineno < line), key=lambda node: node.lineno)
+    for append in appends:
+        suffixes = _resolve(append.value, {}, lookup)
+        if values is None or suffixes is None:
+            return None
+        optional, node = False, append
+        while node in parents and node is not function:
+            node = parents[node]
+            optional = optional or isinstance(node, (ast.If, ast.For, ast.While, ast.Try))
+        values = [value + suffix for value in values for suffix in suffixes] + (values if optional else [])
+    return values
+
+# Collect the SQL passed to execute()/executemany() or used as a keyset query
+# with paginate() in the application modules, as (file name, line, function,
+# sql). String literals, module constants, locals built up with +=, f-strings
+# over those and loop variables over literal sequences are resolved, one
+# statement per variant; anything else is collected with sql None.
+def collect_statements(base_dir=BASE_DIR):
+    statements = []
+    for file_name in sorted(os.listdir(base_dir)):
+        if not file_name.endswith('.py') or file_name in EXCLUDED_FILES:
+            continue
+        with open(os.path.join(base_dir, file_name), encoding='utf-8') as f:
+            try:
+                tree = ast.parse(f.read())
+            except SyntaxError:
+                continue  # App_html.py holds templates, not Python
+        for function in ast.walk(tree):
+            if not isinstance(function, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                continue
+            parents = {child: node for node in ast.walk(function) for child in ast.iter_child_nodes(node)}
+            for node in ast.walk(function):
+                if not isinstance(node, ast.Call):
+                    continue
+                name = getattr(node.func, 'attr', getattr(node.func, 'id', None))
+                if name in ('execute', 'executemany') and node.args:
+                    arg = node.args[0]
+                elif name == 'paginate' and len(node.args) >= 4:
+                    arg = node.args[1]
+                else:
+                    continue
+
+                def lookup(local, line=node.lineno):
+                    return _local_values(function, parents, local, line, file_name, lookup)
+
+                envs = _loop_bindings(node, arg, parents, file_name)
+                variants = None
+                if envs is not None:
+                    variants = []
+                    for env in envs:
+                        resolved = _resolve(arg, env, lookup)
+                        if resolved is None:
+                            variants = None
+                            break
+                        variants += [sql for sql in resolved if sql not in variants]
+                if variants is None:
+                    if _head(arg).strip().upper().startswith(('PRAGMA', 'CREATE', 'ALTER', 'DROP')):
+                        continue  # DDL, whatever it is built from
+                    statements.append((file_name, node.lineno, function.name, None))
+                    continue
+                for sql in variants:
+                    if name == 'paginate':
+                        # Plan the "next page" form, seeking past a cursor
+                        try:
+                            sql = render_sql(sql, ast.literal_eval(node.args[3]), '>')
+                        except ValueError:
+                            continue
+                    if sql.strip().upper().startswith(PLANNED_PREFIXES) and 'sqlite_master' not in sql:
+                        statements.append((file_name, node.lineno, function.name, sql))
+    # Nested functions are walked twice; keep the innermost owner
+    unique = {}
+    for file_name, line, function, sql in statements:
+        unique[(file_name, line, sql)] = (file_name, line, function, sql)
+    return sorted(unique.values(), key=lambda statement: statement[:3] + (statement[3] or '',))
+
+# Build an in-memory database at the current schema with enough rows that the
+# planner's choices match production, then ANALYZE it.
+def seed_database(members=2000, seed=1):
+    rng = random.Random(seed)
+    db = sqlite3.connect(':memory:')
+    migrate(db, log=lambda message: None)
+    db.executemany('INSERT INTO users (name, is_admin) VALUES (?, ?)',
+                   ((f'member{i}', 1 if i % 500 == 0 else 0) for i in range(members)))
+    user_ids = [row[0] for row in db.execute('SELECT id FROM users')]
+    start = datetime(2020, 1, 1)
+    db.executemany('INSERT INTO savings (user_id, amount, date) VALUES (?, ?, ?)',
+                   ((rng.choice(user_ids), rng.randint(1, 50) * 1000,
+                     (start + timedelta(days=rng.randint(0, 1800))).strftime('%Y-%m-%d'))
+                    for _ in range(members * 10)))
+    db.executemany('''INSERT INTO loan_applications (user_id, type_of_loan, amount, duration, date, status)
+                      VALUES (?, ?, ?, ?, ?, ?)''',
+                   ((rng.choice(user_ids), 'personal', 100000, 12, '2024-01-01',
+                     'pending' if i % 10 == 0 else 'rejected') for i in range(members // 2)))
+    db.executemany('''INSERT INTO guarantors (application_id, position, staff_no) VALUES (?, ?, ?)''',
+                   ((application_id, position, f'ECN{rng.choice(user_ids):06d}')
+                    for application_id in range(1, members // 2 + 1) for position in (1, 2)))
+    for i in range(members // 4):
+        cursor = db.execute('''INSERT INTO loans (user_id, type_of_loan, amount, duration, monthly_repayment,
+                                                  date, status, amount_approved, interest_charged, total_amount,
+                                                  application_id)
+                               VALUES (?, 'personal', 120000, 12, 10500, '2024-01-01', ?, 120000, 6000, 126000, ?)''',
+                            (rng.choice(user_ids), 'approved' if i % 3 else 'settled', members + i))
+        db.executemany('INSERT INTO repayments (loan_id, due_date, amount, status) VALUES (?, ?, ?, ?)',
+                       ((cursor.lastrowid, f'2024-{month:02d}-01', 10500, int(month < 6)) for month in range(1, 13)))
+    # Guarantors of the first applications back the seeded loans
+    db.execute('UPDATE guarantors SET loan_id = application_id WHERE application_id <= ?', (members // 4,))
+    db.commit()
+    # An empty archive so the history views (all_loans, all_repayments) plan too
+    archive.attach_archive(db, ':memory:')
+    db.execute('ANALYZE')
+    return db
+
+# EXPLAIN QUERY PLAN a statement, binding NULL for every parameter
+def query_plan(db, sql):
+    params = (None,) * sql.count('?')
+    return [row[3] for row in db.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+
+# Plan lines that read a whole table or index. Scans of a bound JSON array
+# (json_each) and of constant rows/subqueries do not touch stored data.
+def full_scans(plan):
+    return [detail for detail in plan
+            if detail.startswith('SCAN ')
+            and not detail.startswith(('SCAN CONSTANT ROW', 'SCAN (subquery', 'SCAN json_each'))
+            and ' VIRTUAL TABLE ' not in detail]  # json_each() input, whatever its alias
+
+# Check every statement; returns a list of (statement, offending plan lines).
+# Statements that fail to prepare are reported as failures too.
+def check(db=None, statements=None):
+    db = db or seed_database()
+    statements = collect_statements() if statements is None else statements
+    failures = []
+    for statement in statements:
+        file_name, line, function, sql = statement
+        if sql is None:
+            if (file_name, function) not in DYNAMIC_SQL:
+                failures.append((statement, ['SQL not resolvable statically']))
+            continue
+        if (file_name, function) in ALLOWED_FULL_SCANS:
+            continue
+        try:
+            scans = full_scans(query_plan(db, sql))
+        except sqlite3.Error as e:
+            scans = [f'error: {e}']
+        if scans:
+            failures.append((statement, scans))
+    return failures
+
+def main():
+    statements = collect_statements()
+    failures = check(statements=statements)
+    for (file_name, line, function, sql), scans in failures:
+        print(f"{file_name}:{line} in {function}(): {' | '.join(scans)}")
+        print('    ' + (' '.join(sql.split()) if sql else 'add it to DYNAMIC_SQL with a reason, '
+                                                             'or build it from resolvable parts'))
+    print(f"Checked {len(statements)} statements, {len(failures)} full scan(s)")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+import csv
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+# Amounts closer than this are treated as equal (naira, float rounding)
+TOLERANCE = 0.005
+
+# Read a monthly IPPIS deduction file (header: ippis_no and/or ecn_staff_no,
+# amount). Returns ([(line_num, key, amount)], [(line_num, reason)]) where key
+# is ('ippis', number) or ('staff', number); IPPIS number wins when both are
+# present.
+def read_deductions(lines):
+    deductions, rejected = [], []
+    reader = csv.DictReader(lines)
+    fieldnames = reader.fieldnames or []
+    if 'amount' not in fieldnames or not ({'ippis_no', 'ecn_staff_no'} & set(fieldnames)):
+        return deductions, [(1, 'Missing column(s): need amount and ippis_no or ecn_staff_no')]
+    for row in reader:
+        ippis_no = (row.get('ippis_no') or '').strip()
+        staff_no = (row.get('ecn_staff_no') or '').strip()
+        if not ippis_no and not staff_no:
+            rejected.append((reader.line_num, 'Missing IPPIS and staff number'))
+            continue
+        try:
+            amount = float(row['amount'])
+        except (TypeError, ValueError):
+            rejected.append((reader.line_num, 'Invalid amount'))
+            continue
+        if not math.isfinite(amount):
+            rejected.append((reader.line_num, 'Invalid amount'))
+            continue
+        if amount <= 0:
+            rejected.append((reader.line_num, 'Amount must be positive'))
+            continue
+        key = ('ippis', ippis_no) if ippis_no else ('staff', staff_no)
+        deductions.append((reader.line_num, key, amount))
+    return deductions, rejected
+
+# Hash index of unpaid installments due by the end of `month` (YYYY-MM).
+# Returns ({user_id: [(repayment_id, due_date, amount)] oldest first},
+# {key: user_id}) with every loan's IPPIS and staff number as keys.
+def open_installments(db, month):
+    installments, members = {}, {}
+    rows = db.execute('''SELECT r.id, r.due_date, r.amount, l.user_id, l.ippis_no, l.ecn_staff_no
+                         FROM repayments r JOIN loans l ON l.id = r.loan_id
+                         WHERE r.status = 0 AND r.due_date <= ?
+                         ORDER BY r.due_date, r.id''', (month + '-31',))  # every day of the month sorts below -31
+    for repayment_id, due_date, amount, user_id, ippis_no, staff_no in rows:
+        installments.setdefault(user_id, []).append((repayment_id, due_date, amount))
+        if ippis_no:
+            members[('ippis', ippis_no.strip())] = user_id
+        if staff_no:
+            members[('staff', staff_no.strip())] = user_id
+    return installments, members
+
+# Apply each member's total deduction to their installments oldest first.
+# Items are (user_id, amount, installments); returns one
+# (user_id, amount, paid_ids, applied, remainder) per item, where a remainder
+# left with installments still open is a partial payment and one left after
+# clearing them all is an over-payment. Runs in pool worker processes.
+def match_chunk(items):
+    results = []
+    for user_id, amount, installments in items:
+        remainder, paid_ids = amount, []
+        for repayment_id, _, due in installments:
+            if remainder + TOLERANCE < due:
+                break
+            remainder -= due
+            paid_ids.append(repayment_id)
+        remainder = round(remainder, 2) if remainder > TOLERANCE else 0.0
+        results.append((user_id, amount, paid_ids, round(amount - remainder, 2), remainder))
+    return results
+
+# Split `items` into at most `chunk_size` items per chunk
+def _chunks(items, chunk_size):
+    return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+# Reconcile a monthly IPPIS deduction file against repayment schedules.
+# Deductions are totalled per member through the hash index, matched in
+# parallel chunks on a process pool (inline when `workers` is 1 or the file
+# fits in one chunk), and every fully covered installment is marked paid with
+# one bulk UPDATE. With `dry_run` nothing is written. Returns a report dict.
+def reconcile_deductions(db, lines, month=None, workers=None, chunk_size=5000, dry_run=False):
+    started = time.perf_counter()
+    month = month or datetime.now().strftime('%Y-%m')
+    deductions, rejected = read_deductions(lines)
+    installments, members = open_installments(db, month)
+
+    totals, unmatched = {}, []
+    for line_num, key, amount in deductions:
+        user_id = members.get(key)
+        if user_id is None:
+            unmatched.append((line_num, f'{key[0]}:{key[1]}', amount))
+        else:
+            totals[user_id] = totals.get(user_id, 0.0) + amount
+    items = [(user_id, amount, installments[user_id]) for user_id, amount in totals.items()]
+
+    chunks = _chunks(items, chunk_size)
+    workers = min(workers or os.cpu_count() or 1, len(chunks))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = [result for chunk in pool.map(match_chunk, chunks) for result in chunk]
+    else:
+        results = [result for chunk in chunks for result in match_chunk(chunk)]
+
+    paid_ids, partial, overpaid = [], [], []
+    for user_id, amount, paid, applied, remainder in results:
+        paid_ids.extend(paid)
+        if remainder and len(paid) < len(installments[user_id]):
+            partial.append((user_id, amount, applied, remainder))
+        elif remainder:
+            overpaid.append((user_id, amount, applied, remainder))
+
+    updated = len(paid_ids) if dry_run else 0
+    if paid_ids and not dry_run:
+        with db:
+            # status = 0 skips installments paid since the index was built
+            updated = db.execute('''UPDATE repayments SET status = 1, days_past_due = 0
+                                    WHERE id IN (SELECT value FROM json_each(?)) AND status = 0''',
+                                 (json.dumps(paid_ids),)).rowcount
+    return {
+        'month': month,
+        'lines': len(deductions) + len(rejected),
+        'members': len(results),
+        'installments_paid': updated,
+        'amount_applied': round(sum(result[3] for result in results), 2),
+        'unmatched': unmatched,
+        'partial': partial,
+        'overpaid': overpaid,
+        'rejected': rejected,
+        'user_ids': [result[0] for result in results if result[2]],
+        'dry_run': dry_run,
+        'seconds': round(time.perf_counter() - started, 4),
+    }
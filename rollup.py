@@ -0,0 +1,83 @@
+# Per-member savings rollups. savings_daily and savings_monthly hold the total
+# posted per member per day/month and savings_balances the running balance;
+# triggers on savings keep all three current inside the posting transaction.
+
+ROLLUP_TABLES = ('savings_daily', 'savings_monthly', 'savings_balances')
+
+# (table, key column, key expression) for the two dated rollups
+_PERIODS = (('savings_daily', 'day', '{row}.date'), ('savings_monthly', 'month', 'substr({row}.date, 1, 7)'))
+
+def _apply(row, sign):
+    amount, count = f'{sign}{row}.amount', f'{sign}1'
+    statements = [
+        f'''INSERT INTO {table} (user_id, {column}, total, postings)
+            VALUES ({row}.user_id, {key.format(row=row)}, {amount}, {count})
+            ON CONFLICT (user_id, {column}) DO UPDATE SET
+                total = total + excluded.total, postings = postings + excluded.postings;'''
+        for table, column, key in _PERIODS]
+    if sign == '-':
+        # Drop periods whose last posting was removed
+        statements += [
+            f'''DELETE FROM {table} WHERE user_id = {row}.user_id
+                AND {column} = {key.format(row=row)} AND postings = 0;'''
+            for table, column, key in _PERIODS]
+    statements.append(f'''INSERT INTO savings_balances (user_id, balance, postings)
+            VALUES ({row}.user_id, {amount}, {count})
+            ON CONFLICT (user_id) DO UPDATE SET
+                balance = balance + excluded.balance, postings = postings + excluded.postings;''')
+    return '\n'.join(statements)
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS savings_daily (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            total REAL NOT NULL DEFAULT 0,
+            postings INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day)
+        ) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS savings_monthly (
+            user_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            total REAL NOT NULL DEFAULT 0,
+            postings INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, month)
+        ) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS savings_balances (
+            user_id INTEGER PRIMARY KEY,
+            balance REAL NOT NULL DEFAULT 0,
+            postings INTEGER NOT NULL DEFAULT 0
+        )''',
+    f'''CREATE TRIGGER IF NOT EXISTS savings_rollup_insert AFTER INSERT ON savings BEGIN
+            {_apply('NEW', '')}
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS savings_rollup_delete AFTER DELETE ON savings BEGIN
+            {_apply('OLD', '-')}
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS savings_rollup_update AFTER UPDATE OF user_id, amount, date ON savings BEGIN
+            {_apply('OLD', '-')}
+            {_apply('NEW', '')}
+        END''',
+]
+
+# Recompute every rollup from the savings ledger (backfill or repair).
+# Runs inside the caller's transaction.
+def rebuild_savings_rollup(db):
+    for table in ROLLUP_TABLES:
+        db.execute(f'DELETE FROM {table}')
+    db.execute('''INSERT INTO savings_daily (user_id, day, total, postings)
+                  SELECT user_id, date, SUM(amount), COUNT(*) FROM savings GROUP BY user_id, date''')
+    db.execute('''INSERT INTO savings_monthly (user_id, month, total, postings)
+                  SELECT user_id, substr(date, 1, 7), SUM(amount), COUNT(*) FROM savings
+                  GROUP BY user_id, substr(date, 1, 7)''')
+    db.execute('''INSERT INTO savings_balances (user_id, balance, postings)
+                  SELECT user_id, SUM(amount), COUNT(*) FROM savings GROUP BY user_id''')
+
+# A member's savings balance from the days before `day`
+def savings_balance_before(db, user_id, day):
+    return db.execute('SELECT COALESCE(SUM(total), 0) FROM savings_daily WHERE user_id = ? AND day < ?',
+                      (user_id, day)).fetchone()[0]
+
+# A member's current savings balance
+def savings_balance(db, user_id):
+    row = db.execute('SELECT balance FROM savings_balances WHERE user_id = ?', (user_id,)).fetchone()
+    return row[0] if row else 0
@@ -0,0 +1,53 @@
+import calendar
+from datetime import datetime
+
+# Shift a date by whole calendar months, clamping to the last day of shorter
+# months (31 Jan + 1 month = 28/29 Feb).
+def add_months(date, months):
+    month_index = date.month - 1 + months
+    year, month = date.year + month_index // 12, month_index % 12 + 1
+    day = min(date.day, calendar.monthrange(year, month)[1])
+    return date.replace(year=year, month=month, day=day)
+
+# Compute a full repayment schedule in memory as a list of (due_date, amount).
+# The first installment falls on the loan date and each following one a
+# calendar month later.
+def build_schedule(start_date, duration, monthly_repayment):
+    if isinstance(start_date, str):
+        start_date = datetime.strptime(start_date, '%Y-%m-%d')
+    return [(add_months(start_date, i).strftime('%Y-%m-%d'), monthly_repayment) for i in range(duration)]
+
+# Insert a freshly built schedule for a loan in one executemany
+def write_schedule(db, loan_id, schedule):
+    db.executemany('INSERT INTO repayments (loan_id, due_date, amount, status) VALUES (?, ?, ?, 0)',
+                   [(loan_id, due_date, amount) for due_date, amount in schedule])
+
+# Bring a loan's stored schedule in line with a new total, touching only the
+# installments that differ. Paid installments are never changed: what is still
+# owed (total_amount less the amount already paid) is spread evenly over the
+# unpaid ones, which take the due dates of `schedule` not held by a paid
+# installment. Unpaid rows keep their id; surplus ones are deleted and
+# missing ones inserted.
+# Returns (updated, inserted, deleted) row counts.
+def sync_schedule(db, loan_id, schedule, total_amount):
+    existing = db.execute('SELECT id, due_date, amount, status FROM repayments WHERE loan_id = ? '
+                          'ORDER BY due_date, id', (loan_id,)).fetchall()
+    paid = [(due_date, amount) for _, due_date, amount, status in existing if status]
+    unpaid = [(row_id, due_date, amount) for row_id, due_date, amount, status in existing if not status]
+    paid_dates = {due_date for due_date, _ in paid}
+    due_dates = [due_date for due_date, _ in schedule if due_date not in paid_dates]
+    due_dates = due_dates[:max(len(schedule) - len(paid), 0)]
+    remaining = total_amount - sum(amount for _, amount in paid)
+    target = [(due_date, remaining / len(due_dates)) for due_date in due_dates]
+    updates = [(due_date, amount, row_id)
+               for (row_id, old_due, old_amount), (due_date, amount) in zip(unpaid, target)
+               if (old_due, old_amount) != (due_date, amount)]
+    surplus = [(row_id,) for row_id, _, _ in unpaid[len(target):]]
+    missing = target[len(unpaid):]
+    if updates:
+        db.executemany('UPDATE repayments SET due_date = ?, amount = ? WHERE id = ? AND status = 0', updates)
+    if surplus:
+        db.executemany('DELETE FROM repayments WHERE id = ? AND status = 0', surplus)
+    if missing:
+        write_schedule(db, loan_id, missing)
+    return len(updates), len(missing), len(surplus)
@@ -0,0 +1,150 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from connections import open_connection
+
+# Members per partition: one worker task reads and renders one id range
+DEFAULT_PARTITION_SIZE = 2000
+
+# An installment counts as paid at the month end once this much of it was
+PAID_TOLERANCE = 0.005
+
+# Partition k covers member ids [k * size + 1, (k + 1) * size], the last one
+# included even past MAX(id). Boundaries (and so partition names) depend only
+# on the size, so a resumed run sees the same partitions even if members
+# registered in between.
+def partitions(db, size=DEFAULT_PARTITION_SIZE):
+    last_id = db.execute('SELECT MAX(id) FROM users').fetchone()[0] or 0
+    return [(first, first + size - 1) for first in range(1, last_id + 1, size)]
+
+def partition_dir(out_dir, month, first, last):
+    return os.path.join(out_dir, month, f'{first:07d}-{last:07d}')
+
+# Marker written once every statement of a partition is on disk
+def _done_marker(out_dir, month, first, last):
+    return partition_dir(out_dir, month, first, last) + '.done'
+
+# Everything the statements of members `first`..`last` need for `month`
+# (YYYY-MM) as it stood at the month end, read with one range query per table:
+# {user_id: {'name', 'opening', 'postings', 'loans'}}
+def read_partition(db, month, first, last):
+    month_end = month + '-31'  # every day of the month sorts below -31
+    members = {user_id: {'name': name, 'opening': 0.0, 'postings': [], 'loans': {}}
+               for user_id, name in db.execute('''SELECT id, name FROM users
+                                                  WHERE id BETWEEN ? AND ? AND is_admin = 0''', (first, last))}
+    for user_id, opening in db.execute('''SELECT user_id, SUM(total) FROM savings_monthly
+                                          WHERE user_id BETWEEN ? AND ? AND month < ?
+                                          GROUP BY user_id''', (first, last, month)):
+        if user_id in members:
+            members[user_id]['opening'] = opening
+    for user_id, date, amount in db.execute('''SELECT user_id, date, amount FROM savings
+                                               WHERE user_id BETWEEN ? AND ? AND date >= ? AND date <= ?
+                                               ORDER BY user_id, date''',
+                                            (first, last, month + '-01', month_end)):
+        if user_id in members:
+            members[user_id]['postings'].append((date, amount))
+    # Loan balances as of the month end come from the money journal: what was
+    # owed on each loan and what each installment had been paid by then
+    owed = dict(db.execute('''SELECT ref_id, SUM(amount) FROM ledger_journal
+                              WHERE user_id BETWEEN ? AND ? AND entry_date <= ?
+                                AND account = 'loan' AND ref_table = 'loans'
+                              GROUP BY ref_id''', (first, last, month_end)))
+    repaid = dict(db.execute('''SELECT ref_id, -SUM(amount) FROM ledger_journal
+                                WHERE user_id BETWEEN ? AND ? AND entry_date <= ?
+                                  AND account = 'loan' AND ref_table = 'repayments'
+                                GROUP BY ref_id''', (first, last, month_end)))
+    for loan_id, user_id, type_of_loan, repayment_id, due_date, amount in db.execute('''
+            SELECT l.id, l.user_id, l.type_of_loan, r.id, r.due_date, r.amount
+            FROM loans l JOIN repayments r ON r.loan_id = l.id
+            WHERE l.user_id BETWEEN ? AND ? AND l.status = "approved" AND l.date <= ?
+            ORDER BY l.id, r.due_date''', (first, last, month_end)):
+        if user_id not in members:
+            continue
+        loan = members[user_id]['loans'].setdefault(
+            loan_id, {'type': type_of_loan, 'total': owed.get(loan_id, 0.0), 'paid': 0.0, 'due': []})
+        paid = repaid.get(repayment_id, 0.0)
+        loan['paid'] += paid
+        if due_date[:7] == month:
+            loan['due'].append((due_date, amount, paid > PAID_TOLERANCE))
+    for member in members.values():
+        for loan in member['loans'].values():
+            loan['outstanding'] = loan['total'] - loan['paid']
+    return members
+
+# One member's statement as plain text
+def render_statement(month, user_id, member):
+    lines = [f'ECN Cooperative - statement for {month}',
+             f"Member: {member['name']} (ID {user_id})",
+             '',
+             'Savings',
+             f"  Opening balance {member['opening']:>18,.2f}"]
+    for date, amount in member['postings']:
+        lines.append(f'  {date} posting {amount:>15,.2f}')
+    closing = member['opening'] + sum(amount for _, amount in member['postings'])
+    lines.append(f'  Closing balance {closing:>18,.2f}')
+    if member['loans']:
+        lines += ['', 'Loans']
+        for loan_id, loan in member['loans'].items():
+            lines.append(f"  Loan {loan_id} ({loan['type']}): total {loan['total']:,.2f}, "
+                         f"repaid {loan['paid']:,.2f}, outstanding {loan['outstanding']:,.2f} at month end")
+            for due_date, amount, status in loan['due']:
+                lines.append(f"    {due_date} installment {amount:>14,.2f}  {'paid' if status else 'due'}")
+    return '\n'.join(lines) + '\n'
+
+# Pool task: read one partition and write a statement file per member, then
+# the partition's done marker. Returns (first, last, statements written).
+def render_partition(database, month, out_dir, first, last):
+    db = open_connection(database)
+    try:
+        members = read_partition(db, month, first, last)
+    finally:
+        db.close()
+    directory = partition_dir(out_dir, month, first, last)
+    os.makedirs(directory, exist_ok=True)
+    for user_id, member in members.items():
+        with open(os.path.join(directory, f'{user_id}.txt'), 'w', encoding='utf-8') as f:
+            f.write(render_statement(month, user_id, member))
+    marker = _done_marker(out_dir, month, first, last)
+    with open(marker + '.tmp', 'w') as f:
+        json.dump({'statements': len(members)}, f)
+    os.replace(marker + '.tmp', marker)
+    return first, last, len(members)
+
+# Render every member's statement for `month` into out_dir/<month>/, one
+# directory per partition, on a process pool (inline with one worker).
+# Partitions finished by an earlier, interrupted run are skipped unless
+# `restart` is set. `log` gets a progress line per finished partition.
+# Returns a summary dict.
+def generate_statements(database, month, out_dir, workers=None, partition_size=DEFAULT_PARTITION_SIZE,
+                        restart=False, log=None):
+    started = time.perf_counter()
+    db = open_connection(database)
+    try:
+        ranges = partitions(db, partition_size)
+    finally:
+        db.close()
+    todo = [(first, last) for first, last in ranges
+            if restart or not os.path.exists(_done_marker(out_dir, month, first, last))]
+    summary = {'month': month, 'partitions': len(ranges), 'skipped': len(ranges) - len(todo), 'statements': 0}
+    workers = min(workers or os.cpu_count() or 1, len(todo)) or 1
+
+    def progress(done, written):
+        summary['statements'] += written
+        if log:
+            elapsed = time.perf_counter() - started
+            remaining = elapsed / done * (len(todo) - done)
+            log(f"{done}/{len(todo)} partition(s), {summary['statements']} statement(s), "
+                f"{elapsed:.1f}s elapsed, about {remaining:.0f}s left")
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            tasks = [pool.submit(render_partition, database, month, out_dir, first, last) for first, last in todo]
+            for done, task in enumerate(as_completed(tasks), 1):
+                progress(done, task.result()[2])
+    else:
+        for done, (first, last) in enumerate(todo, 1):
+            progress(done, render_partition(database, month, out_dir, first, last)[2])
+    summary['seconds'] = round(time.perf_counter() - started, 4)
+    return summary
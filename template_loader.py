@@ -0,0 +1,59 @@
+import os
+import re
+
+from jinja2 import BaseLoader, FileSystemBytecodeCache, TemplateNotFound
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Every page template, concatenated; each starts with a
+# <!-- templates/NAME --> marker followed by a <!-- Purpose: ... --> line
+BUNDLE = os.path.join(BASE_DIR, 'App_html.py')
+
+_MARKER = re.compile(r'^<!-- templates/([\w.]+) -->\n', re.M)
+_PURPOSE = re.compile(r'\A<!-- Purpose:.*?-->\n', re.S)
+
+# Split the bundle into {template name: source}. The Purpose comment is
+# documentation for maintainers and is not part of the rendered page.
+def parse_bundle(text):
+    parts = _MARKER.split(text)
+    return {parts[i]: _PURPOSE.sub('', parts[i + 1]).rstrip('\n') + '\n' for i in range(1, len(parts), 2)}
+
+# Jinja loader serving templates straight from the bundle file. The file is
+# parsed once and re-read only if its modification time changes.
+class BundleLoader(BaseLoader):
+    def __init__(self, path=BUNDLE):
+        self.path = path
+        self._mtime = None
+        self._templates = {}
+
+    def _load(self):
+        mtime = os.path.getmtime(self.path)
+        if mtime != self._mtime:
+            with open(self.path, encoding='utf-8') as f:
+                self._templates = parse_bundle(f.read())
+            self._mtime = mtime
+        return self._templates
+
+    def get_source(self, environment, template):
+        templates = self._load()
+        if template not in templates:
+            raise TemplateNotFound(template)
+        mtime = self._mtime
+        return templates[template], f'{self.path}:{template}', lambda: os.path.getmtime(self.path) == mtime
+
+    def list_templates(self):
+        return sorted(self._load())
+
+# Serve the app's templates from the bundle, cache compiled templates as
+# bytecode on disk (shared by every worker and across restarts) and compile
+# them all now so no request pays for it
+def init_templates(app, cache_dir=None):
+    loader = BundleLoader()
+    app.jinja_loader = loader
+    env = app.jinja_env
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+    for name in loader.list_templates():
+        env.get_template(name)
+    return loader
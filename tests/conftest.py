@@ -0,0 +1,48 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ECN_corp_app import create_app, init_db  # noqa: E402
+from connections import open_connection  # noqa: E402
+
+# An app on a fresh, fully migrated database
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({'DATABASE': str(tmp_path / 'ecn.db'), 'SECRET_KEY': 'test', 'TESTING': True,
+                      'STATEMENTS_DIR': str(tmp_path / 'statements')})
+    with app.app_context():
+        init_db()
+    return app
+
+@pytest.fixture
+def db(app):
+    db = open_connection(app.config['DATABASE'])
+    yield db
+    db.close()
+
+# Register (if needed) and log in `name`; returns the client
+def login(app, name, is_admin=False):
+    client = app.test_client()
+    client.post('/register', data={'name': name, 'is_admin': 'on' if is_admin else ''})
+    client.post('/login', data={'name': name})
+    return client
+
+@pytest.fixture
+def admin(app):
+    return login(app, 'Admin', is_admin=True)
+
+# Approved loan for a new member: returns (user_id, loan_id)
+def approved_loan(app, db, admin, name='Member', amount=1200, duration=12, date='2026-01-15'):
+    login(app, name)
+    user_id = db.execute('SELECT id FROM users WHERE name = ?', (name,)).fetchone()[0]
+    with db:
+        application_id = db.execute('''INSERT INTO loan_applications (user_id, type_of_loan, amount, duration,
+                                           ecn_staff_no, ippis_no, previous_month_salary, date, status)
+                                       VALUES (?, 'personal', ?, ?, ?, ?, 100000, ?, 'pending')''',
+                                    (user_id, amount, duration, f'ECN-{user_id}', f'IP-{user_id}', date)).lastrowid
+    admin.get(f'/approve/{application_id}')
+    loan_id = db.execute('SELECT id FROM loans WHERE application_id = ?', (application_id,)).fetchone()[0]
+    return user_id, loan_id
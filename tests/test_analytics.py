@@ -0,0 +1,17 @@
+from conftest import approved_loan
+
+def test_analytics_cache_sees_writes_made_outside_the_worker(app, db, admin):
+    approved_loan(app, db, admin, name='First')
+    assert admin.get('/analytics.json').get_json()['summary']['totals']['loans'] == 1
+    # A CLI command or another worker: nothing in this process is told
+    with db:
+        db.execute('''INSERT INTO loans (user_id, type_of_loan, amount, duration, date, status, amount_approved,
+                                         interest_charged, total_amount)
+                      VALUES (1, 'car', 500, 5, '2026-02-01', 'approved', 500, 25, 525)''')
+
+    analytics = admin.get('/analytics.json').get_json()
+
+    assert analytics['summary']['totals']['loans'] == 2
+    with db:
+        db.execute("UPDATE repayments SET status = 1")
+    assert admin.get('/analytics.json').get_json()['summary']['totals']['repaid'] > 0
@@ -0,0 +1,28 @@
+import approvals
+from conftest import approved_loan, login
+
+def test_a_stale_approval_does_not_schedule_another_approvers_loan(app, db, admin, monkeypatch):
+    _, loan_id = approved_loan(app, db, admin, duration=4)
+    application_id = db.execute('SELECT application_id FROM loans WHERE id = ?', (loan_id,)).fetchone()[0]
+    # A second approver read the application as pending before the first committed
+    monkeypatch.setattr(approvals, 'select_pending', lambda *args: [application_id])
+
+    summary = approvals.approve_applications(db, [application_id])
+
+    assert summary['approved'] == 0 and summary['schedule_rows'] == 0
+    assert db.execute('SELECT COUNT(*) FROM repayments WHERE loan_id = ?', (loan_id,)).fetchone()[0] == 4
+    assert db.execute('SELECT COUNT(*) FROM loans WHERE application_id = ?', (application_id,)).fetchone()[0] == 1
+
+def test_bulk_approval_schedules_each_loan_once(app, db, admin):
+    approved_loan(app, db, admin, name='First', duration=6)
+    login(app, 'Second')
+    user_id = db.execute("SELECT id FROM users WHERE name = 'Second'").fetchone()[0]
+    with db:
+        db.executemany('''INSERT INTO loan_applications (user_id, type_of_loan, amount, duration, date, status)
+                          VALUES (?, 'personal', 1000, ?, '2026-02-01', 'pending')''', [(user_id, 3), (user_id, 5)])
+
+    summary = approvals.approve_applications(db)
+
+    assert summary['approved'] == 2 and summary['schedule_rows'] == 8
+    assert db.execute('''SELECT COUNT(*) FROM repayments r JOIN loans l ON l.id = r.loan_id
+                         WHERE l.user_id = ?''', (user_id,)).fetchone()[0] == 8
@@ -0,0 +1,43 @@
+import threading
+
+import ECN_corp_app
+from conftest import login
+
+def application(staff_no, guarantors):
+    form = {'type_of_loan': 'personal', 'amount': '1000', 'duration': '6', 'ecn_staff_no': staff_no,
+            'ippis_no': 'IP-' + staff_no, 'designation': 'Officer', 'phone_no': '0803', 'bank_name': 'Bank',
+            'account_no': '0123', 'previous_month_salary': '200000'}
+    for position, guarantor in enumerate(guarantors, 1):
+        form.update({f'guarantor{position}_name': guarantor, f'guarantor{position}_staff_no': guarantor,
+                     f'guarantor{position}_designation': 'Officer', f'guarantor{position}_phone_no': '0804'})
+    return form
+
+def test_concurrent_applications_can_not_both_take_a_guarantors_last_slot(app, db, monkeypatch):
+    login(app, 'Earlier').post('/loan', data=application('ECN-A', ['ECN-G', 'ECN-X']))  # ECN-G: 1 of 2 used
+    clients = [login(app, 'First'), login(app, 'Second')]
+    # Hold each check open until the other request has checked too, or a
+    # moment has passed
+    barrier = threading.Barrier(2)
+    check = ECN_corp_app.check_guarantors
+
+    def slow_check(*args):
+        error = check(*args)
+        try:
+            barrier.wait(timeout=0.5)
+        except threading.BrokenBarrierError:
+            pass
+        return error
+    monkeypatch.setattr(ECN_corp_app, 'check_guarantors', slow_check)
+
+    responses = []
+    threads = [threading.Thread(target=lambda client, staff_no, other: responses.append(
+                   client.post('/loan', data=application(staff_no, ['ECN-G', other]))),
+                                args=(client, f'ECN-{i}', f'ECN-Y{i}'))
+               for i, client in enumerate(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert db.execute("SELECT COUNT(*) FROM guarantors WHERE staff_no = 'ECN-G'").fetchone()[0] == 2
+    assert sum(b'already guarantees' in response.data for response in responses) == 1
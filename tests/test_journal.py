@@ -0,0 +1,75 @@
+import sqlite3
+
+import pytest
+
+import migrations
+import queryplan
+from journal import balance_as_of, take_snapshot
+from conftest import approved_loan, login
+
+def journal_total(db, user_id, account):
+    return db.execute('SELECT COALESCE(SUM(amount), 0) FROM ledger_journal WHERE user_id = ? AND account = ?',
+                      (user_id, account)).fetchone()[0]
+
+def test_editing_a_savings_posting_reverses_the_old_one(app, db):
+    login(app, 'Saver')
+    user_id = db.execute("SELECT id FROM users WHERE name = 'Saver'").fetchone()[0]
+    with db:
+        savings_id = db.execute("INSERT INTO savings (user_id, amount, date) VALUES (?, 100, '2026-03-01')",
+                                (user_id,)).lastrowid
+        db.execute("UPDATE savings SET amount = 50, date = '2026-03-02' WHERE id = ?", (savings_id,))
+
+    balance = db.execute('SELECT balance FROM savings_balances WHERE user_id = ?', (user_id,)).fetchone()[0]
+    assert balance == pytest.approx(50)
+    assert journal_total(db, user_id, 'savings') == pytest.approx(50)
+    entries = db.execute('''SELECT kind, amount, entry_date FROM ledger_journal
+                            WHERE ref_table = 'savings' AND ref_id = ? ORDER BY id''', (savings_id,)).fetchall()
+    assert entries == [('deposit', 100, '2026-03-01'), ('reversal', -100, '2026-03-01'),
+                       ('deposit', 50, '2026-03-02')]
+
+def test_unpaid_installment_edits_do_not_journal(app, db, admin):
+    user_id, loan_id = approved_loan(app, db, admin)
+    owed = journal_total(db, user_id, 'loan')
+    with db:
+        db.execute('UPDATE repayments SET amount = amount + 10 WHERE loan_id = ? AND status = 0', (loan_id,))
+    assert journal_total(db, user_id, 'loan') == pytest.approx(owed)
+
+def test_migration_replaces_the_journal_triggers(tmp_path):
+    db = sqlite3.connect(str(tmp_path / 'old.db'))
+    migrations.migrate(db, target=12, log=lambda line: None)
+    db.execute('''CREATE TRIGGER IF NOT EXISTS repayments_journal_amount AFTER UPDATE OF amount ON repayments
+                  BEGIN SELECT 1; END''')
+    migrations.migrate(db, log=lambda line: None)
+    triggers = {name for name, in db.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+    sql = db.execute("SELECT sql FROM sqlite_master WHERE name = 'repayments_journal_paid'").fetchone()[0]
+    db.close()
+    assert 'repayments_journal_amount' not in triggers
+    assert 'savings_journal_update' in triggers
+    assert "'localtime'" in sql
+
+def test_balance_etag_changes_when_a_snapshot_is_taken(app, db):
+    client = login(app, 'Saver')
+    user_id = db.execute("SELECT id FROM users WHERE name = 'Saver'").fetchone()[0]
+    with db:
+        db.execute("INSERT INTO savings (user_id, amount, date) VALUES (?, 100, '2026-03-01')", (user_id,))
+    first = client.get('/api/v1/balance')
+    assert first.get_json()['checkpoint'] is None
+    take_snapshot(db, '2026-03-31')
+
+    second = client.get('/api/v1/balance', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert second.get_json()['checkpoint'] == '2026-03-31'
+    assert second.get_json()['savings'] == pytest.approx(100)
+    assert client.get('/api/v1/balance',
+                      headers={'If-None-Match': second.headers['ETag']}).status_code == 304
+
+def test_balance_tail_seeks_entries_recorded_after_the_checkpoint():
+    db = queryplan.seed_database()
+    take_snapshot(db, '2024-12-31')
+    statements = []
+    db.set_trace_callback(statements.append)
+    balance_as_of(db, 1, '2025-06-30')
+    db.set_trace_callback(None)
+    tail = next(sql for sql in statements if 'UNION ALL' in sql)
+    plan = [row[3] for row in db.execute('EXPLAIN QUERY PLAN ' + tail)]
+    assert any('idx_journal_user (user_id=? AND rowid>?)' in line for line in plan), plan
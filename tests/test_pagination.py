@@ -0,0 +1,17 @@
+import pytest
+
+from conftest import approved_loan, login
+from pagination import encode_cursor
+
+@pytest.mark.parametrize('cursor', [[1, 2, 3], [[1]], [{}], [], [True, 1], [None, 1]])
+def test_cursors_not_matching_the_keys_give_the_first_page(app, db, admin, cursor):
+    approved_loan(app, db, admin, name='Member')
+    member = login(app, 'Member')
+    token = encode_cursor(cursor)
+    for client, path in ((admin, '/users'), (admin, '/approve_loans'), (member, '/repayments'),
+                         (member, '/api/v1/repayments')):
+        for direction in ('after', 'before'):
+            response = client.get(f'{path}?{direction}={token}')
+            assert response.status_code == 200, (path, direction)
+    first = member.get('/api/v1/repayments').get_json()
+    assert member.get(f'/api/v1/repayments?after={token}').get_json() == first
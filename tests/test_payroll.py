@@ -0,0 +1,18 @@
+import io
+
+import pytest
+
+from conftest import login
+from payroll import post_savings_csv
+
+def test_non_finite_amounts_are_rejected_per_row(app, db):
+    login(app, 'Saver')
+    user_id = db.execute("SELECT id FROM users WHERE name = 'Saver'").fetchone()[0]
+    lines = io.StringIO(f'staff_id,amount\n{user_id},500\n{user_id},inf\n{user_id},nan\n{user_id},700\n')
+
+    summary = post_savings_csv(db, lines, default_date='2026-03-01')
+
+    assert summary['posted'] == 2
+    assert summary['rejected'] == [(3, 'Invalid amount'), (4, 'Invalid amount')]
+    balance = db.execute('SELECT balance FROM savings_balances WHERE user_id = ?', (user_id,)).fetchone()[0]
+    assert balance == pytest.approx(1200)
@@ -0,0 +1,8 @@
+import queryplan
+
+# Every statement the app runs plans without a full scan (see queryplan.py for
+# the allowlisted ones), and none is built in a way the check can not resolve
+def test_no_unexpected_full_scans():
+    failures = queryplan.check()
+    assert failures == [], '\n'.join(f"{file_name}:{line} in {function}(): {' | '.join(scans)}"
+                                     for (file_name, line, function, _), scans in failures)
@@ -0,0 +1,27 @@
+import io
+
+from conftest import approved_loan
+from reconcile import reconcile_deductions
+
+def paid_installments(db, loan_id):
+    return db.execute('SELECT COUNT(*) FROM repayments WHERE loan_id = ? AND status = 1', (loan_id,)).fetchone()[0]
+
+def test_non_finite_deductions_are_rejected(app, db, admin):
+    user_id, loan_id = approved_loan(app, db, admin)
+    lines = io.StringIO(f'ippis_no,amount\nIP-{user_id},nan\nIP-{user_id},inf\nIP-{user_id},-inf\n')
+
+    report = reconcile_deductions(db, lines, month='2026-02', workers=1)
+
+    assert [reason for _, reason in report['rejected']] == ['Invalid amount'] * 3
+    assert report['installments_paid'] == 0
+    assert paid_installments(db, loan_id) == 0
+
+def test_reconcile_rejects_a_malformed_month(app, db, admin):
+    user_id, loan_id = approved_loan(app, db, admin)
+    for month in ('2027', 'abc', '2026-13'):
+        response = admin.post('/reconcile', data={
+            'file': (io.BytesIO(f'ippis_no,amount\nIP-{user_id},105\n'.encode()), 'ippis.csv'), 'month': month})
+        assert b'YYYY-MM' in response.data
+    result = app.test_cli_runner().invoke(args=['reconcile-deductions', __file__, '--month', '2027'])
+    assert result.exit_code != 0 and 'YYYY-MM' in result.output
+    assert paid_installments(db, loan_id) == 0
@@ -0,0 +1,24 @@
+import pytest
+
+from conftest import approved_loan
+
+def test_editing_a_loan_keeps_paid_installments(app, db, admin):
+    _, loan_id = approved_loan(app, db, admin, amount=1200, duration=12)  # 1260 with interest: 12 x 105
+    with db:
+        db.execute('''UPDATE repayments SET status = 1 WHERE id IN (
+                          SELECT id FROM repayments WHERE loan_id = ? ORDER BY due_date LIMIT 3)''', (loan_id,))
+    before = db.execute('SELECT id, due_date, amount FROM repayments WHERE loan_id = ? AND status = 1',
+                        (loan_id,)).fetchall()
+
+    admin.post(f'/loan_approval_details/{loan_id}',
+               data={'amount_approved': '1200', 'interest_charged': '300', 'total_amount': '1500'})
+
+    paid = db.execute('SELECT id, due_date, amount FROM repayments WHERE loan_id = ? AND status = 1',
+                      (loan_id,)).fetchall()
+    unpaid = db.execute('SELECT due_date, amount FROM repayments WHERE loan_id = ? AND status = 0 ORDER BY due_date',
+                        (loan_id,)).fetchall()
+    assert paid == before
+    assert sum(amount for _, _, amount in paid) == pytest.approx(315)
+    assert len(unpaid) == 9
+    assert sum(amount for _, amount in unpaid) == pytest.approx(1185)
+    assert min(due_date for due_date, _ in unpaid) > max(due_date for _, due_date, _ in paid)
@@ -0,0 +1,47 @@
+import os
+from datetime import datetime
+
+import pytest
+
+from conftest import approved_loan, login
+from statements import _done_marker, generate_statements, read_partition
+
+def test_resume_keeps_partition_names_after_new_registrations(app, db, tmp_path):
+    out_dir = str(tmp_path / 'out')
+    for name in ('Ada', 'Bayo', 'Chidi'):  # ids 3-5, after the two users init_db seeds
+        login(app, name)
+    first = generate_statements(app.config['DATABASE'], '2026-10', out_dir, workers=1, partition_size=2)
+    assert first['partitions'] == 3
+    # Interrupted before the last partition was marked done
+    os.remove(_done_marker(out_dir, '2026-10', 5, 6))
+    for name in ('Dayo', 'Emeka'):
+        login(app, name)
+
+    resumed = generate_statements(app.config['DATABASE'], '2026-10', out_dir, workers=1, partition_size=2)
+
+    assert resumed['partitions'] == 4 and resumed['skipped'] == 2
+    assert resumed['statements'] == 3
+    assert sorted(entry for entry in os.listdir(os.path.join(out_dir, '2026-10')) if not entry.endswith('.done')) \
+        == ['0000001-0000002', '0000003-0000004', '0000005-0000006', '0000007-0000008']
+    assert sorted(os.listdir(os.path.join(out_dir, '2026-10', '0000005-0000006'))) == ['5.txt', '6.txt']
+
+def test_statement_shows_loans_as_they_stood_at_the_month_end(app, db, admin):
+    user_id, loan_id = approved_loan(app, db, admin, amount=1200, duration=12, date='2026-01-15')  # 12 x 105
+    with db:
+        # Paid today, long after February
+        db.execute('''UPDATE repayments SET status = 1 WHERE id IN (
+                          SELECT id FROM repayments WHERE loan_id = ? ORDER BY due_date LIMIT 2)''', (loan_id,))
+        db.execute('''INSERT INTO loan_applications (user_id, type_of_loan, amount, duration, date, status)
+                      VALUES (?, 'car', 600, 6, '2026-06-10', 'pending')''', (user_id,))
+    later = db.execute("SELECT id FROM loan_applications WHERE date = '2026-06-10'").fetchone()[0]
+    admin.get(f'/approve/{later}')
+
+    february = read_partition(db, '2026-02', user_id, user_id)[user_id]['loans']
+    assert list(february) == [loan_id]
+    assert february[loan_id]['paid'] == 0
+    assert february[loan_id]['outstanding'] == pytest.approx(1260)
+    assert february[loan_id]['due'] == [('2026-02-15', 105, False)]
+    assert read_partition(db, '2025-12', user_id, user_id)[user_id]['loans'] == {}
+    today = datetime.now().strftime('%Y-%m')
+    current = read_partition(db, today, user_id, user_id)[user_id]['loans'][loan_id]
+    assert current['paid'] == pytest.approx(210) and current['outstanding'] == pytest.approx(1050)
@@ -0,0 +1,18 @@
+from concurrent.futures import Future
+
+from write_queue import WriteQueue
+
+def insert_user(db, name):
+    return db.execute('INSERT INTO users (name, is_admin) VALUES (?, 0)', (name,)).lastrowid
+
+def test_jobs_queued_behind_a_dead_writer_still_run(app):
+    writes = WriteQueue(app.config['DATABASE'])
+    writes.call(insert_user, 'First')
+    writes.stop()  # the writer thread is gone...
+    stranded = Future()
+    writes._queue.put((insert_user, ('Stranded',), stranded))  # ...with a job still queued behind it
+
+    later = writes.submit(insert_user, 'Later')
+
+    assert stranded.result(5) and later.result(5)
+    writes.stop()
@@ -0,0 +1,92 @@
+import zlib
+
+# Per-member data versions. Triggers bump member_versions.version whenever a
+# row the member can see changes (savings, applications, loans, repayments,
+# their user row), so an unchanged version means an unchanged response.
+
+def _bump(user):
+    return f'''INSERT INTO member_versions (user_id, version)
+            SELECT {user}, 1 WHERE {user} IS NOT NULL
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;'''
+
+# (table, member id expression over {row}, columns whose updates are visible)
+_SOURCES = (
+    ('savings', '{row}.user_id', 'user_id, amount, date'),
+    ('loan_applications', '{row}.user_id', None),
+    ('loans', '{row}.user_id', None),
+    # days_past_due is left out so the nightly arrears run does not bump
+    # every member in arrears
+    ('repayments', '(SELECT user_id FROM loans WHERE id = {row}.loan_id)', 'loan_id, due_date, amount, status'),
+)
+
+def _triggers():
+    statements = []
+    for table, user, columns in _SOURCES:
+        new, old = user.format(row='NEW'), user.format(row='OLD')
+        update_of = f' OF {columns}' if columns else ''
+        statements += [
+            f'''CREATE TRIGGER IF NOT EXISTS {table}_version_insert AFTER INSERT ON {table} BEGIN
+                    {_bump(new)}
+                END''',
+            f'''CREATE TRIGGER IF NOT EXISTS {table}_version_delete AFTER DELETE ON {table} BEGIN
+                    {_bump(old)}
+                END''',
+            f'''CREATE TRIGGER IF NOT EXISTS {table}_version_update AFTER UPDATE{update_of} ON {table} BEGIN
+                    {_bump(new)}
+                    {_bump(f'(SELECT {old} WHERE {old} IS NOT {new})')}
+                END''',
+        ]
+    statements.append(f'''CREATE TRIGGER IF NOT EXISTS users_version_update AFTER UPDATE OF name ON users BEGIN
+                    {_bump('NEW.id')}
+                END''')
+    return statements
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS member_versions (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )''',
+] + _triggers()
+
+# Version of the whole loan book, bumped by any change to a loan or to an
+# installment's schedule or status from any process (workers, CLI commands),
+# so caches of loan book aggregates can tell they are stale.
+# (table, columns whose updates count; None for all)
+_BOOK_SOURCES = (
+    ('loans', None),
+    ('repayments', 'loan_id, due_date, amount, status'),
+)
+
+def _book_triggers():
+    statements = []
+    for table, columns in _BOOK_SOURCES:
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            update_of = f' OF {columns}' if columns and event == 'UPDATE' else ''
+            statements.append(f'''CREATE TRIGGER IF NOT EXISTS {table}_book_{event.lower()}
+                    AFTER {event}{update_of} ON {table} BEGIN
+                    UPDATE book_version SET version = version + 1 WHERE id = 1;
+                END''')
+    return statements
+
+BOOK_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS book_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )''',
+    'INSERT OR IGNORE INTO book_version (id, version) VALUES (1, 0)',
+] + _book_triggers()
+
+# The loan book's current version
+def book_version(db):
+    return db.execute('SELECT version FROM book_version WHERE id = 1').fetchone()[0]
+
+# A member's current data version (0 before their first change)
+def member_version(db, user_id):
+    row = db.execute('SELECT version FROM member_versions WHERE user_id = ?', (user_id,)).fetchone()
+    return row[0] if row else 0
+
+# Strong ETag for one member's view of a resource: the API version, the
+# member's data version and a checksum of the path and query string (filters,
+# cursors, page size)
+def member_etag(api_version, user_id, version, full_path):
+    return f'{api_version}-{user_id}-{version}-{zlib.crc32(full_path.encode()):08x}'
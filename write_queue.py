@@ -0,0 +1,160 @@
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from connections import PRAGMAS, open_connection
+
+# The writer commits with synchronous=FULL: a future resolves only once its
+# batch is on disk, and one fsync is shared by the whole batch
+WRITER_PRAGMAS = tuple((name, 'FULL' if name == 'synchronous' else value) for name, value in PRAGMAS)
+
+_STOP = object()
+
+# What a job sees as its connection: statements run inside the writer's batch
+# transaction, `with db:` blocks become savepoints and commit() is a no-op, so
+# helpers that manage their own transaction (approve_applications,
+# score_applications) run unchanged
+class _BatchConnection:
+    def __init__(self, db):
+        self._db = db
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+    def __enter__(self):
+        self._db.execute('SAVEPOINT nested')
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self._db.execute('ROLLBACK TO nested')
+        self._db.execute('RELEASE nested')
+        return False
+
+    def commit(self):
+        pass
+
+# Single writer thread with group commit. Jobs are callables job(db, *args);
+# the writer takes every job queued (waiting up to `max_wait_ms` for more, at
+# most `max_batch`), runs each in its own savepoint and commits them together.
+# Each caller's future gets the job's return value, or its exception, once the
+# batch has committed; a job that raises is rolled back alone. One writer runs
+# per process, started on first use, so a forked worker starts its own.
+class WriteQueue:
+    def __init__(self, path, max_batch=256, max_wait_ms=1.0, timeout=30.0, pragmas=WRITER_PRAGMAS):
+        self.path = path
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.timeout = timeout
+        self.pragmas = pragmas
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self.stats = {'jobs': 0, 'failed': 0, 'batches': 0, 'largest_batch': 0, 'commit_ms': 0.0}
+        atexit.register(self.stop)
+
+    def _ensure_started(self):
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            forked = self._pid != os.getpid()
+            if forked:
+                # Forked from a process whose writer (and its queue) stayed behind
+                self._pid = os.getpid()
+                self._queue = queue.SimpleQueue()
+            if forked or not self._thread.is_alive():
+                # A replacement for a writer that died takes over its queue, so
+                # jobs queued behind it are not orphaned
+                self._thread = threading.Thread(target=self._run, name='ecn-writer', daemon=True)
+                self._thread.start()
+
+    # Queue job(db, *args); returns a concurrent.futures.Future
+    def submit(self, job, *args):
+        self._ensure_started()
+        future = Future()
+        self._queue.put((job, args, future))
+        return future
+
+    # Queue a job and wait until it is committed; returns its result or
+    # raises its exception
+    def call(self, job, *args):
+        return self.submit(job, *args).result(self.timeout)
+
+    # Commit whatever is queued and stop the writer
+    def stop(self):
+        thread = self._thread
+        if thread is not None and self._pid == os.getpid() and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join()
+
+    def _run(self):
+        db = open_connection(self.path, self.pragmas)
+        db.isolation_level = None  # transactions are managed explicitly
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(db, batch)
+        db.close()
+
+    def _commit(self, db, batch):
+        started = time.perf_counter()
+        connection = _BatchConnection(db)
+        outcomes = []
+        try:
+            db.execute('BEGIN IMMEDIATE')
+            for job, args, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                db.execute('SAVEPOINT job')
+                try:
+                    result = job(connection, *args)
+                except Exception as error:
+                    db.execute('ROLLBACK TO job')
+                    outcomes.append((future, None, error))
+                else:
+                    outcomes.append((future, result, None))
+                db.execute('RELEASE job')
+            db.execute('COMMIT')
+        except sqlite3.Error as error:
+            # The batch could not be committed (e.g. the lock stayed busy):
+            # nothing in it was written
+            if db.in_transaction:
+                db.execute('ROLLBACK')
+            outcomes = [(future, None, error) for _, _, future in batch if not future.cancelled()]
+        with self._lock:
+            self.stats['jobs'] += len(outcomes)
+            self.stats['failed'] += sum(1 for _, _, error in outcomes if error is not None)
+            self.stats['batches'] += 1
+            self.stats['largest_batch'] = max(self.stats['largest_batch'], len(outcomes))
+            self.stats['commit_ms'] += (time.perf_counter() - started) * 1000
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    # Counters plus the mean batch size, for monitoring
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats, queued=self._queue.qsize() if self._queue else 0)
+        stats['mean_batch'] = round(stats['jobs'] / stats['batches'], 2) if stats['batches'] else 0.0
+        stats['commit_ms'] = round(stats['commit_ms'], 3)
+        return stats
@@ -0,0 +1,21 @@
+# Production entry point for a pre-fork WSGI server, e.g.
+#
+#   ECN_SECRET_KEY=... ECN_DATABASE=/srv/ecn/ecn_coop.db gunicorn -w 4 --preload wsgi:app
+#
+# Run `flask --app ECN_corp_app migrate` before starting the workers, or set
+# ECN_MIGRATE_ON_START=true: with --preload the app (and the migration) is
+# created once in the master and the workers fork from it, each opening its
+# own database connections on first use. Without --preload every worker runs
+# create_app() itself and migrations are serialized on the database lock.
+import os
+
+from ECN_corp_app import create_app, start_arrears_scheduler
+
+if not os.environ.get('ECN_SECRET_KEY'):
+    raise RuntimeError('Set ECN_SECRET_KEY so every worker signs sessions with the same key')
+
+app = create_app()
+
+# With --preload the scheduler thread lives in the master only; without it
+# each worker starts one and all but the first skip the day's run
+start_arrears_scheduler(app)